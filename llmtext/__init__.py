@@ -1,3 +1,38 @@
-from dotenv import load_dotenv
+import importlib
+from typing import Any
 
-load_dotenv(override=True, verbose=True)
+# submodules are imported on first attribute access so `import llmtext` stays cheap
+_SUBMODULES = {
+    "agent",
+    "batch_fns",
+    "cache",
+    "checkpoints",
+    "clients",
+    "completion_fns",
+    "context",
+    "hedging",
+    "llm",
+    "messages_fns",
+    "packing",
+    "prompt_optimizer",
+    "rate_limit",
+    "replay",
+    "results",
+    "router",
+    "single_flight",
+    "telemetry",
+    "texts_fns",
+    "tool_executor",
+    "types",
+    "utils_fns",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_SUBMODULES])
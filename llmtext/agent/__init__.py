@@ -1,76 +1,193 @@
+from __future__ import annotations
+
 import asyncio
-from typing import AsyncGenerator, Type
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, Awaitable, Type, TypeVar
 from uuid import uuid4
 
 from llmtext.types import (
     Checkpoint,
+    Evaluation,
     Event,
     Message,
+    MessageDelta,
     RunnableTool,
+    StepTiming,
     ToolOutput,
     IsFinalResponse,
 )
+from llmtext.checkpoints import CheckpointStore
+from llmtext.context import ContextManager
 from llmtext.llm import LLM
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+from llmtext.telemetry import NOOP_SPAN, NoopSpan, Span, start_span, use_span
+from llmtext.tool_executor import ToolExecutor
 import logging
 
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
 logger = logging.getLogger(__name__)
 
+R = TypeVar("R")
+
+
+async def _atimed(
+    awaitable: Awaitable[R], span: Span | NoopSpan = NOOP_SPAN
+) -> tuple[R, float]:
+    started = time.perf_counter()
+    with span:
+        result = await awaitable
+    return result, time.perf_counter() - started
+
 
 class Agent:
     def __init__(
         self,
-        chat_llm: LLM = LLM(),
-        tool_selector_llm: LLM = LLM(),
-        evaluator_llm: LLM = LLM(),
-        messages: list[ChatCompletionMessageParam] = [],
-        tools: list[Type[RunnableTool]] = [],
+        chat_llm: LLM | None = None,
+        tool_selector_llm: LLM | None = None,
+        evaluator_llm: LLM | None = None,
+        messages: list[ChatCompletionMessageParam] | None = None,
+        tools: list[Type[RunnableTool]] | None = None,
         max_steps: int = 1,
+        stream_tool_calls: bool = False,
+        context_manager: ContextManager | None = None,
+        evaluator_context_manager: ContextManager | None = None,
+        tool_selector_context_manager: ContextManager | None = None,
+        checkpoint_store: CheckpointStore | None = None,
+        snapshot_every: int = 20,
+        tool_executor: ToolExecutor | None = None,
+        coalesce_seconds: float | None = None,
+        coalesce_bytes: int | None = None,
+        compact_events: bool = False,
     ):
-        self.chat_llm = chat_llm
-        self.tool_selector_llm = tool_selector_llm
-        self.evaluator_llm = evaluator_llm
-        self.messages = messages
-        self.tools = tools
+        self.chat_llm = chat_llm or LLM()
+        self.tool_selector_llm = tool_selector_llm or LLM()
+        self.evaluator_llm = evaluator_llm or LLM()
+        self.messages = messages if messages is not None else []
+        self.tools = tools or []
         self.max_steps = max_steps
-
-    async def astream_events(self) -> AsyncGenerator[Event, None]:
+        # start each tool as soon as the selector has streamed it
+        self.stream_tool_calls = stream_tool_calls
+        # token budgets for what each llm is sent, self.messages itself is never trimmed
+        self.context_manager = context_manager
+        self.evaluator_context_manager = evaluator_context_manager or context_manager
+        self.tool_selector_context_manager = (
+            tool_selector_context_manager or context_manager
+        )
+        # positions in self.messages holding joined tool outputs
+        self.tool_output_indices: set[int] = set()
+
+        self.tool_executor = tool_executor or ToolExecutor()
+        # message deltas are merged until either limit is reached
+        self.coalesce_seconds = coalesce_seconds
+        self.coalesce_bytes = coalesce_bytes
+        # yield MessageDelta objects instead of Event dicts for message deltas
+        self.compact_events = compact_events
+        # checkpoints are only kept, and resumable, when a store is given
+        self.checkpoint_store = checkpoint_store
+        self.snapshot_every = snapshot_every
+        self.last_checkpoint_id: str | None = None
+        self._checkpointed = 0
+        self._since_snapshot = 0
+
+    async def astream_events(self) -> AsyncGenerator[Event | MessageDelta, None]:
         logger.info("Agent starting...")
         steps = 0
         while True:
             steps += 1
 
             # checkpoint
-            checkpoint = Event(
-                id=str(uuid4()),
-                step=steps,
-                type="checkpoint",
-                content=Checkpoint(messages=self.messages, type="checkpoint"),
+            checkpoint = await self._acheckpoint()
+            logger.info(
+                f"Checkpoint {checkpoint['id']}: {len(checkpoint['messages'])} messages "
+                f"from {checkpoint['offset']}"
+            )
+            yield Event(
+                id=checkpoint["id"], step=steps, type="checkpoint", content=checkpoint
             )
-            logger.info(f"Checkpoint: {checkpoint}")
-            yield checkpoint
 
             # break conditions
             if steps >= self.max_steps:
                 logger.info("Max steps reached")
                 break
-            elif self._arun_evaluator_llm() is True:
-                logger.info("Final response reached")
-                break
 
-            # extract tools
-            tools_to_call = await self._arun_tool_selector_llm()
+            # evaluation and tool selection run concurrently, each tool starts as
+            # soon as it is selected, and the selection and its tools are dropped
+            # when the evaluator decides the response is final
+            step_started = time.perf_counter()
+            step_span = start_span("agent.step", step=steps)
+            selected: asyncio.Queue[
+                tuple[RunnableTool, asyncio.Future[ToolOutput]] | None
+            ] = asyncio.Queue()
+            evaluator_task = asyncio.ensure_future(
+                _atimed(
+                    self._arun_evaluator_llm(),
+                    start_span("agent.evaluator", parent=step_span),
+                )
+            )
+            selector_task = (
+                asyncio.ensure_future(
+                    _atimed(
+                        self._aselect_tools(selected, step_span),
+                        start_span("agent.tool_selector", parent=step_span),
+                    )
+                )
+                if self.tools
+                else None
+            )
+            tool_tasks: list[asyncio.Future[ToolOutput]] = []
+            try:
+                is_final, evaluator_time = await evaluator_task
 
-            for tool in tools_to_call:
                 yield Event(
                     id=str(uuid4()),
                     step=steps,
-                    type="tool_call",
-                    content=tool.to_tool_call(),
+                    type="evaluation",
+                    content=Evaluation(type="evaluation", is_final=is_final),
                 )
 
-            # call tools
-            tools_output = await self._acall_tools(tool_calls=tools_to_call)
+                if is_final:
+                    logger.info("Final response reached")
+                    yield self._step_timing_event(
+                        step=steps,
+                        evaluator=evaluator_time,
+                        total=time.perf_counter() - step_started,
+                        span=step_span,
+                    )
+                    break
+
+                # report the tools, the ones selected so far are already running
+                selector_time = None
+                if selector_task is not None:
+                    while (item := await selected.get()) is not None:
+                        tool, task = item
+                        tool_tasks.append(task)
+                        yield Event(
+                            id=str(uuid4()),
+                            step=steps,
+                            type="tool_call",
+                            content=tool.to_tool_call(),
+                        )
+                    _, selector_time = await selector_task
+            except BaseException:
+                for task in tool_tasks:
+                    task.cancel()
+                raise
+            finally:
+                if selector_task is not None and not selector_task.done():
+                    selector_task.cancel()
+                # tools started for a dropped selection
+                while not selected.empty():
+                    if (item := selected.get_nowait()) is not None:
+                        item[1].cancel()
+
+            # call tools, only the time left after selection is on the critical path
+            tools_started = time.perf_counter()
+            with start_span("agent.tools", parent=step_span, tools=len(tool_tasks)):
+                tools_output = await self._acollect_tool_outputs(tool_tasks)
+            tools_time = time.perf_counter() - tools_started
 
             for tool_output in tools_output:
                 if isinstance(tool_output, BaseException):
@@ -97,11 +214,17 @@ class Agent:
                 )
 
             # add tools to messages
-            stream = self._astream_chat_llm()
+            chat_started = time.perf_counter()
+            chat_span = start_span("agent.chat", parent=step_span)
+            stream = self._acoalesce(self._astream_chat_llm())
 
             event_id = str(uuid4())
-            final_message_content = ""
             async for chunk in stream:
+                if "ttft" not in chat_span.attributes:
+                    chat_span.set("ttft", chat_span.duration)
+                if self.compact_events:
+                    yield MessageDelta(id=event_id, step=steps, content=chunk)
+                    continue
                 yield Event(
                     id=event_id,
                     step=steps,
@@ -109,24 +232,177 @@ class Agent:
                     content=Message(role="assistant", content=chunk),
                 )
 
+            chat_span.end()
             yield Event(
                 id=event_id,
                 step=steps,
                 type="message",
-                content=Message(role="assistant", content=final_message_content),
+                content=Message(
+                    role="assistant", content=self.messages[-1]["content"]  # type: ignore
+                ),
+            )
+
+            yield self._step_timing_event(
+                step=steps,
+                evaluator=evaluator_time,
+                tool_selector=selector_time,
+                tools=tools_time,
+                chat=time.perf_counter() - chat_started,
+                total=time.perf_counter() - step_started,
+                span=step_span,
             )
 
             # run next step
 
+    def _next_checkpoint(self) -> Checkpoint:
+        # only the messages added since the last checkpoint are recorded, with a
+        # full snapshot every snapshot_every checkpoints to bound restore cost
+        snapshot = (
+            self.last_checkpoint_id is None
+            or self._since_snapshot + 1 >= self.snapshot_every
+            or len(self.messages) < self._checkpointed
+        )
+        offset = 0 if snapshot else self._checkpointed
+        checkpoint = Checkpoint(
+            type="checkpoint",
+            id=str(uuid4()),
+            parent_id=self.last_checkpoint_id,
+            offset=offset,
+            messages=[dict(message) for message in self.messages[offset:]],  # type: ignore
+            tool_output_indices=sorted(
+                index for index in self.tool_output_indices if index >= offset
+            ),
+            snapshot=snapshot,
+        )
+
+        self.last_checkpoint_id = checkpoint["id"]
+        self._checkpointed = len(self.messages)
+        self._since_snapshot = 0 if snapshot else self._since_snapshot + 1
+        return checkpoint
+
+    async def _acheckpoint(self) -> Checkpoint:
+        checkpoint = self._next_checkpoint()
+        if self.checkpoint_store is not None:
+            await self.checkpoint_store.asave(checkpoint)
+        return checkpoint
+
+    def resume(self, checkpoint_id: str) -> None:
+        """Restores messages from checkpoint_id; later checkpoints continue its chain"""
+        if self.checkpoint_store is None:
+            raise ValueError("Agent has no checkpoint_store to resume from")
+        messages, tool_output_indices = self.checkpoint_store.restore(checkpoint_id)
+        self.messages = messages
+        self.tool_output_indices = set(tool_output_indices)
+        self.last_checkpoint_id = checkpoint_id
+        self._checkpointed = len(messages)
+        # how many deltas lead up to checkpoint_id is unknown, so snapshot next
+        self._since_snapshot = self.snapshot_every
+
+    def _step_timing_event(
+        self,
+        step: int,
+        evaluator: float,
+        total: float,
+        tool_selector: float | None = None,
+        tools: float = 0.0,
+        chat: float = 0.0,
+        span: Span | NoopSpan = NOOP_SPAN,
+    ) -> Event:
+        # evaluation and tool selection overlap, only the slower one is on the critical path
+        critical_path = ["evaluator"]
+        if tool_selector is not None and tool_selector > evaluator:
+            critical_path = ["tool_selector"]
+        if tools:
+            critical_path.append("tools")
+        if chat:
+            critical_path.append("chat")
+
+        timing = StepTiming(
+            type="step_timing",
+            evaluator=evaluator,
+            tool_selector=tool_selector,
+            tools=tools,
+            chat=chat,
+            total=total,
+            critical_path=critical_path,
+        )
+        logger.debug(f"Step {step} timing: {timing}")
+        span.set("critical_path", ",".join(critical_path))
+        span.end()
+        return Event(id=str(uuid4()), step=step, type="step_timing", content=timing)
+
+    def _context(
+        self, context_manager: ContextManager | None
+    ) -> list[ChatCompletionMessageParam]:
+        if context_manager is None:
+            return self.messages
+        return context_manager.view(
+            self.messages, tool_outputs=self.tool_output_indices
+        )
+
     async def _astream_chat_llm(self) -> AsyncGenerator[str, None]:
-        stream = self.chat_llm.astream_response_from_messages(self.messages)
+        stream = self.chat_llm.astream_response_from_messages(
+            self._context(self.context_manager)
+        )
 
-        final_message_content = ""
+        chunks: list[str] = []
         async for chunk in stream:
             yield chunk
-            final_message_content += chunk
+            chunks.append(chunk)
 
-        self.messages.append({"role": "assistant", "content": final_message_content})
+        self.messages.append({"role": "assistant", "content": "".join(chunks)})
+
+    async def _acoalesce(
+        self, stream: AsyncGenerator[str, None]
+    ) -> AsyncGenerator[str, None]:
+        if self.coalesce_seconds is None and self.coalesce_bytes is None:
+            async for chunk in stream:
+                yield chunk
+            return
+
+        pending: list[str] = []
+        pending_bytes = 0
+        flushed_at = time.perf_counter()
+        # kept across timeouts, so a flush never cancels the read from the stream
+        next_chunk: asyncio.Future[str] | None = None
+        try:
+            while True:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(stream.__anext__())
+                timeout = None
+                if pending and self.coalesce_seconds is not None:
+                    timeout = max(
+                        0.0, flushed_at + self.coalesce_seconds - time.perf_counter()
+                    )
+                done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+                if done:
+                    try:
+                        chunk = next_chunk.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_chunk = None
+                    pending.append(chunk)
+                    pending_bytes += len(chunk.encode())
+                full = (
+                    self.coalesce_bytes is not None
+                    and pending_bytes >= self.coalesce_bytes
+                )
+                due = (
+                    self.coalesce_seconds is not None
+                    and time.perf_counter() - flushed_at >= self.coalesce_seconds
+                )
+                if pending and (full or due):
+                    yield "".join(pending)
+                    pending.clear()
+                    pending_bytes = 0
+                    flushed_at = time.perf_counter()
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+
+        if pending:
+            yield "".join(pending)
 
     async def _arun_tool_selector_llm(self) -> list[RunnableTool]:
         from llmtext.utils_fns import tools_to_tool_selector
@@ -134,24 +410,68 @@ class Agent:
         tool_selector = tools_to_tool_selector(tools=self.tools)
 
         completion = await self.tool_selector_llm.astructured_extraction_from_messages(
-            messages=self.messages, output_class=tool_selector
+            messages=self._context(self.tool_selector_context_manager),
+            output_class=tool_selector,
         )
 
         return completion.tool_calls
 
+    async def _astream_tool_selector_llm(self) -> AsyncGenerator[RunnableTool, None]:
+        from llmtext.utils_fns import tools_to_tool_call_model
+
+        tool_call_model = tools_to_tool_call_model(tools=self.tools)
+
+        stream = self.tool_selector_llm.astream_iterable_extraction_from_messages(
+            messages=self._context(self.tool_selector_context_manager),
+            output_class=tool_call_model,
+        )
+
+        async for tool_call in stream:
+            yield tool_call.root
+
+    async def _aselect_tools(
+        self,
+        selected: asyncio.Queue[tuple[RunnableTool, asyncio.Future[ToolOutput]] | None],
+        span: Span | NoopSpan,
+    ) -> None:
+        async def arun(tool: RunnableTool) -> ToolOutput:
+            with use_span(span):
+                return await self.tool_executor.arun(tool)
+
+        def start(tool: RunnableTool) -> None:
+            selected.put_nowait((tool, asyncio.ensure_future(arun(tool))))
+
+        try:
+            if self.stream_tool_calls:
+                async for tool in self._astream_tool_selector_llm():
+                    start(tool)
+            else:
+                for tool in await self._arun_tool_selector_llm():
+                    start(tool)
+        finally:
+            selected.put_nowait(None)
+
     async def _arun_evaluator_llm(self) -> bool:
         completion = await self.evaluator_llm.astructured_extraction_from_messages(
-            messages=self.messages, output_class=IsFinalResponse
+            messages=self._context(self.evaluator_context_manager),
+            output_class=IsFinalResponse,
         )
 
         return completion.is_final_response
 
     async def _acall_tools(self, tool_calls: list[RunnableTool]) -> list[ToolOutput]:
-        tasks = []
-
-        for tool in tool_calls:
-            tasks.append(tool.acall_and_return_tool_output())
-
+        tasks = [
+            asyncio.ensure_future(self.tool_executor.arun(tool)) for tool in tool_calls
+        ]
+        return await self._acollect_tool_outputs(tasks)
+
+    async def _acollect_tool_outputs(
+        self, tasks: list[asyncio.Future[ToolOutput]]
+    ) -> list[ToolOutput]:
+        if not tasks:
+            return []
+
+        # outputs keep the order the tools were selected in, not completion order
         tools_output: list[ToolOutput | BaseException] = await asyncio.gather(
             *tasks, return_exceptions=True
         )
@@ -164,10 +484,11 @@ class Agent:
                 continue
             parsed_tool_output.append(tool_output)
 
+        self.tool_output_indices.add(len(self.messages))
         self.messages.append(
             {
                 "role": "assistant",
-                "content": "\n".join([o.output for o in parsed_tool_output]),
+                "content": "\n".join([o["output"] for o in parsed_tool_output]),
             }
         )
 
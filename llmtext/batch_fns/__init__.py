@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import TYPE_CHECKING, Any, Iterable, Type, TypeVar
+
+from pydantic import BaseModel
+import logging
+
+from llmtext.clients import get_client, get_instructor_mode, get_model
+from llmtext.types import Message
+from llmtext.utils_fns import messages_to_openai_messages, to_response_model
+
+if TYPE_CHECKING:
+    import instructor
+    from openai import AsyncOpenAI
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchRequestError(Exception):
+    def __init__(self, custom_id: str, message: str):
+        super().__init__(f"{custom_id}: {message}")
+        self.custom_id = custom_id
+
+
+def requests_to_jsonl(bodies: Iterable[dict[str, Any]]) -> bytes:
+    lines = []
+    for index, body in enumerate(bodies):
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": f"request-{index}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                },
+                ensure_ascii=False,
+            )
+        )
+    return "\n".join(lines).encode()
+
+
+async def asubmit_batch(
+    bodies: list[dict[str, Any]],
+    client: AsyncOpenAI,
+    completion_window: str = "24h",
+    metadata: dict[str, str] | None = None,
+) -> str:
+    batch_file = await client.files.create(
+        file=("batch.jsonl", requests_to_jsonl(bodies)), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=completion_window,  # type: ignore
+        metadata=metadata,
+    )
+    logger.info(f"Submitted batch {batch.id} with {len(bodies)} requests")
+    return batch.id
+
+
+async def await_batch_results(
+    batch_id: str,
+    count: int,
+    client: AsyncOpenAI,
+    poll_interval: float = 30.0,
+) -> list[dict[str, Any] | BaseException]:
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            break
+        logger.debug(f"Batch {batch_id} is {batch.status}")
+        await asyncio.sleep(poll_interval)
+
+    if batch.status != "completed" and not batch.output_file_id:
+        raise BatchRequestError(batch_id, f"batch {batch.status}")
+
+    results: list[dict[str, Any] | BaseException] = [
+        BatchRequestError(f"request-{index}", "missing from batch output")
+        for index in range(count)
+    ]
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            index = int(custom_id.rsplit("-", 1)[1])
+            response = record.get("response") or {}
+
+            if record.get("error") or response.get("status_code", 200) >= 400:
+                error = record.get("error") or response.get("body", {}).get("error")
+                results[index] = BatchRequestError(custom_id, json.dumps(error))
+            else:
+                results[index] = response["body"]
+
+    return results
+
+
+def _raise_or_return(results: list[Any], return_exceptions: bool) -> list[Any]:
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    return results
+
+
+async def abatch_generate_from_openai_messages(
+    messages_list: list[list[ChatCompletionMessageParam]],
+    client: AsyncOpenAI,
+    model: str,
+    poll_interval: float = 30.0,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> list[str | BaseException]:
+    from openai.types.chat import ChatCompletion
+
+    bodies = [
+        {"model": model, "messages": list(messages), **kwargs}
+        for messages in messages_list
+    ]
+    batch_id = await asubmit_batch(bodies=bodies, client=client)
+    results = await await_batch_results(
+        batch_id=batch_id, count=len(bodies), client=client, poll_interval=poll_interval
+    )
+
+    outputs: list[str | BaseException] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            outputs.append(result)
+            continue
+        completion = ChatCompletion.model_validate(result)
+        outputs.append(completion.choices[0].message.content or "")
+
+    return _raise_or_return(outputs, return_exceptions)
+
+
+async def abatch_structured_extraction_from_openai_messages(
+    messages_list: list[list[ChatCompletionMessageParam]],
+    output_class: Type[T],
+    client: AsyncOpenAI,
+    model: str,
+    instructor_mode: instructor.Mode | None = None,
+    poll_interval: float = 30.0,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> list[T | BaseException]:
+    from instructor.process_response import (
+        handle_response_model,
+        process_response_async,
+    )
+    from openai.types.chat import ChatCompletion
+
+    instructor_mode = instructor_mode or get_instructor_mode()
+    response_model = to_response_model(output_class)
+    bodies = []
+    for messages in messages_list:
+        response_model, body = handle_response_model(
+            response_model,
+            mode=instructor_mode,
+            model=model,
+            messages=[dict(message) for message in messages],
+            **kwargs,
+        )
+        bodies.append(body)
+
+    batch_id = await asubmit_batch(bodies=bodies, client=client)
+    results = await await_batch_results(
+        batch_id=batch_id, count=len(bodies), client=client, poll_interval=poll_interval
+    )
+
+    outputs: list[T | BaseException] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            outputs.append(result)
+            continue
+        try:
+            outputs.append(
+                await process_response_async(
+                    ChatCompletion.model_validate(result),
+                    response_model=response_model,
+                    mode=instructor_mode,
+                )
+            )
+        except Exception as e:
+            outputs.append(e)
+
+    return _raise_or_return(outputs, return_exceptions)
+
+
+async def abatch_generate(
+    messages_list: list[list[Message]],
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    poll_interval: float = 30.0,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> list[str | BaseException]:
+    return await abatch_generate_from_openai_messages(
+        messages_list=[
+            messages_to_openai_messages(messages=messages) for messages in messages_list
+        ],
+        client=client or get_client(),
+        model=model or get_model(),
+        poll_interval=poll_interval,
+        return_exceptions=return_exceptions,
+        **kwargs,
+    )
+
+
+async def abatch_structured_extraction(
+    messages_list: list[list[Message]],
+    output_class: Type[T],
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    temperature: float = 0.0,
+    instructor_mode: instructor.Mode | None = None,
+    poll_interval: float = 30.0,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> list[T | BaseException]:
+    return await abatch_structured_extraction_from_openai_messages(
+        messages_list=[
+            messages_to_openai_messages(messages=messages) for messages in messages_list
+        ],
+        output_class=output_class,
+        client=client or get_client(),
+        model=model or get_model(),
+        instructor_mode=instructor_mode,
+        poll_interval=poll_interval,
+        return_exceptions=return_exceptions,
+        temperature=temperature,
+        **kwargs,
+    )
@@ -0,0 +1,429 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Iterable, TypedDict, TypeVar
+
+from pydantic import BaseModel
+
+from llmtext.single_flight import SingleFlight
+from llmtext.types import RunnableTool
+from llmtext.utils_fns import output_class_schema
+
+V = TypeVar("V")
+
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    memory_hits: int
+    disk_hits: int
+    evictions: int
+    entries: int
+
+
+def make_cache_key(
+    model: str,
+    messages: Iterable[Any],
+    kwargs: dict[str, Any] | None = None,
+    output_class: type[BaseModel] | None = None,
+) -> str:
+    payload = {
+        "model": model,
+        "messages": list(messages),
+        "kwargs": {k: v for k, v in (kwargs or {}).items() if k != "stream"},
+        "output_class": output_class_schema(output_class) if output_class else None,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def make_tool_cache_key(tool: RunnableTool) -> str:
+    params = json.dumps(
+        tool.model_dump(mode="json"), sort_keys=True, ensure_ascii=False, default=str
+    )
+    return f"{type(tool).__name__}:{hashlib.sha256(params.encode()).hexdigest()}"
+
+
+class LRUCache(Generic[V]):
+    """In-memory LRU with optional TTL and entry/byte size bounds"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._bytes = 0
+        self._data: OrderedDict[str, tuple[V, float | None, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> V | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._pop(key)
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: V, ttl: float | None = None) -> None:
+        if key in self._data:
+            self._pop(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = len(value) if isinstance(value, (str, bytes)) else 1
+        self._data[key] = (value, expires_at, size)
+        self._bytes += size
+
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._data))
+            self._pop(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        if key in self._data:
+            self._pop(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def _pop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+
+class DiskCache:
+    """Persistent key/value tier backed by sqlite"""
+
+    def __init__(self, path: str, ttl: float | None = None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Two tier response cache: in-memory LRU in front of an optional sqlite file"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        path: str | None = None,
+    ):
+        self.memory: LRUCache[str] = LRUCache(
+            max_entries=max_entries, max_bytes=max_bytes, ttl=ttl
+        )
+        self.disk = DiskCache(path=path, ttl=ttl) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+    async def aget(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> CacheStats:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "evictions": self.memory.evictions,
+            "entries": len(self.memory),
+        }
+
+
+class ToolResultCache:
+    """Memoizes tool outputs by tool class and params, deduplicating calls in flight"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        path: str | None = None,
+    ):
+        self.cache = ResponseCache(
+            max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, path=path
+        )
+        self.single_flight = SingleFlight()
+        self.deduplicated = 0
+
+    async def acall(
+        self, tool: RunnableTool, fn: Callable[[], Awaitable[str]]
+    ) -> tuple[str, bool]:
+        """Returns the output of fn and whether it came from the cache or a shared call"""
+        key = make_tool_cache_key(tool)
+        output = await self.cache.aget(key)
+        if output is not None:
+            return output, True
+
+        async def aload() -> str:
+            output = await fn()
+            await self.cache.aset(key, output)
+            return output
+
+        shared = self.single_flight.in_flight(key)
+        output = await self.single_flight.ado(key, aload)
+        if shared:
+            self.deduplicated += 1
+        return output, shared
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> CacheStats:
+        return self.cache.stats()
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        " " if unicodedata.category(c)[0] in {"P", "S", "Z", "C"} else c for c in text
+    )
+    return " ".join(text.split())
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    if len(text) <= shingle_size:
+        shingles = [text]
+    else:
+        shingles = [
+            text[i : i + shingle_size] for i in range(len(text) - shingle_size + 1)
+        ]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(
+            hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big"
+        )
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class SimilarityCache:
+    """Near-duplicate lookup over the last message, everything else must match exactly"""
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 10_000,
+        ttl: float | None = None,
+        shingle_size: int = 3,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shingle_size = shingle_size
+        self.max_distance = int((1 - threshold) * 64)
+        # pigeonhole: within max_distance bits at least one band matches exactly
+        self.bands = self.max_distance + 1
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._next_id = 0
+        self._entries: OrderedDict[int, tuple[str, int, str, float | None]] = (
+            OrderedDict()
+        )
+        self._buckets: dict[tuple[str, int, int], set[int]] = {}
+
+    def _split(
+        self,
+        model: str,
+        messages: list[Any],
+        kwargs: dict[str, Any] | None,
+        output_class: type[BaseModel] | None,
+    ) -> tuple[str, int] | None:
+        if not messages or not isinstance(messages[-1].get("content"), str):
+            return None
+
+        last = messages[-1]
+        context = make_cache_key(
+            model=model,
+            messages=[*messages[:-1], {"role": last["role"]}],
+            kwargs=kwargs,
+            output_class=output_class,
+        )
+        text = normalize_text(last["content"])
+        return context, simhash(text, shingle_size=self.shingle_size)
+
+    def _band_keys(self, context: str, fingerprint: int) -> list[tuple[str, int, int]]:
+        width = -(-64 // self.bands)
+        mask = (1 << width) - 1
+        return [
+            (context, band, fingerprint >> (band * width) & mask)
+            for band in range(self.bands)
+        ]
+
+    def get(
+        self,
+        model: str,
+        messages: list[Any],
+        kwargs: dict[str, Any] | None = None,
+        output_class: type[BaseModel] | None = None,
+    ) -> str | None:
+        split = self._split(model, messages, kwargs, output_class)
+        if split is None:
+            return None
+
+        context, fingerprint = split
+        best_id, best_distance = None, self.max_distance + 1
+        for band_key in self._band_keys(context, fingerprint):
+            for entry_id in self._buckets.get(band_key, ()):
+                _, other, _, expires_at = self._entries[entry_id]
+                if expires_at is not None and expires_at <= time.monotonic():
+                    continue
+                distance = hamming_distance(fingerprint, other)
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id][2]
+
+    def set(
+        self,
+        model: str,
+        messages: list[Any],
+        value: str,
+        kwargs: dict[str, Any] | None = None,
+        output_class: type[BaseModel] | None = None,
+    ) -> None:
+        split = self._split(model, messages, kwargs, output_class)
+        if split is None:
+            return
+
+        context, fingerprint = split
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (context, fingerprint, value, expires_at)
+        for band_key in self._band_keys(context, fingerprint):
+            self._buckets.setdefault(band_key, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _evict(self, entry_id: int) -> None:
+        context, fingerprint, _, _ = self._entries.pop(entry_id)
+        for band_key in self._band_keys(context, fingerprint):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def stats(self) -> CacheStats:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.hits,
+            "disk_hits": 0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Any
+
+from llmtext.types import Checkpoint
+
+
+class CheckpointStore(ABC):
+    """Keeps delta checkpoints and rebuilds agent state from them"""
+
+    @abstractmethod
+    def save(self, checkpoint: Checkpoint) -> None:
+        pass
+
+    @abstractmethod
+    def load(self, checkpoint_id: str) -> Checkpoint:
+        pass
+
+    async def asave(self, checkpoint: Checkpoint) -> None:
+        # stores doing blocking io are kept off the event loop
+        await asyncio.to_thread(self.save, checkpoint)
+
+    def restore(self, checkpoint_id: str) -> tuple[list[Any], list[int]]:
+        """Returns the messages and tool output positions as of checkpoint_id"""
+        chain: list[Checkpoint] = []
+        current: str | None = checkpoint_id
+        while current is not None:
+            checkpoint = self.load(current)
+            chain.append(checkpoint)
+            if checkpoint["snapshot"]:
+                break
+            current = checkpoint["parent_id"]
+
+        messages: list[Any] = []
+        tool_output_indices: list[int] = []
+        for checkpoint in reversed(chain):
+            del messages[checkpoint["offset"] :]
+            messages.extend(dict(message) for message in checkpoint["messages"])
+            tool_output_indices = [
+                index for index in tool_output_indices if index < checkpoint["offset"]
+            ]
+            tool_output_indices.extend(checkpoint["tool_output_indices"])
+        return messages, tool_output_indices
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    def __init__(self):
+        self.checkpoints: dict[str, Checkpoint] = {}
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        self.checkpoints[checkpoint["id"]] = checkpoint
+
+    async def asave(self, checkpoint: Checkpoint) -> None:
+        self.save(checkpoint)
+
+    def load(self, checkpoint_id: str) -> Checkpoint:
+        return self.checkpoints[checkpoint_id]
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints "
+                "(id TEXT PRIMARY KEY, parent_id TEXT, data TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (id, parent_id, data) VALUES (?, ?, ?)",
+                (
+                    checkpoint["id"],
+                    checkpoint["parent_id"],
+                    json.dumps(checkpoint, ensure_ascii=False),
+                ),
+            )
+            self._conn.commit()
+
+    def load(self, checkpoint_id: str) -> Checkpoint:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM checkpoints WHERE id = ?", (checkpoint_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(checkpoint_id)
+        return json.loads(row[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileCheckpointStore(CheckpointStore):
+    """Append-only JSON lines file with an in-memory offset index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offsets: dict[str, int] = {}
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        self._offsets[json.loads(line)["id"]] = offset
+                    offset += len(line)
+
+        self._file = open(path, "ab")
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        line = json.dumps(checkpoint, ensure_ascii=False).encode() + b"\n"
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._offsets[checkpoint["id"]] = offset
+
+    def load(self, checkpoint_id: str) -> Checkpoint:
+        offset = self._offsets[checkpoint_id]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
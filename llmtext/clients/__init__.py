@@ -0,0 +1,189 @@
+import asyncio
+import os
+from typing import TYPE_CHECKING, TypedDict
+import logging
+
+if TYPE_CHECKING:
+    import httpx
+    import instructor
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class PoolConfig(TypedDict):
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    http2: bool
+    connect_timeout: float
+    timeout: float
+
+
+_env_loaded = False
+_pool_config = PoolConfig(
+    max_connections=1000,
+    max_keepalive_connections=100,
+    keepalive_expiry=30.0,
+    http2=False,
+    connect_timeout=5.0,
+    timeout=600.0,
+)
+_transport: "httpx.AsyncBaseTransport | None" = None
+_clients: dict[tuple[str | None, str | None], "AsyncOpenAI"] = {}
+_structured_clients: dict[
+    tuple[int, "instructor.Mode"], tuple["AsyncOpenAI", "instructor.AsyncInstructor"]
+] = {}
+
+
+def load_env() -> None:
+    global _env_loaded
+    if _env_loaded:
+        return
+
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True, verbose=True)
+    _env_loaded = True
+
+
+def get_model() -> str:
+    load_env()
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+
+def get_instructor_mode() -> "instructor.Mode":
+    import instructor
+
+    return instructor.Mode.MD_JSON
+
+
+def configure_pool(
+    max_connections: int | None = None,
+    max_keepalive_connections: int | None = None,
+    keepalive_expiry: float | None = None,
+    http2: bool | None = None,
+    connect_timeout: float | None = None,
+    timeout: float | None = None,
+) -> PoolConfig:
+    # only clients created after this call pick up the new settings
+    updates = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+        "http2": http2,
+        "connect_timeout": connect_timeout,
+        "timeout": timeout,
+    }
+    for key, value in updates.items():
+        if value is not None:
+            _pool_config[key] = value  # type: ignore
+    return PoolConfig(**_pool_config)
+
+
+def configure_transport(transport: "httpx.AsyncBaseTransport | None") -> None:
+    """Sends requests of clients created after this call through transport"""
+    global _transport
+    _transport = transport
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=_pool_config["max_connections"],
+        max_keepalive_connections=_pool_config["max_keepalive_connections"],
+        keepalive_expiry=_pool_config["keepalive_expiry"],
+    )
+
+
+def build_transport() -> "httpx.AsyncHTTPTransport":
+    """A network transport with the pool settings, for wrapping transports to send to"""
+    import httpx
+
+    return httpx.AsyncHTTPTransport(limits=_limits(), http2=_pool_config["http2"])
+
+
+def _build_http_client(
+    transport: "httpx.AsyncBaseTransport | None" = None,
+) -> "httpx.AsyncClient":
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=_limits(),
+        timeout=httpx.Timeout(
+            _pool_config["timeout"], connect=_pool_config["connect_timeout"]
+        ),
+        http2=_pool_config["http2"],
+        follow_redirects=True,
+        # limits and http2 above only apply when httpx builds the transport itself
+        transport=transport or _transport,
+    )
+
+
+def get_client(
+    base_url: str | None = None, api_key: str | None = None
+) -> "AsyncOpenAI":
+    """Returns the process-wide client for (base_url, api_key), creating it once"""
+    load_env()
+    base_url = (
+        base_url or os.getenv("OPENAI_BASE_URL") or os.getenv("OPENAI_API_BASE_URL")
+    )
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        from openai import AsyncOpenAI
+
+        client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url, http_client=_build_http_client()
+        )
+        _clients[key] = client
+    return client
+
+
+def get_structured_client(
+    client: "AsyncOpenAI", mode: "instructor.Mode | None" = None
+) -> "instructor.AsyncInstructor":
+    """Returns the instructor client wrapping client in mode, creating it once"""
+    import instructor
+
+    mode = mode or get_instructor_mode()
+    key = (id(client), mode)
+    entry = _structured_clients.get(key)
+    # the entry keeps the client alive, so its id cannot be reused meanwhile
+    if entry is None:
+        if len(_structured_clients) >= 256:
+            _structured_clients.clear()
+        entry = (client, instructor.from_openai(client, mode=mode))
+        _structured_clients[key] = entry
+    return entry[1]
+
+
+async def warmup(client: "AsyncOpenAI | None" = None, connections: int = 1) -> int:
+    """Opens connections ahead of the first request, returns how many succeeded"""
+    client = client or get_client()
+    url = str(client.base_url).rstrip("/") + "/models"
+    http_client: httpx.AsyncClient = client._client
+
+    async def aopen() -> bool:
+        try:
+            # the status does not matter, the connection is kept alive either way
+            await http_client.head(url, headers=client.auth_headers)
+        except Exception as e:
+            logger.warning(f"Warmup request to {url} failed: {e}")
+            return False
+        return True
+
+    # concurrent requests force the pool to open separate connections
+    results = await asyncio.gather(*[aopen() for _ in range(connections)])
+    return sum(results)
+
+
+async def aclose_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    _structured_clients.clear()
+    for client in clients:
+        await client.close()
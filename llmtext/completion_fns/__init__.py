@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Type,
+    TypeVar,
+)
+
+from pydantic import BaseModel, ValidationError
+
+from llmtext.cache import ResponseCache, SimilarityCache, make_cache_key
+from llmtext.clients import get_structured_client
+from llmtext.rate_limit import (
+    Priority,
+    RateLimiter,
+    estimate_tokens,
+    find_rate_limit_error,
+)
+from llmtext.single_flight import SingleFlight
+from llmtext.telemetry import current_span, get_telemetry, traced
+from llmtext.utils_fns import (
+    to_iterable_response_model,
+    to_partial_response_model,
+    to_response_model,
+)
+
+if TYPE_CHECKING:
+    import instructor
+    from openai import AsyncOpenAI
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+T = TypeVar("T", bound=BaseModel)
+R = TypeVar("R")
+
+
+def _copy_messages(
+    messages: Iterable[ChatCompletionMessageParam],
+) -> list[ChatCompletionMessageParam]:
+    # instructor appends to and edits the messages it is given
+    return [dict(message) for message in messages]  # type: ignore
+
+
+async def _arun_limited(
+    fn: Callable[[], Awaitable[R]],
+    messages: list[ChatCompletionMessageParam],
+    kwargs: dict[str, Any],
+    rate_limiter: RateLimiter | None,
+    priority: int,
+) -> R:
+    if rate_limiter is None:
+        return await fn()
+
+    tokens = estimate_tokens(messages, max_tokens=kwargs.get("max_tokens"))
+    return await rate_limiter.arun(fn, tokens=tokens, priority=priority)
+
+
+def _structured_kwargs(
+    kwargs: dict[str, Any], rate_limiter: RateLimiter | None
+) -> dict[str, Any]:
+    max_retries = kwargs.get("max_retries", 3)
+    if not isinstance(max_retries, int) or (
+        rate_limiter is None and not get_telemetry().enabled
+    ):
+        return kwargs
+
+    from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt
+
+    retrying: dict[str, Any] = {"stop": stop_after_attempt(max_retries)}
+    if rate_limiter is not None:
+        # leave 429s to the rate limiter instead of instructor's immediate retries
+        retrying["retry"] = retry_if_exception(
+            lambda e: find_rate_limit_error(e) is None
+        )
+    # an AsyncRetrying of our own also tells telemetry how many attempts were made
+    return {**kwargs, "max_retries": AsyncRetrying(**retrying)}
+
+
+def _record_usage(usage: Any) -> None:
+    if usage is None:
+        return
+
+    span = current_span()
+    span.set("prompt_tokens", usage.prompt_tokens)
+    span.set("completion_tokens", usage.completion_tokens)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None)
+    if cached_tokens is not None:
+        span.set("cached_tokens", cached_tokens)
+
+
+def _record_structured(completion: Any, structured_kwargs: dict[str, Any]) -> None:
+    _record_usage(getattr(getattr(completion, "_raw_response", None), "usage", None))
+    statistics = getattr(structured_kwargs.get("max_retries"), "statistics", None)
+    if statistics and "attempt_number" in statistics:
+        current_span().set("retries", statistics["attempt_number"] - 1)
+
+
+@traced("llm.generate")
+async def agenerate(
+    messages: Iterable[ChatCompletionMessageParam],
+    client: AsyncOpenAI,
+    model: str,
+    cache: ResponseCache | None = None,
+    similarity_cache: SimilarityCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
+    **kwargs,
+) -> str:
+    messages = _copy_messages(messages)
+
+    key = None
+    if cache is not None or single_flight is not None:
+        key = make_cache_key(model=model, messages=messages, kwargs=kwargs)
+    if cache is not None and key is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            current_span().set("cache_hit", True)
+            return cached
+
+    if similarity_cache is not None:
+        similar = similarity_cache.get(model=model, messages=messages, kwargs=kwargs)
+        if similar is not None:
+            current_span().set("cache_hit", True)
+            return similar
+
+    async def aupstream() -> str:
+        response = await _arun_limited(
+            lambda: client.chat.completions.create(
+                messages=messages,
+                model=model,
+                **kwargs,
+            ),
+            messages=messages,
+            kwargs=kwargs,
+            rate_limiter=rate_limiter,
+            priority=priority,
+        )
+        _record_usage(response.usage)
+        return response.choices[0].message.content or ""
+
+    if single_flight is not None and key is not None:
+        content = await single_flight.ado(f"generate:{key}", aupstream)
+    else:
+        content = await aupstream()
+
+    if cache is not None and key is not None:
+        await cache.aset(key, content)
+    if similarity_cache is not None:
+        similarity_cache.set(
+            model=model, messages=messages, value=content, kwargs=kwargs
+        )
+
+    return content
+
+
+@traced("llm.stream")
+async def astream_generate(
+    messages: Iterable[ChatCompletionMessageParam],
+    client: AsyncOpenAI,
+    model: str,
+    cache: ResponseCache | None = None,
+    similarity_cache: SimilarityCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
+    **kwargs,
+) -> AsyncGenerator[str, None]:
+    messages = _copy_messages(messages)
+
+    key = None
+    if cache is not None or single_flight is not None:
+        key = make_cache_key(model=model, messages=messages, kwargs=kwargs)
+    if cache is not None and key is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            current_span().set("cache_hit", True)
+            yield cached
+            return
+
+    if similarity_cache is not None:
+        similar = similarity_cache.get(model=model, messages=messages, kwargs=kwargs)
+        if similar is not None:
+            current_span().set("cache_hit", True)
+            yield similar
+            return
+
+    async def aupstream() -> AsyncGenerator[str, None]:
+        stream = await _arun_limited(
+            lambda: client.chat.completions.create(
+                messages=messages,
+                model=model,
+                stream=True,
+                **kwargs,
+            ),
+            messages=messages,
+            kwargs=kwargs,
+            rate_limiter=rate_limiter,
+            priority=priority,
+        )
+        usage = None
+        deltas = 0
+        async for chunk in stream:
+            # only sent when the caller asks for stream_options={"include_usage": True}
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                deltas += 1
+                yield chunk.choices[0].delta.content
+
+        if usage is not None:
+            _record_usage(usage)
+        else:
+            # one content delta is about one token
+            current_span().set("completion_tokens", deltas)
+
+    if single_flight is not None and key is not None:
+        stream = single_flight.astream(f"stream:{key}", aupstream)
+    else:
+        stream = aupstream()
+
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        yield chunk
+
+    if cache is not None and key is not None:
+        await cache.aset(key, "".join(chunks))
+    if similarity_cache is not None:
+        similarity_cache.set(
+            model=model, messages=messages, value="".join(chunks), kwargs=kwargs
+        )
+
+
+@traced("llm.structured")
+async def astructured_extraction(
+    messages: Iterable[ChatCompletionMessageParam],
+    output_class: Type[T],
+    client: AsyncOpenAI,
+    model: str,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    similarity_cache: SimilarityCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
+    **kwargs,
+) -> T:
+    messages = _copy_messages(messages)
+
+    key = None
+    if cache is not None or single_flight is not None:
+        key = make_cache_key(
+            model=model, messages=messages, kwargs=kwargs, output_class=output_class
+        )
+    if cache is not None and key is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            try:
+                completion = output_class.model_validate_json(cached)
+                current_span().set("cache_hit", True)
+                return completion
+            except ValidationError:
+                pass
+
+    if similarity_cache is not None:
+        similar = similarity_cache.get(
+            model=model, messages=messages, kwargs=kwargs, output_class=output_class
+        )
+        if similar is not None:
+            try:
+                completion = output_class.model_validate_json(similar)
+                current_span().set("cache_hit", True)
+                return completion
+            except ValidationError:
+                pass
+
+    structured_client = get_structured_client(client, mode=instructor_mode)
+    response_model = to_response_model(output_class)
+    structured_kwargs = _structured_kwargs(kwargs, rate_limiter)
+
+    async def aupstream() -> T:
+        completion = await _arun_limited(
+            lambda: structured_client.chat.completions.create(
+                messages=_copy_messages(messages),
+                model=model,
+                response_model=response_model,
+                **structured_kwargs,
+            ),
+            messages=messages,
+            kwargs=kwargs,
+            rate_limiter=rate_limiter,
+            priority=priority,
+        )
+        _record_structured(completion, structured_kwargs)
+        return completion
+
+    if single_flight is not None and key is not None:
+        shared = await single_flight.ado(f"structured:{key}", aupstream)
+        # every caller gets its own instance to mutate
+        completion = shared.model_copy(deep=True)
+    else:
+        completion = await aupstream()
+
+    if cache is not None and key is not None:
+        await cache.aset(key, completion.model_dump_json())
+    if similarity_cache is not None:
+        similarity_cache.set(
+            model=model,
+            messages=messages,
+            value=completion.model_dump_json(),
+            kwargs=kwargs,
+            output_class=output_class,
+        )
+
+    return completion
+
+
+@traced("llm.structured_stream")
+async def astream_structured_extraction(
+    messages: Iterable[ChatCompletionMessageParam],
+    output_class: Type[T],
+    client: AsyncOpenAI,
+    model: str,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
+    **kwargs,
+) -> AsyncGenerator[T, None]:
+    messages = _copy_messages(messages)
+
+    key = None
+    if cache is not None or single_flight is not None:
+        key = make_cache_key(
+            model=model, messages=messages, kwargs=kwargs, output_class=output_class
+        )
+    if cache is not None and key is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            try:
+                completion = output_class.model_validate_json(cached)
+            except ValidationError:
+                pass
+            else:
+                current_span().set("cache_hit", True)
+                yield completion
+                return
+
+    structured_client = get_structured_client(client, mode=instructor_mode)
+    # same as create_partial, but without rebuilding the Partial model every call
+    response_model = to_partial_response_model(output_class)
+
+    async def aopen_stream():
+        stream = await structured_client.chat.completions.create(
+            model=model,
+            response_model=response_model,
+            messages=_copy_messages(messages),
+            stream=True,
+            **_structured_kwargs(kwargs, rate_limiter),
+        )
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+
+    async def aupstream() -> AsyncGenerator[T, None]:
+        stream, first = await _arun_limited(
+            aopen_stream,
+            messages=messages,
+            kwargs=kwargs,
+            rate_limiter=rate_limiter,
+            priority=priority,
+        )
+        if first is None:
+            return
+
+        yield first
+        async for partial in stream:
+            yield partial
+
+    if single_flight is not None and key is not None:
+        stream = single_flight.astream(f"structured_stream:{key}", aupstream)
+    else:
+        stream = aupstream()
+
+    last = None
+    async for partial in stream:
+        last = partial
+        yield partial
+
+    if cache is not None and key is not None and last is not None:
+        try:
+            final = output_class.model_validate(last.model_dump())
+        except ValidationError:
+            return
+        await cache.aset(key, final.model_dump_json())
+
+
+@traced("llm.iterable")
+async def astream_iterable_extraction(
+    messages: Iterable[ChatCompletionMessageParam],
+    output_class: Type[T],
+    client: AsyncOpenAI,
+    model: str,
+    instructor_mode: instructor.Mode | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    **kwargs,
+) -> AsyncGenerator[T, None]:
+    """Yields each output_class object of a streamed list as soon as it is complete"""
+    messages = _copy_messages(messages)
+    structured_client = get_structured_client(client, mode=instructor_mode)
+    response_model = to_iterable_response_model(output_class)
+
+    async def aopen_stream() -> AsyncGenerator[T, None]:
+        return await structured_client.chat.completions.create(
+            model=model,
+            response_model=response_model,
+            messages=_copy_messages(messages),
+            stream=True,
+            **_structured_kwargs(kwargs, rate_limiter),
+        )
+
+    stream = await _arun_limited(
+        aopen_stream,
+        messages=messages,
+        kwargs=kwargs,
+        rate_limiter=rate_limiter,
+        priority=priority,
+    )
+    async for item in stream:
+        yield item
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import asyncio
+from typing import TYPE_CHECKING, Any, Collection, Sequence
+import logging
+
+from llmtext.rate_limit import estimate_message_tokens
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+    from llmtext.llm import LLM
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Summarize the conversation below so it can replace the original messages.
+Keep every fact, decision, open question and tool result that later turns may need.
+If a previous summary is given, merge the new messages into it.
+Return only the summary."""
+
+
+class ContextView:
+    """Messages to send for one call, with their token counts and source positions"""
+
+    def __init__(
+        self,
+        history: Sequence[ChatCompletionMessageParam],
+        tokens: list[int],
+        tool_outputs: Collection[int] = (),
+    ):
+        self.history = history
+        self.messages = list(history)
+        self.tokens = tokens
+        # position of each message in the history, -1 for synthetic messages
+        self.indices = list(range(len(history)))
+        self.tool_outputs = tool_outputs
+
+    @property
+    def total_tokens(self) -> int:
+        return 3 + sum(self.tokens)
+
+    def replace(self, position: int, message: ChatCompletionMessageParam) -> None:
+        self.messages[position] = message
+        self.tokens[position] = estimate_message_tokens(message)
+
+    def remove(self, position: int) -> None:
+        del self.messages[position]
+        del self.tokens[position]
+        del self.indices[position]
+
+
+class ContextStrategy(ABC):
+    """Shrinks a context view towards a token budget"""
+
+    @abstractmethod
+    def apply(self, view: ContextView, max_tokens: int) -> None:
+        pass
+
+
+class TruncateToolOutputs(ContextStrategy):
+    """Cuts older tool outputs down to max_tokens_per_output, oldest first"""
+
+    def __init__(self, max_tokens_per_output: int = 256, keep_last: int = 1):
+        self.max_tokens_per_output = max_tokens_per_output
+        self.keep_last = keep_last
+
+    def apply(self, view: ContextView, max_tokens: int) -> None:
+        positions = [
+            position
+            for position, index in enumerate(view.indices)
+            if index in view.tool_outputs
+        ]
+        if self.keep_last:
+            positions = positions[: -self.keep_last]
+
+        for position in positions:
+            if view.total_tokens <= max_tokens:
+                return
+            if view.tokens[position] <= self.max_tokens_per_output:
+                continue
+            message = view.messages[position]
+            # ~4 characters per token, see estimate_text_tokens
+            content = str(message.get("content") or "")
+            kept = content[: self.max_tokens_per_output * 4]
+            view.replace(
+                position,
+                {**message, "content": f"{kept}\n...[truncated]"},  # type: ignore
+            )
+
+
+class SlidingWindow(ContextStrategy):
+    """Drops the oldest messages after the first keep_first ones"""
+
+    def __init__(self, keep_first: int = 1, keep_last: int = 1):
+        self.keep_first = keep_first
+        self.keep_last = keep_last
+
+    def apply(self, view: ContextView, max_tokens: int) -> None:
+        while (
+            view.total_tokens > max_tokens
+            and len(view.messages) > self.keep_first + self.keep_last
+        ):
+            view.remove(self.keep_first)
+
+
+class RollingSummary(ContextStrategy):
+    """Replaces older messages with a summary that is refreshed in the background"""
+
+    def __init__(
+        self,
+        llm: LLM,
+        keep_first: int = 1,
+        keep_last: int = 4,
+        prompt: str = SUMMARY_PROMPT,
+    ):
+        self.llm = llm
+        self.keep_first = keep_first
+        self.keep_last = keep_last
+        self.prompt = prompt
+
+        self.summary: str | None = None
+        # history positions [keep_first, covered) are folded into the summary
+        self.covered = keep_first
+        self.summaries = 0
+        self._task: asyncio.Task | None = None
+
+    def apply(self, view: ContextView, max_tokens: int) -> None:
+        if self.summary is not None:
+            summarized = [
+                position
+                for position, index in enumerate(view.indices)
+                if self.keep_first <= index < self.covered
+            ]
+            if summarized:
+                for position in reversed(summarized[1:]):
+                    view.remove(position)
+                view.replace(
+                    summarized[0],
+                    {
+                        "role": "system",
+                        "content": f"Summary of the earlier conversation:\n{self.summary}",
+                    },
+                )
+                view.indices[summarized[0]] = -1
+
+        # the current call goes out with the summary as it is now, the next
+        # summary is built while the agent keeps working
+        if view.total_tokens > max_tokens:
+            self._schedule(view.history)
+
+    def _schedule(self, history: Sequence[ChatCompletionMessageParam]) -> None:
+        upto = len(history) - self.keep_last
+        if upto <= self.covered:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.ensure_future(self._asummarize(list(history), upto))
+
+    async def _asummarize(
+        self, history: list[ChatCompletionMessageParam], upto: int
+    ) -> None:
+        transcript = "\n\n".join(
+            f"{message['role']}: {message.get('content') or ''}"
+            for message in history[self.covered : upto]
+        )
+        if self.summary:
+            transcript = (
+                f"Previous summary:\n{self.summary}\n\nNew messages:\n{transcript}"
+            )
+
+        try:
+            summary = await self.llm.agenerate_response_from_messages(
+                [
+                    {"role": "system", "content": self.prompt},
+                    {"role": "user", "content": transcript},
+                ]
+            )
+        except Exception as e:
+            logger.warning(f"Context summarization failed: {e}")
+            return
+
+        self.summary = summary
+        self.covered = upto
+        self.summaries += 1
+
+    async def await_summary(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+
+class ContextManager:
+    """Builds token-budgeted views of a message history without mutating it"""
+
+    def __init__(
+        self,
+        max_tokens: int,
+        strategies: list[ContextStrategy] | None = None,
+    ):
+        self.max_tokens = max_tokens
+        self.strategies = (
+            strategies
+            if strategies is not None
+            else [TruncateToolOutputs(), SlidingWindow()]
+        )
+        self.compactions = 0
+        # token counts of the history seen so far, recounted only when it changes
+        self._counted: list[tuple[Any, int]] = []
+
+    def count_tokens(self, messages: Sequence[ChatCompletionMessageParam]) -> list[int]:
+        counted = self._counted
+        for position, message in enumerate(messages):
+            if position < len(counted) and counted[position][0] is message:
+                continue
+            del counted[position:]
+            counted.append((message, estimate_message_tokens(message)))
+        del counted[len(messages) :]
+        return [tokens for _, tokens in counted]
+
+    def view(
+        self,
+        messages: Sequence[ChatCompletionMessageParam],
+        tool_outputs: Collection[int] = (),
+    ) -> list[ChatCompletionMessageParam]:
+        tokens = self.count_tokens(messages)
+        context = ContextView(
+            history=messages, tokens=tokens, tool_outputs=tool_outputs
+        )
+        if context.total_tokens <= self.max_tokens:
+            return context.messages
+
+        self.compactions += 1
+        for strategy in self.strategies:
+            strategy.apply(context, self.max_tokens)
+            if context.total_tokens <= self.max_tokens:
+                break
+
+        logger.debug(
+            f"Compacted context from {3 + sum(tokens)} to {context.total_tokens} tokens"
+        )
+        return context.messages
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from typing import TypedDict
+import logging
+
+import httpx
+
+from llmtext.router import (
+    CLAIMED_ENDPOINTS,
+    RETRYABLE_STATUS,
+    _aprefetch,
+    _is_stream,
+    _PrefetchedStream,
+)
+from llmtext.telemetry import Histogram, current_span, log_buckets
+
+logger = logging.getLogger(__name__)
+
+# requests that are safe to send twice, everything else goes straight through
+HEDGED_PATHS = ("/chat/completions", "/completions", "/embeddings")
+
+
+class HedgeStats(TypedDict):
+    requests: int
+    hedged: int
+    hedge_rate: float
+    primary_wins: int
+    hedge_wins: int
+    capped: int
+    delay: float
+
+
+class HedgingTransport(httpx.AsyncBaseTransport):
+    """Sends a duplicate of a slow request and returns whichever answers first"""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        percentile: float = 0.95,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        paths: tuple[str, ...] = HEDGED_PATHS,
+    ):
+        self._transport = transport
+        # hedge once a request is slower than this share of past responses
+        self.percentile = percentile
+        # delay used until min_samples latencies were observed
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        # duplicates sent never exceed this fraction of the requests
+        self.max_hedge_ratio = max_hedge_ratio
+        self.paths = paths
+        # seconds to the response headers, or to the first chunk of a stream
+        self.latencies = Histogram(log_buckets(1e-3, 1e3, per_decade=20))
+
+        self.requests = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.hedge_wins = 0
+        self.capped = 0
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is None:
+            from llmtext.clients import build_transport
+
+            self._transport = build_transport()
+        return self._transport
+
+    @property
+    def delay(self) -> float:
+        if self.latencies.count < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    async def _aattempt(
+        self, request: httpx.Request, stream: bool
+    ) -> tuple[httpx.Response, float]:
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        if stream and response.status_code < 400:
+            first, rest = await _aprefetch(response)
+            response = httpx.Response(
+                status_code=response.status_code,
+                headers=response.headers,
+                stream=_PrefetchedStream(first, rest, response.stream),  # type: ignore
+                extensions=response.extensions,
+            )
+        return response, time.perf_counter() - started
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith(self.paths):
+            return await self.transport.handle_async_request(request)
+
+        await request.aread()
+        stream = _is_stream(request)
+        # behind a router, the hedge goes to a different endpoint from the primary
+        request.extensions[CLAIMED_ENDPOINTS] = set()
+        self.requests += 1
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self._aattempt(request, stream))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay)
+            if not done and self.hedged >= self.max_hedge_ratio * self.requests:
+                self.capped += 1
+            elif not done:
+                return await self._ahedge(request, stream, primary, started)
+            response, latency = await primary
+        finally:
+            if not primary.done():
+                primary.cancel()
+        self.latencies.record(latency)
+        return response
+
+    async def _ahedge(
+        self,
+        request: httpx.Request,
+        stream: bool,
+        primary: asyncio.Future,
+        started: float,
+    ) -> httpx.Response:
+        self.hedged += 1
+        current_span().set("hedged", True)
+        hedge = asyncio.ensure_future(self._aattempt(request, stream))
+
+        pending = {primary, hedge}
+        winner = None
+        # failed statuses, returned only when no attempt succeeds
+        fallbacks: list[httpx.Response] = []
+        error: BaseException | None = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    response, _ = task.result()
+                    if winner is None and response.status_code not in RETRYABLE_STATUS:
+                        # timed from the primary's start, the hedge's own latency
+                        # would hide the slow primaries that set the tail
+                        winner = (task, response, time.perf_counter() - started)
+                    else:
+                        fallbacks.append(response)
+        finally:
+            # the loser is cancelled, which closes its connection
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if winner is None:
+            if not fallbacks:
+                assert error is not None
+                raise error
+            winner = (None, fallbacks.pop(0), None)
+        for response in fallbacks:
+            await response.aclose()
+
+        task, response, latency = winner
+        if task is hedge:
+            self.hedge_wins += 1
+            current_span().set("hedge_won", True)
+        elif task is primary:
+            self.primary_wins += 1
+        if latency is not None:
+            self.latencies.record(latency)
+        return response
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedged / self.requests if self.requests else 0.0
+
+    def stats(self) -> HedgeStats:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedge_rate,
+            "primary_wins": self.primary_wins,
+            "hedge_wins": self.hedge_wins,
+            "capped": self.capped,
+            "delay": self.delay,
+        }
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
@@ -1,11 +1,27 @@
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from typing import AsyncGenerator, Iterable, Type
-import os
-from openai import AsyncOpenAI
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, AsyncGenerator, Iterable, Type
 from typing import TypeVar
-import instructor
 from pydantic import BaseModel
 
+from llmtext import batch_fns, completion_fns
+from llmtext.cache import ResponseCache, SimilarityCache
+from llmtext.clients import (
+    get_client,
+    get_instructor_mode,
+    get_model,
+    get_structured_client,
+)
+from llmtext.rate_limit import Priority, RateLimiter
+from llmtext.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    import instructor
+    from openai import AsyncOpenAI
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -13,123 +29,257 @@ T = TypeVar("T", bound=BaseModel)
 class LLM:
     def __init__(
         self,
-        client: AsyncOpenAI = AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL")
-        ),
-        model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-        instructor_mode: instructor.Mode = instructor.Mode.MD_JSON,
+        client: AsyncOpenAI | None = None,
+        model: str | None = None,
+        instructor_mode: instructor.Mode | None = None,
+        cache: ResponseCache | None = None,
+        similarity_cache: SimilarityCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        priority: int = Priority.DEFAULT,
+        single_flight: SingleFlight | None = None,
+        base_url: str | None = None,
+        api_key: str | None = None,
         **kwargs,
     ):
-        self.client = client
-        self.model = model
-        self.instructor_mode = instructor_mode
+        self._client = client
+        self.base_url = base_url
+        self.api_key = api_key
+        self._model = model
+        self._instructor_mode = instructor_mode
+        self.cache = cache
+        self.similarity_cache = similarity_cache
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.single_flight = single_flight
         self.kwargs = kwargs
 
-        self.structured_client = instructor.from_openai(client, mode=instructor_mode)
+    # the default client, model and mode are resolved on first use so that
+    # constructing an LLM never imports openai/instructor or reads the env early
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = get_client(base_url=self.base_url, api_key=self.api_key)
+        return self._client
+
+    @property
+    def model(self) -> str:
+        if self._model is None:
+            self._model = get_model()
+        return self._model
+
+    @property
+    def instructor_mode(self) -> instructor.Mode:
+        if self._instructor_mode is None:
+            self._instructor_mode = get_instructor_mode()
+        return self._instructor_mode
 
-    async def agenerate_response_from_text(self, text: str) -> str:
-        response = await self.client.chat.completions.create(
+    @property
+    def structured_client(self) -> instructor.AsyncInstructor:
+        return get_structured_client(self.client, mode=self.instructor_mode)
+
+    def _similarity_cache(self, allow_near_duplicate: bool) -> SimilarityCache | None:
+        return self.similarity_cache if allow_near_duplicate else None
+
+    async def agenerate_response_from_text(
+        self, text: str, allow_near_duplicate: bool = False
+    ) -> str:
+        return await completion_fns.agenerate(
             messages=[{"role": "user", "content": text}],
+            client=self.client,
             model=self.model,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
-        return response.choices[0].message.content
 
-    async def astream_response_from_text(self, text: str) -> AsyncGenerator[str, None]:
-        stream = await self.client.chat.completions.create(
+    async def astream_response_from_text(
+        self, text: str, allow_near_duplicate: bool = False
+    ) -> AsyncGenerator[str, None]:
+        stream = completion_fns.astream_generate(
             messages=[{"role": "user", "content": text}],
+            client=self.client,
             model=self.model,
-            stream=True,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
 
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+            yield chunk
 
     async def agenerate_response_from_messages(
-        self, messages: Iterable[ChatCompletionMessageParam]
+        self,
+        messages: Iterable[ChatCompletionMessageParam],
+        allow_near_duplicate: bool = False,
     ) -> str:
-        stream = await self.client.chat.completions.create(
+        stream = completion_fns.astream_generate(
             messages=messages,
+            client=self.client,
             model=self.model,
-            stream=True,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
 
-        final_response = ""
+        final_response = []
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                final_response += chunk.choices[0].delta.content
+            final_response.append(chunk)
 
-        return final_response
+        return "".join(final_response)
 
     async def astream_response_from_messages(
-        self, messages: list[ChatCompletionMessageParam]
+        self,
+        messages: list[ChatCompletionMessageParam],
+        allow_near_duplicate: bool = False,
     ) -> AsyncGenerator[str, None]:
-        stream = await self.client.chat.completions.create(
+        stream = completion_fns.astream_generate(
             messages=messages,
+            client=self.client,
             model=self.model,
-            stream=True,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
 
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+            yield chunk
 
     async def astructured_extraction_from_text(
         self,
         text: str,
         output_class: Type[T],
+        allow_near_duplicate: bool = False,
     ) -> T:
-        completion = await self.structured_client.chat.completions.create(
+        return await completion_fns.astructured_extraction(
             messages=[{"role": "user", "content": text}],
+            output_class=output_class,
+            client=self.client,
             model=self.model,
-            response_model=output_class,
+            instructor_mode=self.instructor_mode,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
 
-        return completion
-
     async def astructured_extraction_from_messages(
         self,
         messages: list[ChatCompletionMessageParam],
         output_class: Type[T],
+        allow_near_duplicate: bool = False,
     ) -> T:
-        completion = await self.structured_client.chat.completions.create(
+        return await completion_fns.astructured_extraction(
             messages=messages,
+            output_class=output_class,
+            client=self.client,
             model=self.model,
-            response_model=output_class,
+            instructor_mode=self.instructor_mode,
+            cache=self.cache,
+            similarity_cache=self._similarity_cache(allow_near_duplicate),
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
 
-        return completion
-
     async def astream_structured_extraction_from_text(
         self,
         text: str,
         output_class: Type[T],
     ) -> AsyncGenerator[T, None]:
-        stream = self.structured_client.chat.completions.create_partial(
-            model=self.model,
-            response_model=output_class,
+        return completion_fns.astream_structured_extraction(
             messages=[{"role": "user", "content": text}],
-            stream=True,
+            output_class=output_class,
+            client=self.client,
+            model=self.model,
+            instructor_mode=self.instructor_mode,
+            cache=self.cache,
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
             **self.kwargs,
         )
-        return stream
 
     async def astream_structured_extraction_from_messages(
         self,
         messages: list[ChatCompletionMessageParam],
         output_class: Type[T],
     ) -> AsyncGenerator[T, None]:
-        stream = self.structured_client.chat.completions.create_partial(
+        return completion_fns.astream_structured_extraction(
+            messages=messages,
+            output_class=output_class,
+            client=self.client,
             model=self.model,
-            response_model=output_class,
+            instructor_mode=self.instructor_mode,
+            cache=self.cache,
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            single_flight=self.single_flight,
+            **self.kwargs,
+        )
+
+    async def astream_iterable_extraction_from_messages(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        output_class: Type[T],
+    ) -> AsyncGenerator[T, None]:
+        stream = completion_fns.astream_iterable_extraction(
             messages=messages,
-            stream=True,
+            output_class=output_class,
+            client=self.client,
+            model=self.model,
+            instructor_mode=self.instructor_mode,
+            rate_limiter=self.rate_limiter,
+            priority=self.priority,
+            **self.kwargs,
+        )
+
+        async for item in stream:
+            yield item
+
+    async def abatch_generate_response_from_messages(
+        self,
+        messages_list: list[list[ChatCompletionMessageParam]],
+        poll_interval: float = 30.0,
+        return_exceptions: bool = False,
+    ) -> list[str | BaseException]:
+        return await batch_fns.abatch_generate_from_openai_messages(
+            messages_list=messages_list,
+            client=self.client,
+            model=self.model,
+            poll_interval=poll_interval,
+            return_exceptions=return_exceptions,
+            **self.kwargs,
+        )
+
+    async def abatch_structured_extraction_from_messages(
+        self,
+        messages_list: list[list[ChatCompletionMessageParam]],
+        output_class: Type[T],
+        poll_interval: float = 30.0,
+        return_exceptions: bool = False,
+    ) -> list[T | BaseException]:
+        return await batch_fns.abatch_structured_extraction_from_openai_messages(
+            messages_list=messages_list,
+            output_class=output_class,
+            client=self.client,
+            model=self.model,
+            instructor_mode=self.instructor_mode,
+            poll_interval=poll_interval,
+            return_exceptions=return_exceptions,
             **self.kwargs,
         )
-        return stream
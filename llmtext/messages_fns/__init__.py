@@ -1,71 +1,102 @@
-import os
-from typing import AsyncGenerator, Type
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, AsyncGenerator, Type
+from typing import TypeVar
+from pydantic import BaseModel
 from llmtext.types import Message
-from instructor.client import T
-from openai import AsyncOpenAI
-import instructor
+from llmtext import completion_fns
+from llmtext.clients import get_client, get_model
+from llmtext.rate_limit import Priority, RateLimiter
+from llmtext.single_flight import SingleFlight
+from llmtext.cache import ResponseCache, SimilarityCache
 from llmtext.utils_fns import messages_to_openai_messages
 
+if TYPE_CHECKING:
+    import instructor
+    from openai import AsyncOpenAI
+
+T = TypeVar("T", bound=BaseModel)
+
 
 async def agenerate(
     messages: list[Message],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    similarity_cache: SimilarityCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> str:
     parsed_messages = messages_to_openai_messages(messages=messages)
 
-    response = await client.chat.completions.create(
+    return await completion_fns.agenerate(
         messages=parsed_messages,
-        model=model,
+        client=client or get_client(),
+        model=model or get_model(),
+        cache=cache,
+        similarity_cache=similarity_cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
         **kwargs,
     )
-    return response.choices[0].message.content or ""
 
 
 async def astream_generate(
     messages: list[Message],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> AsyncGenerator[str, None]:
     parsed_messages = messages_to_openai_messages(messages=messages)
 
-    stream = await client.chat.completions.create(
-        messages=parsed_messages, model=model, stream=True, **kwargs
+    stream = completion_fns.astream_generate(
+        messages=parsed_messages,
+        client=client or get_client(),
+        model=model or get_model(),
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
+        **kwargs,
     )
 
     async for chunk in stream:
-        yield chunk.choices[0].delta.content or ""
+        yield chunk
 
 
 async def astructured_extraction(
     messages: list[Message],
     output_class: Type[T],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
     max_retries: int = 3,
     temperature: float = 0.0,
-    instructor_mode: instructor.Mode = instructor.Mode.MD_JSON,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> T:
-    structured_client = instructor.from_openai(client, mode=instructor_mode)
-
     parsed_messages = messages_to_openai_messages(messages=messages)
 
-    response = await structured_client.chat.completions.create(
+    response = await completion_fns.astructured_extraction(
         messages=parsed_messages,
-        model=model,
-        response_model=output_class,
+        output_class=output_class,
+        client=client or get_client(),
+        model=model or get_model(),
+        instructor_mode=instructor_mode,
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
         max_retries=max_retries,
         temperature=temperature,
         **kwargs,
@@ -77,28 +108,32 @@ async def astructured_extraction(
 async def astream_structured_extraction(
     messages: list[Message],
     output_class: type[T],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
     max_retries: int = 3,
     temperature: float = 0.0,
-    instructor_mode: instructor.Mode = instructor.Mode.MD_JSON,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> AsyncGenerator[T, None]:
     parsed_messages = messages_to_openai_messages(messages=messages)
 
-    structured_client = instructor.from_openai(client=client, mode=instructor_mode)
-
     stream: AsyncGenerator[output_class, None] = (
-        structured_client.chat.completions.create_partial(
-            model=model,
-            response_model=output_class,
+        completion_fns.astream_structured_extraction(
+            messages=parsed_messages,
+            output_class=output_class,
+            client=client or get_client(),
+            model=model or get_model(),
+            instructor_mode=instructor_mode,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            priority=priority,
+            single_flight=single_flight,
             temperature=temperature,
             max_retries=max_retries,
-            messages=parsed_messages,
-            stream=True,
             **kwargs,
         )
     )
@@ -0,0 +1,199 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, TypedDict
+import logging
+
+from pydantic import BaseModel, Field
+
+from llmtext.cache import ResponseCache
+from llmtext.rate_limit import Priority, RateLimiter, estimate_text_tokens
+from llmtext.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+PACKING_INSTRUCTIONS = """
+
+You will receive several independent inputs, each under a "### Item N" heading.
+Handle every item on its own, exactly as if it had been the only input.
+Return one output per item, in the same order, with the item's index."""
+
+# tokens for an item heading and its JSON wrapper in the response
+ITEM_OVERHEAD_TOKENS = 16
+
+
+class PackedOutput(BaseModel):
+    index: int = Field(description="Index N of the input item this output is for")
+    output: str = Field(description="The output for that item alone")
+
+
+class PackedOutputs(BaseModel):
+    outputs: list[PackedOutput]
+
+
+class PackingStats(TypedDict):
+    # requests sent, packed or single, including failed packs
+    requests: int
+    packs: int
+    packed_items: int
+    fallback_items: int
+    output_ratio: float
+
+
+class RequestPacker:
+    """Sends many short inputs with the same system prompt as one structured request"""
+
+    def __init__(
+        self,
+        token_budget: int = 2048,
+        max_pack_size: int = 32,
+        output_ratio: float = 2.0,
+        ratio_alpha: float = 0.3,
+    ):
+        # estimated prompt plus completion tokens per packed request
+        self.token_budget = token_budget
+        self.max_pack_size = max_pack_size
+        # expected output tokens per input token, learned from the packs answered
+        self.output_ratio = output_ratio
+        self.ratio_alpha = ratio_alpha
+        self.requests = 0
+        self.packs = 0
+        self.packed_items = 0
+        self.fallback_items = 0
+
+    def item_tokens(self, text: str) -> int:
+        tokens = estimate_text_tokens(text)
+        return int(tokens * (1 + self.output_ratio)) + ITEM_OVERHEAD_TOKENS
+
+    def plan(self, system_prompt: str, inputs: list[str]) -> list[list[int]]:
+        """Greedily splits input positions into packs that fit the token budget"""
+        base = estimate_text_tokens(system_prompt + PACKING_INSTRUCTIONS)
+        packs: list[list[int]] = []
+        current: list[int] = []
+        tokens = base
+        for index, text in enumerate(inputs):
+            cost = self.item_tokens(text)
+            if current and (
+                tokens + cost > self.token_budget or len(current) >= self.max_pack_size
+            ):
+                packs.append(current)
+                current, tokens = [], base
+            current.append(index)
+            tokens += cost
+        if current:
+            packs.append(current)
+        return packs
+
+    def _learn(self, inputs: list[str], outputs: list[str]) -> None:
+        input_tokens = sum(estimate_text_tokens(text) for text in inputs)
+        if not input_tokens:
+            return
+        ratio = sum(estimate_text_tokens(text) for text in outputs) / input_tokens
+        self.output_ratio += self.ratio_alpha * (ratio - self.output_ratio)
+
+    async def agenerate(
+        self,
+        system_prompt: str,
+        inputs: list[str],
+        client: "AsyncOpenAI | None" = None,
+        model: str | None = None,
+        cache: ResponseCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        priority: int = Priority.DEFAULT,
+        single_flight: SingleFlight | None = None,
+        temperature: float = 0.0,
+        **kwargs,
+    ) -> list[str]:
+        from llmtext.messages_fns import agenerate
+
+        results: list[str | None] = [None] * len(inputs)
+        # packed and single requests share every option, temperature included
+        options: dict[str, Any] = dict(
+            client=client,
+            model=model,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            priority=priority,
+            single_flight=single_flight,
+            temperature=temperature,
+            **kwargs,
+        )
+
+        async def apack(positions: list[int]) -> None:
+            outputs = await self._apack(
+                system_prompt, [inputs[p] for p in positions], options
+            )
+            for position, output in zip(positions, outputs):
+                results[position] = output
+
+        async def asingle(position: int) -> None:
+            self.requests += 1
+            results[position] = await agenerate(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": inputs[position]},
+                ],
+                **options,
+            )
+
+        plan = self.plan(system_prompt, inputs)
+        packs = [pack for pack in plan if len(pack) > 1]
+        await asyncio.gather(*[apack(pack) for pack in packs])
+
+        # items a pack failed, left out or misnumbered go on their own
+        failed = [p for pack in packs for p in pack if results[p] is None]
+        self.fallback_items += len(failed)
+        singles = [pack[0] for pack in plan if len(pack) == 1]
+        await asyncio.gather(*[asingle(position) for position in singles + failed])
+        return results  # type: ignore
+
+    async def _apack(
+        self, system_prompt: str, items: list[str], options: dict[str, Any]
+    ) -> list[str | None]:
+        from llmtext.messages_fns import astructured_extraction
+
+        content = "\n\n".join(
+            f"### Item {index}\n{text}" for index, text in enumerate(items)
+        )
+        self.requests += 1
+        try:
+            response = await astructured_extraction(
+                messages=[
+                    {"role": "system", "content": system_prompt + PACKING_INSTRUCTIONS},
+                    {"role": "user", "content": content},
+                ],
+                output_class=PackedOutputs,
+                **options,
+            )
+        except Exception as e:
+            logger.warning(f"Packed request of {len(items)} items failed: {e!r}")
+            return [None] * len(items)
+
+        self.packs += 1
+        outputs: list[str | None] = [None] * len(items)
+        if [item.index for item in response.outputs] != list(range(len(items))):
+            logger.warning(
+                f"Packed response does not match its {len(items)} items, "
+                "keeping only uniquely numbered outputs"
+            )
+        seen: dict[int, int] = {}
+        for item in response.outputs:
+            seen[item.index] = seen.get(item.index, 0) + 1
+        for item in response.outputs:
+            if 0 <= item.index < len(items) and seen[item.index] == 1:
+                outputs[item.index] = item.output
+
+        answered = [(items[i], o) for i, o in enumerate(outputs) if o is not None]
+        self.packed_items += len(answered)
+        self._learn([i for i, _ in answered], [o for _, o in answered])
+        return outputs
+
+    def stats(self) -> PackingStats:
+        return {
+            "requests": self.requests,
+            "packs": self.packs,
+            "packed_items": self.packed_items,
+            "fallback_items": self.fallback_items,
+            "output_ratio": self.output_ratio,
+        }
@@ -1,20 +1,50 @@
 import asyncio
-from csv import DictWriter
-import os
-from typing import Annotated, Awaitable, Callable
-from openai import AsyncOpenAI
+import bisect
+import hashlib
+import math
+import random
+import time
+import uuid
+from typing import Annotated, Any, Awaitable, Callable, Literal, TypedDict
 from pydantic import Field
 import logging
 
+from llmtext.cache import ResponseCache, hamming_distance, normalize_text, simhash
+from llmtext.packing import RequestPacker
+from llmtext.rate_limit import Priority, RateLimiter
+from llmtext.results import ResultStore
+from llmtext.single_flight import SingleFlight
+from llmtext.types import EvaluationRecord
+
 logger = logging.getLogger(__name__)
 
-CLIENT = AsyncOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL")
-)
+
+def __getattr__(name: str) -> Any:
+    # CLIENT used to be built at import time, keep it reachable for old callers
+    if name == "CLIENT":
+        from llmtext.clients import get_client
+
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _format_examples(example_inputs: list[str], example_outputs: list[str]) -> str:
+    example_pairs = ""
+    for input, output in zip(example_inputs, example_outputs):
+        example_pairs += f"""# Example input
+{input}
+# Example Output
+{output}
+
+"""
+    return example_pairs
 
 
 async def agenerate_prompt(
-    example_inputs: list[str], example_outputs: list[str], client=CLIENT
+    example_inputs: list[str],
+    example_outputs: list[str],
+    client=None,
+    rate_limiter: RateLimiter | None = None,
 ) -> str:
     logger.debug(f"Generating prompt: {example_inputs} -> {example_outputs}")
     from llmtext.messages_fns import agenerate
@@ -26,14 +56,7 @@ The prompt should describe the task, incorporate the example, provide instructio
 Return only the generated prompt, without any additional explanation or formatting.
 """
 
-    example_pairs = ""
-    for input, output in zip(example_inputs, example_outputs):
-        example_pairs += f"""# Example input
-{input}
-# Example Output
-{output}
-
-"""
+    example_pairs = _format_examples(example_inputs, example_outputs)
 
     completion = await agenerate(
         messages=[
@@ -47,17 +70,153 @@ Return only the generated prompt, without any additional explanation or formatti
             },
         ],
         client=client,
+        rate_limiter=rate_limiter,
+        priority=Priority.BULK,
         temperature=0.8,
     )
 
     return completion
 
 
+async def amutate_prompt(
+    prompt: str,
+    score: float,
+    example_inputs: list[str],
+    example_outputs: list[str],
+    outputs: list[str],
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+    max_mistakes: int = 3,
+) -> str:
+    from llmtext.messages_fns import agenerate
+
+    SYSTEM_PROMPT = """Improve an LLM prompt that acts as a function generator.
+You are given the prompt, its score from 0 to 1, and examples where its output did not match the expected output.
+Rewrite the prompt so that it produces the expected outputs, keeping what already works.
+Return only the improved prompt, without any additional explanation or formatting.
+"""
+
+    mistakes = [
+        (input, expected, output)
+        for input, expected, output in zip(example_inputs, example_outputs, outputs)
+        if output != expected
+    ][:max_mistakes]
+    content = f"""# Prompt
+{prompt}
+# Score
+{score}
+
+"""
+    for input, expected, output in mistakes:
+        content += f"""# Example input
+{input}
+# Expected output
+{expected}
+# Actual output
+{output}
+
+"""
+
+    return await agenerate(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        client=client,
+        rate_limiter=rate_limiter,
+        priority=Priority.BULK,
+        temperature=0.8,
+    )
+
+
+async def acrossover_prompts(
+    first_prompt: str,
+    second_prompt: str,
+    example_inputs: list[str],
+    example_outputs: list[str],
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+) -> str:
+    from llmtext.messages_fns import agenerate
+
+    SYSTEM_PROMPT = """Combine two LLM prompts that act as function generators into one.
+Both prompts score well on the examples. Keep the instructions that make each of them work, and drop anything redundant or contradictory.
+Return only the combined prompt, without any additional explanation or formatting.
+"""
+
+    return await agenerate(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": f"""# First prompt
+{first_prompt}
+# Second prompt
+{second_prompt}
+
+{_format_examples(example_inputs, example_outputs)}""",
+            },
+        ],
+        client=client,
+        rate_limiter=rate_limiter,
+        priority=Priority.BULK,
+        temperature=0.8,
+    )
+
+
+class PromptDeduplicator:
+    """Finds earlier prompts that are the same after normalization, or nearly so"""
+
+    def __init__(self, threshold: float = 0.95, shingle_size: int = 3):
+        self.shingle_size = shingle_size
+        self.max_distance = int((1 - threshold) * 64)
+        self._normalized: dict[str, str] = {}
+        self._fingerprints: list[tuple[int, str]] = []
+
+    def find(self, prompt: str) -> str | None:
+        text = normalize_text(prompt)
+        if text in self._normalized:
+            return self._normalized[text]
+        fingerprint = simhash(text, shingle_size=self.shingle_size)
+        for other, original in self._fingerprints:
+            if hamming_distance(fingerprint, other) <= self.max_distance:
+                return original
+        return None
+
+    def add(self, prompt: str) -> None:
+        text = normalize_text(prompt)
+        self._normalized.setdefault(text, prompt)
+        self._fingerprints.append(
+            (simhash(text, shingle_size=self.shingle_size), prompt)
+        )
+
+
 async def arun_prompt(
-    system_prompt: str, example_inputs: list[str], client=CLIENT
+    system_prompt: str,
+    example_inputs: list[str],
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+    single_flight: SingleFlight | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    packer: RequestPacker | None = None,
+    **kwargs,
 ) -> list[str]:
     from llmtext.messages_fns import agenerate
 
+    if packer is not None:
+        return await packer.agenerate(
+            system_prompt,
+            example_inputs,
+            client=client,
+            model=model,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            priority=Priority.BULK,
+            single_flight=single_flight,
+            **kwargs,
+        )
+
     tasks = []
     for example_input in example_inputs:
         tasks.append(
@@ -67,6 +226,12 @@ async def arun_prompt(
                     {"role": "user", "content": example_input},
                 ],
                 client=client,
+                model=model,
+                cache=cache,
+                rate_limiter=rate_limiter,
+                priority=Priority.BULK,
+                single_flight=single_flight,
+                **kwargs,
             )
         )
 
@@ -75,6 +240,203 @@ async def arun_prompt(
     return results
 
 
+class RaceEntry(TypedDict):
+    # score on the examples this prompt was evaluated on before it was pruned
+    score: float
+    outputs: list[str]
+    examples: int
+    run_time: float
+    scoring_time: float
+
+
+class RaceResult(TypedDict):
+    best_prompt: str
+    best_score: float
+    candidates: dict[str, RaceEntry]
+    # evaluation calls made, cache hits excluded
+    calls: int
+    rounds: int
+
+
+async def arace_prompts(
+    prompts: list[str],
+    example_inputs: list[str],
+    example_outputs: list[str],
+    scoring_fn: Callable[[list[str], list[str], list[str]], Awaitable[float]],
+    initial_batch: int = 8,
+    eta: int = 2,
+    max_calls: int | None = None,
+    confidence: float | None = 0.95,
+    concurrency: int = 4,
+    seed: int | None = None,
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+    single_flight: SingleFlight | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    packer: RequestPacker | None = None,
+    entries: dict[str, RaceEntry] | None = None,
+    on_done: Callable[[str, RaceEntry], None] | None = None,
+) -> RaceResult:
+    """Successive halving over a growing random minibatch of the examples
+
+    Each round keeps the best 1/eta of the prompts and multiplies the minibatch by eta.
+    With a confidence, scores are taken to lie in [0, 1]. Prompts whose Hoeffding
+    bound falls below the leader's are pruned too. The race stops once only the
+    leader is left.
+
+    entries holds progress from an earlier race with the same seed, which is picked
+    up instead of run again. on_done gets each prompt once, when it is pruned or the
+    race ends.
+    """
+    rng = random.Random(seed)
+    order = list(range(len(example_inputs)))
+    rng.shuffle(order)
+    inputs = [example_inputs[i] for i in order]
+    expected = [example_outputs[i] for i in order]
+
+    candidates: dict[str, RaceEntry] = {}
+    for prompt in prompts:
+        entry: RaceEntry = {
+            "score": 0.0,
+            "outputs": [],
+            "examples": 0,
+            "run_time": 0.0,
+            "scoring_time": 0.0,
+        }
+        if entries is not None and prompt in entries:
+            entry.update(entries[prompt])
+            if entry["examples"] == len(inputs):
+                entry["outputs"] = [entry["outputs"][i] for i in order]
+        candidates[prompt] = entry
+    survivors = list(candidates)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def aextend(prompt: str, end: int) -> None:
+        entry = candidates[prompt]
+        start = entry["examples"]
+        async with semaphore:
+            started = time.perf_counter()
+            entry["outputs"] = entry["outputs"][:start] + await arun_prompt(
+                system_prompt=prompt,
+                example_inputs=inputs[start:end],
+                client=client,
+                rate_limiter=rate_limiter,
+                single_flight=single_flight,
+                model=model,
+                cache=cache,
+                packer=packer,
+            )
+            ran = time.perf_counter()
+            entry["score"] = await scoring_fn(
+                inputs[:end], expected[:end], entry["outputs"]
+            )
+            entry["scoring_time"] += time.perf_counter() - ran
+            entry["run_time"] += ran - started
+        entry["examples"] = end
+
+    def needed(group: list[str], end: int) -> int:
+        # calls to extend the group to end examples, one per pack with a packer
+        total = 0
+        for prompt in group:
+            start = candidates[prompt]["examples"]
+            if end <= start:
+                continue
+            if packer is None:
+                total += end - start
+            else:
+                total += len(packer.plan(prompt, inputs[start:end]))
+        return total
+
+    def radius(prompt: str) -> float:
+        # union bound over the survivors, each score a mean of [0, 1] values
+        assert confidence is not None
+        return math.sqrt(
+            math.log(2 * len(survivors) / (1 - confidence))
+            / (2 * candidates[prompt]["examples"])
+        )
+
+    def done(prompt: str) -> None:
+        entry = candidates[prompt]
+        if entry["examples"] == len(inputs):
+            # a complete evaluation is reported in the order of example_inputs
+            outputs = [""] * len(inputs)
+            for position, output in zip(order, entry["outputs"]):
+                outputs[position] = output
+            entry["outputs"] = outputs
+        if on_done is not None:
+            on_done(prompt, entry)
+
+    calls = 0
+    rounds = 0
+    size = min(initial_batch, len(inputs))
+    while survivors:
+        end = size
+        if max_calls is not None:
+            # the largest minibatch the remaining budget covers for every survivor
+            floor = min(candidates[prompt]["examples"] for prompt in survivors)
+            affordable = bisect.bisect_right(
+                range(floor, size + 1),
+                max_calls - calls,
+                key=lambda target: needed(survivors, target),
+            )
+            end = floor + affordable - 1
+        behind = [
+            prompt for prompt in survivors if candidates[prompt]["examples"] < end
+        ]
+        if behind:
+            new = needed(behind, end)
+            requests = packer.requests if packer is not None else 0
+            cache_hits = cache.hits if cache is not None else 0
+            await asyncio.gather(*[aextend(prompt, end) for prompt in behind])
+            # a packer's plan is an estimate, it may fall back to single requests
+            calls += new if packer is None else packer.requests - requests
+            if cache is not None:
+                calls -= cache.hits - cache_hits
+            rounds += 1
+        elif max_calls is not None and end < size:
+            break
+
+        survivors.sort(key=lambda prompt: candidates[prompt]["score"], reverse=True)
+        logger.debug(f"Race round {rounds}: {len(survivors)} prompts on {end} examples")
+        if len(survivors) == 1 or end == len(inputs):
+            break
+
+        keep = math.ceil(len(survivors) / eta)
+        if confidence is not None:
+            leader = survivors[0]
+            bound = candidates[leader]["score"] - radius(leader)
+            keep = min(
+                keep,
+                sum(
+                    candidates[prompt]["score"] + radius(prompt) >= bound
+                    for prompt in survivors
+                ),
+            )
+        for prompt in survivors[keep:]:
+            done(prompt)
+        survivors = survivors[:keep]
+        if len(survivors) == 1:
+            logger.debug("Race leader is ahead with the requested confidence")
+            break
+        size = min(len(inputs), size * eta)
+
+    for prompt in survivors:
+        done(prompt)
+    best = survivors[0] if survivors else ""
+    return {
+        "best_prompt": best,
+        "best_score": candidates[best]["score"] if best else 0.0,
+        "candidates": candidates,
+        "calls": calls,
+        "rounds": rounds,
+    }
+
+
+def _candidate_id(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+
 async def agenerate_prompt_and_optimize(
     example_inputs: list[str],
     example_outputs: list[str],
@@ -88,59 +450,386 @@ async def agenerate_prompt_and_optimize(
             description="Number of search exploration to be run in parallel for each iteration"
         ),
     ] = 1,
-    client=CLIENT,
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+    single_flight: SingleFlight | None = None,
+    concurrency: int = 4,
+    store: ResultStore | None = None,
+    run_id: str | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    packer: RequestPacker | None = None,
+    dedup_threshold: float = 0.95,
+    evaluation: Literal["full", "successive_halving"] = "full",
+    initial_batch: int = 8,
+    eta: int = 2,
+    max_evaluation_calls: int | None = None,
+    confidence: float | None = 0.95,
+    seed: int | None = None,
 ) -> str:
+    run_id = run_id or uuid.uuid4().hex
     logger.debug(f"""# Generating prompt and optimizing:
+# Run
+{run_id}
 # Parallel Count
 {parallel_count}
 """)
     logger.debug(f"Generating prompt: {example_inputs[0]} -> {example_outputs[0]}")
-    tasks = []
-    for _ in range(parallel_count):
-        tasks.append(
-            agenerate_prompt(
+
+    # evaluations an interrupted run already stored are not repeated
+    records = store.load(run_id) if store is not None else []
+    if records:
+        logger.info(f"Resuming run {run_id} with {len(records)} evaluated prompts")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    deduplicator = PromptDeduplicator(threshold=dedup_threshold)
+    # the latest record of each prompt, a race may have stored it more than once
+    evaluated: dict[str, EvaluationRecord] = {}
+    for record in records:
+        if record["duplicate_of"] is None:
+            deduplicator.add(record["prompt"])
+            evaluated[record["prompt"]] = record
+    stored = len({record["prompt"] for record in records})
+
+    async def awrite() -> tuple[str, float]:
+        async with semaphore:
+            started = time.perf_counter()
+            prompt = await agenerate_prompt(
                 example_inputs=example_inputs,
                 example_outputs=example_outputs,
                 client=client,
+                rate_limiter=rate_limiter,
             )
-        )
+        return prompt, time.perf_counter() - started
 
-    prompts = await asyncio.gather(*tasks)
+    def save(record: EvaluationRecord) -> EvaluationRecord:
+        # stored as soon as it is scored, so an interruption loses little
+        if store is not None:
+            store.append(record)
+        return record
 
-    tasks = []
-    for prompt in prompts:
-        tasks.append(
-            arun_prompt(
+    def save_evaluation(
+        prompt: str,
+        score: float,
+        output: list[str],
+        examples: int,
+        generation_time: float,
+        run_time: float,
+        scoring_time: float,
+    ) -> EvaluationRecord:
+        evaluated[prompt] = save(
+            {
+                "run_id": run_id,
+                "candidate_id": _candidate_id(prompt),
+                "prompt": prompt,
+                "score": score,
+                "outputs": output,
+                "examples": examples,
+                "generation_time": generation_time,
+                "run_time": run_time,
+                "scoring_time": scoring_time,
+                "created_at": time.time(),
+                "duplicate_of": None,
+            }
+        )
+        return evaluated[prompt]
+
+    async def aevaluate(prompt: str, generation_time: float) -> EvaluationRecord:
+        async with semaphore:
+            started = time.perf_counter()
+            output = await arun_prompt(
                 system_prompt=prompt,
                 example_inputs=example_inputs,
                 client=client,
+                rate_limiter=rate_limiter,
+                single_flight=single_flight,
+                model=model,
+                cache=cache,
+                packer=packer,
             )
+            ran = time.perf_counter()
+            score = await scoring_fn(example_inputs, example_outputs, output)
+            scored = time.perf_counter()
+
+        logger.debug(f"""Prompt
+{prompt}
+# Score
+{score}""")
+        return save_evaluation(
+            prompt,
+            score,
+            output,
+            len(example_inputs),
+            generation_time,
+            ran - started,
+            scored - ran,
+        )
+
+    written = await asyncio.gather(
+        *[awrite() for _ in range(parallel_count - stored)]
+    )
+
+    # near-duplicate prompts are collapsed into the first one and not evaluated again
+    fresh: list[tuple[str, float]] = []
+    duplicates: list[tuple[str, str, float]] = []
+    for prompt, generation_time in written:
+        original = deduplicator.find(prompt)
+        if original is None:
+            deduplicator.add(prompt)
+            fresh.append((prompt, generation_time))
+        else:
+            duplicates.append((prompt, original, generation_time))
+
+    race = None
+    if evaluation == "successive_halving":
+        generation_times = {
+            prompt: record["generation_time"] for prompt, record in evaluated.items()
+        }
+        generation_times.update(fresh)
+
+        def finish(prompt: str, entry: RaceEntry) -> None:
+            record = evaluated.get(prompt)
+            if record is None or record["examples"] < entry["examples"]:
+                save_evaluation(
+                    prompt,
+                    entry["score"],
+                    entry["outputs"],
+                    entry["examples"],
+                    generation_times[prompt],
+                    entry["run_time"],
+                    entry["scoring_time"],
+                )
+
+        # stored prompts rejoin the race where they stopped; partial outputs follow
+        # the race's example order, so it is fixed by the run id unless seeded
+        race = await arace_prompts(
+            [*evaluated, *(prompt for prompt, _ in fresh)],
+            example_inputs=example_inputs,
+            example_outputs=example_outputs,
+            scoring_fn=scoring_fn,
+            initial_batch=initial_batch,
+            eta=eta,
+            max_calls=max_evaluation_calls,
+            confidence=confidence,
+            concurrency=concurrency,
+            seed=seed if seed is not None else int(_candidate_id(run_id), 16),
+            client=client,
+            rate_limiter=rate_limiter,
+            single_flight=single_flight,
+            model=model,
+            cache=cache,
+            packer=packer,
+            entries={
+                prompt: {
+                    "score": record["score"],
+                    "outputs": record["outputs"],
+                    "examples": record["examples"],
+                    "run_time": record["run_time"],
+                    "scoring_time": record["scoring_time"],
+                }
+                for prompt, record in evaluated.items()
+            },
+            on_done=finish,
+        )
+    else:
+        # minibatch scores from a successive halving run do not compare with full ones
+        partial = [
+            (prompt, record["generation_time"])
+            for prompt, record in evaluated.items()
+            if record["examples"] < len(example_inputs)
+        ]
+        await asyncio.gather(
+            *[
+                aevaluate(prompt, generation_time)
+                for prompt, generation_time in [*partial, *fresh]
+            ]
         )
 
-    outputs = await asyncio.gather(*tasks)
+    for prompt, original, generation_time in duplicates:
+        source = evaluated[original]
+        save(
+            {
+                **source,
+                "candidate_id": _candidate_id(prompt),
+                "prompt": prompt,
+                "generation_time": generation_time,
+                "run_time": 0.0,
+                "scoring_time": 0.0,
+                "created_at": time.time(),
+                "duplicate_of": source["candidate_id"],
+            }
+        )
+    if duplicates:
+        logger.debug(f"Collapsed {len(duplicates)} duplicate prompts")
 
-    logger.debug("Scoring prompts")
+    if race is not None:
+        # scores on minibatches of different sizes do not compare, the race decides
+        return race["best_prompt"]
 
-    # score prompts
     best_score = 0.0
     best_prompt = ""
-    with open("prompts_scores.csv", mode="a+") as f:
-        writer = DictWriter(
-            f,
-            fieldnames=[
-                "prompt",
-                "score",
-            ],
-        )
-        for prompt, output in zip(prompts, outputs):
-            score = await scoring_fn(example_inputs, example_outputs, output)
-            logger.debug(f"""Prompt
-{prompt}
-# Score
-{score}""")
-            writer.writerow({"prompt": prompt, "score": score})
-            if score >= best_score:
-                best_score = score
-                best_prompt = prompt
+    for record in evaluated.values():
+        if record["score"] >= best_score:
+            best_score = record["score"]
+            best_prompt = record["prompt"]
 
     return best_prompt
+
+
+class PromptCandidate(TypedDict):
+    prompt: str
+    score: float
+    outputs: list[str]
+    round: int
+
+
+class PromptSearchResult(TypedDict):
+    best_prompt: str
+    best_score: float
+    # best score after each round
+    trajectory: list[float]
+    # model calls spent writing and evaluating candidates
+    calls: int
+    rounds: int
+    candidates: list[PromptCandidate]
+    # candidates collapsed into an earlier near-duplicate instead of evaluated
+    duplicates: int
+
+
+async def aoptimize_prompt(
+    example_inputs: list[str],
+    example_outputs: list[str],
+    scoring_fn: Callable[[list[str], list[str], list[str]], Awaitable[float]],
+    population_size: int = 4,
+    beam_width: int = 2,
+    max_calls: int = 200,
+    max_rounds: int = 10,
+    patience: int = 2,
+    min_improvement: float = 0.0,
+    concurrency: int = 4,
+    seed: int | None = None,
+    client=None,
+    rate_limiter: RateLimiter | None = None,
+    single_flight: SingleFlight | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    packer: RequestPacker | None = None,
+    dedup_threshold: float = 0.95,
+) -> PromptSearchResult:
+    """Multi-round beam search seeded by mutations and crossovers of the best prompts"""
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    deduplicator = PromptDeduplicator(threshold=dedup_threshold)
+    duplicates = 0
+
+    async def acandidate(
+        write: Callable[[], Awaitable[str]], round: int
+    ) -> PromptCandidate | None:
+        nonlocal duplicates
+        async with semaphore:
+            prompt = await write()
+            if deduplicator.find(prompt) is not None:
+                duplicates += 1
+                return None
+            deduplicator.add(prompt)
+            outputs = await arun_prompt(
+                system_prompt=prompt,
+                example_inputs=example_inputs,
+                client=client,
+                rate_limiter=rate_limiter,
+                single_flight=single_flight,
+                model=model,
+                cache=cache,
+                packer=packer,
+            )
+            score = await scoring_fn(example_inputs, example_outputs, outputs)
+        logger.debug(f"Round {round} candidate scored {score}")
+        return {"prompt": prompt, "score": score, "outputs": outputs, "round": round}
+
+    def writer(index: int, beam: list[PromptCandidate]) -> Callable[[], Awaitable[str]]:
+        if not beam:
+            return lambda: agenerate_prompt(
+                example_inputs=example_inputs,
+                example_outputs=example_outputs,
+                client=client,
+                rate_limiter=rate_limiter,
+            )
+        if index % 2 and len(beam) > 1:
+            first, second = rng.sample(beam, 2)
+            return lambda: acrossover_prompts(
+                first["prompt"],
+                second["prompt"],
+                example_inputs=example_inputs,
+                example_outputs=example_outputs,
+                client=client,
+                rate_limiter=rate_limiter,
+            )
+        parent = beam[index % len(beam)]
+        return lambda: amutate_prompt(
+            parent["prompt"],
+            parent["score"],
+            example_inputs=example_inputs,
+            example_outputs=example_outputs,
+            outputs=parent["outputs"],
+            client=client,
+            rate_limiter=rate_limiter,
+        )
+
+    beam: list[PromptCandidate] = []
+    candidates: list[PromptCandidate] = []
+    trajectory: list[float] = []
+    calls = 0
+    stale = 0
+    for round in range(max_rounds):
+        # one call writes a candidate, one per example, or per pack, evaluates it
+        if packer is None:
+            cost = 1 + len(example_inputs)
+        else:
+            cost = 1 + len(
+                packer.plan(beam[0]["prompt"] if beam else "", example_inputs)
+            )
+        count = min(population_size, (max_calls - calls) // cost)
+        if count <= 0:
+            logger.debug("Evaluation budget spent")
+            break
+        requests_before = packer.requests if packer is not None else 0
+        cache_hits_before = cache.hits if cache is not None else 0
+
+        results = await asyncio.gather(
+            *[acandidate(writer(i, beam), round) for i in range(count)]
+        )
+        children = [child for child in results if child is not None]
+        candidates.extend(children)
+        # charged for the calls made, duplicates and cached outputs cost nothing
+        calls += count
+        if packer is None:
+            calls += len(children) * len(example_inputs)
+        else:
+            calls += packer.requests - requests_before
+        if cache is not None:
+            calls -= cache.hits - cache_hits_before
+        # parents stay in the beam until a child beats them
+        beam = sorted(beam + children, key=lambda c: c["score"], reverse=True)[
+            :beam_width
+        ]
+
+        best_score = beam[0]["score"]
+        if trajectory and best_score - trajectory[-1] <= min_improvement:
+            stale += 1
+        else:
+            stale = 0
+        trajectory.append(best_score)
+        logger.debug(f"Round {round} best score {best_score}")
+        if stale >= patience:
+            logger.debug(f"Stopping after {stale} rounds without improvement")
+            break
+
+    return {
+        "best_prompt": beam[0]["prompt"] if beam else "",
+        "best_score": beam[0]["score"] if beam else 0.0,
+        "trajectory": trajectory,
+        "calls": calls,
+        "rounds": len(trajectory),
+        "candidates": candidates,
+        "duplicates": duplicates,
+    }
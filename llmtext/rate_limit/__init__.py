@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import time
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+from llmtext.telemetry import current_span
+import logging
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    DEFAULT = 5
+    BULK = 10
+
+
+def estimate_text_tokens(text: str) -> int:
+    # ~4 ascii characters per token, CJK and other scripts are closer to 1 per char
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def estimate_message_tokens(message: Any) -> int:
+    tokens = 4
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return tokens + estimate_text_tokens(content)
+    for part in content:
+        tokens += estimate_text_tokens(str(part.get("text", "")))
+    return tokens
+
+
+def estimate_tokens(
+    messages: Iterable[Any],
+    max_tokens: int | None = None,
+    default_completion_tokens: int = 256,
+) -> int:
+    tokens = 3 + sum(estimate_message_tokens(message) for message in messages)
+    return tokens + (default_completion_tokens if max_tokens is None else max_tokens)
+
+
+def find_rate_limit_error(error: BaseException) -> BaseException | None:
+    seen = set()
+    current: BaseException | None = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if getattr(current, "status_code", None) == 429:
+            return current
+        last_attempt = getattr(current, "last_attempt", None)
+        if last_attempt is not None and last_attempt.failed:
+            inner = last_attempt.exception()
+            if inner is not None and getattr(inner, "status_code", None) == 429:
+                return inner
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    if retry_after_ms := headers.get("retry-after-ms"):
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    if retry_after := headers.get("retry-after"):
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(
+                    0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()
+                )
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class RateLimiter:
+    """Shared requests/min and tokens/min token buckets with priority queueing"""
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 5,
+        default_retry_after: float = 1.0,
+        min_scale: float = 0.1,
+        recovery: float = 0.05,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.min_scale = min_scale
+        self.recovery = recovery
+
+        self.scale = 1.0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+        self._requests = requests_per_minute or 0.0
+        self._tokens = tokens_per_minute or 0.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: list[tuple[int, int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._changed: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            limit = self.requests_per_minute * self.scale
+            self._requests = min(limit, self._requests + elapsed * limit / 60)
+        if self.tokens_per_minute:
+            limit = self.tokens_per_minute * self.scale
+            self._tokens = min(limit, self._tokens + elapsed * limit / 60)
+
+    def _delay_for(self, tokens: int) -> float:
+        delay = max(0.0, self._blocked_until - time.monotonic())
+        if self.requests_per_minute and self._requests < 1:
+            rate = self.requests_per_minute * self.scale / 60
+            delay = max(delay, (1 - self._requests) / rate)
+        if self.tokens_per_minute:
+            limit = self.tokens_per_minute * self.scale
+            needed = min(tokens, limit)
+            if self._tokens < needed:
+                delay = max(delay, (needed - self._tokens) / (limit / 60))
+        return delay
+
+    def _consume(self, tokens: int) -> None:
+        if self.requests_per_minute:
+            self._requests -= 1
+        if self.tokens_per_minute:
+            self._tokens -= min(tokens, self.tokens_per_minute * self.scale)
+
+    async def _adispatch(self) -> None:
+        assert self._changed is not None
+        while self._waiters:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            self._refill()
+            delay = self._delay_for(tokens)
+            if delay <= 0:
+                heapq.heappop(self._waiters)
+                self._consume(tokens)
+                future.set_result(None)
+                continue
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def acquire(self, tokens: int = 0, priority: int = Priority.DEFAULT) -> float:
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            if self._blocked_until <= time.monotonic():
+                return 0.0
+
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is not None and self._dispatcher.get_loop() is not loop:
+            # the limiter outlived the loop it was first used on
+            self._dispatcher = None
+            self._changed = None
+            self._waiters = []
+        if self._changed is None:
+            self._changed = asyncio.Event()
+
+        started = time.monotonic()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), tokens, future))
+        self._changed.set()
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._adispatch())
+
+        await future
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        return waited
+
+    def record_rate_limited(self, retry_after: float | None = None) -> None:
+        self.rate_limited += 1
+        self.scale = max(self.min_scale, self.scale / 2)
+        pause = retry_after if retry_after is not None else self.default_retry_after
+        self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+        # drain the buckets so resumed traffic ramps up instead of bursting
+        self._requests = min(self._requests, 0.0)
+        self._tokens = min(self._tokens, 0.0)
+        logger.warning(
+            f"Rate limited, pausing {pause:.2f}s and scaling limits to {self.scale:.2f}"
+        )
+        if self._changed is not None:
+            self._changed.set()
+
+    def record_success(self) -> None:
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + self.recovery)
+
+    async def arun(
+        self,
+        fn: Callable[[], Awaitable[R]],
+        tokens: int = 0,
+        priority: int = Priority.DEFAULT,
+    ) -> R:
+        attempt = 0
+        while True:
+            current_span().add(
+                "queue_wait", await self.acquire(tokens=tokens, priority=priority)
+            )
+            try:
+                result = await fn()
+            except Exception as e:
+                rate_limit_error = find_rate_limit_error(e)
+                if rate_limit_error is None or attempt >= self.max_retries:
+                    raise
+                self.record_rate_limited(retry_after_seconds(rate_limit_error))
+                current_span().add("rate_limit_retries", 1)
+                attempt += 1
+                continue
+
+            self.record_success()
+            return result
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Collection, Literal
+from urllib.parse import parse_qsl, urlencode
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+ReplayMode = Literal["record", "replay", "replay_or_record"]
+
+MAGIC = b"LLMTCAS1"
+# request key digest, metadata length, body length
+_RECORD_HEADER = struct.Struct("<32sIQ")
+
+
+class CassetteMiss(LookupError):
+    """No recorded response matches the request"""
+
+
+def request_key(request: httpx.Request, ignore_keys: Collection[str] = ()) -> bytes:
+    """Hash of the method, path, sorted query and canonical JSON body
+
+    The host and headers are left out, so a cassette replays against any base_url
+    and api key.
+    """
+    query = urlencode(sorted(parse_qsl(request.url.query.decode())))
+    body = request.content
+    try:
+        parsed = json.loads(body) if body else None
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        parsed = {k: v for k, v in parsed.items() if k not in ignore_keys}
+    if parsed is not None:
+        body = json.dumps(
+            parsed, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        ).encode()
+
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{query}\n".encode())
+    digest.update(body)
+    return digest.digest()
+
+
+class Cassette:
+    """Append-only file of recorded responses, memory-mapped and indexed by request key"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # request key -> (metadata offset, metadata length, body length) per recording
+        self._index: dict[bytes, list[tuple[int, int, int]]] = {}
+        self._mmap: mmap.mmap | None = None
+        self._scanned = len(MAGIC)
+        self.records = 0
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+        self._load()
+        if os.path.getsize(path) > self._scanned:
+            # drop a record cut short by an interrupted write so appends stay readable
+            os.truncate(path, self._scanned)
+
+    def _load(self) -> None:
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a cassette file")
+            size = os.fstat(f.fileno()).st_size
+            if size <= self._scanned:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # only records past what was already indexed are scanned
+        offset = self._scanned
+        while offset + _RECORD_HEADER.size <= size:
+            key, meta_length, body_length = _RECORD_HEADER.unpack_from(mapped, offset)
+            start = offset + _RECORD_HEADER.size
+            end = start + meta_length + body_length
+            if end > size:
+                logger.warning(f"Ignoring a truncated record at the end of {self.path}")
+                break
+            self._index.setdefault(key, []).append((start, meta_length, body_length))
+            self.records += 1
+            offset = end
+        self._scanned = offset
+
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mapped
+
+    def count(self, key: bytes) -> int:
+        return len(self._index.get(key, ()))
+
+    def get(self, key: bytes, occurrence: int = 0) -> tuple[dict[str, Any], bytes]:
+        start, meta_length, body_length = self._index[key][occurrence]
+        assert self._mmap is not None
+        meta = json.loads(self._mmap[start : start + meta_length])
+        body = self._mmap[start + meta_length : start + meta_length + body_length]
+        return meta, body
+
+    def append(self, key: bytes, meta: dict[str, Any], body: bytes) -> None:
+        encoded = json.dumps(meta, separators=(",", ":")).encode()
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(
+                    _RECORD_HEADER.pack(key, len(encoded), len(body)) + encoded + body
+                )
+            self._load()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, body: bytes, chunks: list[list[float]], speed: float | None):
+        self.body = body
+        # (size, seconds after the request was sent) of each recorded chunk
+        self.chunks = chunks or [[len(body), 0.0]]
+        self.speed = speed
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        offset = 0
+        for size, at in self.chunks:
+            if self.speed:
+                delay = at / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield self.body[offset : offset + int(size)]
+            offset += int(size)
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(
+        self,
+        stream: httpx.AsyncByteStream,
+        started: float,
+        on_complete: Callable[[list[list[float]], bytes], None],
+    ):
+        self.stream = stream
+        self.started = started
+        self.on_complete = on_complete
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        chunks: list[list[float]] = []
+        parts: list[bytes] = []
+        async for part in self.stream:
+            chunks.append([len(part), time.perf_counter() - self.started])
+            parts.append(part)
+            yield part
+        # responses the caller stopped reading part way are not recorded
+        self.on_complete(chunks, b"".join(parts))
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Records HTTP exchanges to a cassette and replays them without the network"""
+
+    def __init__(
+        self,
+        path: str,
+        mode: ReplayMode = "replay_or_record",
+        transport: httpx.AsyncBaseTransport | None = None,
+        speed: float | None = None,
+        ignore_keys: Collection[str] = (),
+    ):
+        self.cassette = Cassette(path)
+        self.mode = mode
+        self._transport = transport
+        # None replays at once, 1.0 with the recorded timing, 10.0 ten times faster
+        self.speed = speed
+        # top level JSON body keys left out of the request key
+        self.ignore_keys = frozenset(ignore_keys)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        # repeated identical requests get the recordings in the order they were made
+        self._served: dict[bytes, int] = {}
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is None:
+            from llmtext.clients import build_transport
+
+            self._transport = build_transport()
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key = request_key(request, self.ignore_keys)
+
+        if self.mode != "record":
+            recorded = self.cassette.count(key)
+            occurrence = self._served.get(key, 0)
+            if self.mode == "replay" and recorded:
+                # once every recording was served, the last one is reused
+                occurrence = min(occurrence, recorded - 1)
+            if occurrence < recorded:
+                self._served[key] = occurrence + 1
+                self.hits += 1
+                return self._replay(*self.cassette.get(key, occurrence))
+
+            self.misses += 1
+            if self.mode == "replay":
+                raise CassetteMiss(
+                    f"No recorded response for {request.method} {request.url.path}"
+                )
+
+        return await self._arecord(request, key)
+
+    def _replay(self, meta: dict[str, Any], body: bytes) -> httpx.Response:
+        return httpx.Response(
+            status_code=meta["status"],
+            headers=meta["headers"],
+            stream=_ReplayStream(body, meta["chunks"], self.speed),
+        )
+
+    async def _arecord(self, request: httpx.Request, key: bytes) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        # transient failures are passed through but never replayed
+        if response.status_code >= 500 or response.status_code == 429:
+            return response
+
+        meta = {
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items()],
+        }
+
+        def save(chunks: list[list[float]], body: bytes) -> None:
+            self.cassette.append(key, {**meta, "chunks": chunks}, body)
+            self._served[key] = self._served.get(key, 0) + 1
+            self.recorded += 1
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, started, save),  # type: ignore
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
+        self.cassette.close()
@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+import csv
+import json
+import os
+import sqlite3
+import threading
+
+from llmtext.types import EvaluationRecord
+
+FIELDS = list(EvaluationRecord.__annotations__)
+
+
+class ResultStore(ABC):
+    """Append-only log of prompt evaluations, read back to resume a run"""
+
+    @abstractmethod
+    def append(self, record: EvaluationRecord) -> None:
+        pass
+
+    @abstractmethod
+    def load(self, run_id: str) -> list[EvaluationRecord]:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryResultStore(ResultStore):
+    def __init__(self):
+        self.records: list[EvaluationRecord] = []
+
+    def append(self, record: EvaluationRecord) -> None:
+        self.records.append(record)
+
+    def load(self, run_id: str) -> list[EvaluationRecord]:
+        return [record for record in self.records if record["run_id"] == run_id]
+
+
+class JSONLResultStore(ResultStore):
+    """One JSON object per line, flushed after every record"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, record: EvaluationRecord) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def load(self, run_id: str) -> list[EvaluationRecord]:
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by an interrupted run
+                    continue
+                if record["run_id"] == run_id:
+                    records.append(record)
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class CSVResultStore(ResultStore):
+    """CSV with a header row; outputs are stored as a JSON list"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if new:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def append(self, record: EvaluationRecord) -> None:
+        with self._lock:
+            self._writer.writerow(
+                {**record, "outputs": json.dumps(record["outputs"], ensure_ascii=False)}
+            )
+            self._file.flush()
+
+    def load(self, run_id: str) -> list[EvaluationRecord]:
+        records: list[EvaluationRecord] = []
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row["run_id"] != run_id:
+                    continue
+                try:
+                    records.append(
+                        {
+                            "run_id": row["run_id"],
+                            "candidate_id": row["candidate_id"],
+                            "prompt": row["prompt"],
+                            "score": float(row["score"]),
+                            "outputs": json.loads(row["outputs"]),
+                            "examples": int(row["examples"]),
+                            "generation_time": float(row["generation_time"]),
+                            "run_time": float(row["run_time"]),
+                            "scoring_time": float(row["scoring_time"]),
+                            "created_at": float(row["created_at"]),
+                            "duplicate_of": row["duplicate_of"] or None,
+                        }
+                    )
+                except (TypeError, ValueError):
+                    # a row cut short by an interrupted run
+                    continue
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class SQLiteResultStore(ResultStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS evaluations "
+                "(run_id TEXT NOT NULL, candidate_id TEXT NOT NULL, prompt TEXT, "
+                "score REAL, outputs TEXT, examples INTEGER, generation_time REAL, "
+                "run_time REAL, scoring_time REAL, created_at REAL, duplicate_of TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS evaluations_run_id ON evaluations (run_id)"
+            )
+            self._conn.commit()
+
+    def append(self, record: EvaluationRecord) -> None:
+        values = {
+            **record,
+            "outputs": json.dumps(record["outputs"], ensure_ascii=False),
+        }
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO evaluations ({', '.join(FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(FIELDS))})",
+                [values[field] for field in FIELDS],
+            )
+            self._conn.commit()
+
+    def load(self, run_id: str) -> list[EvaluationRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM evaluations "
+                "WHERE run_id = ? ORDER BY rowid",
+                (run_id,),
+            ).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record["outputs"] = json.loads(record["outputs"])
+            records.append(record)
+        return records  # type: ignore
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
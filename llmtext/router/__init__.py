@@ -0,0 +1,336 @@
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Literal, TypedDict
+import logging
+
+import httpx
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+RouterStrategy = Literal["round_robin", "least_outstanding"]
+BreakerState = Literal["closed", "open", "half_open"]
+
+# the router client's own base url, requests are rewritten onto an endpoint
+ROUTER_BASE_URL = "http://llmtext-router/"
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# request extension holding the endpoints already serving a copy of the request,
+# which further copies avoid while another endpoint is left
+CLAIMED_ENDPOINTS = "llmtext.claimed_endpoints"
+
+
+class EndpointStats(TypedDict):
+    name: str
+    state: BreakerState
+    outstanding: int
+    ewma_latency: float | None
+    requests: int
+    failures: int
+
+
+class Endpoint:
+    """One OpenAI-compatible base url and key, with its load and circuit breaker"""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str | None = None,
+        weight: float = 1.0,
+        name: str | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.weight = weight
+        self.name = name or self.base_url
+
+        self.outstanding = 0
+        # smoothed seconds to the response headers, or to the first chunk of a stream
+        self.ewma_latency: float | None = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state: BreakerState = "closed"
+        self.opened_at = 0.0
+        self._current_weight = 0.0
+
+    def available(self, cooldown: float) -> bool:
+        # a half open endpoint already has its probe in flight
+        return self.state == "closed" or (
+            self.state == "open" and time.monotonic() - self.opened_at >= cooldown
+        )
+
+    def record_success(self, latency: float, alpha: float) -> None:
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.ewma_latency = (
+            latency
+            if self.ewma_latency is None
+            else alpha * latency + (1 - alpha) * self.ewma_latency
+        )
+
+    def record_failure(self, failure_threshold: int) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit opened for endpoint {self.name}")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        self.outstanding -= 1
+
+    def stats(self) -> EndpointStats:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class _EndpointFailure(Exception):
+    pass
+
+
+class _PrefetchedStream(httpx.AsyncByteStream):
+    """Replays the pre-read first chunk, and calls on_close once when closed"""
+
+    def __init__(
+        self,
+        first: bytes | None,
+        rest: AsyncIterator[bytes],
+        stream: httpx.AsyncByteStream,
+        on_close: Callable[[], None] | None = None,
+    ):
+        self.first = first
+        self.rest = rest
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self.first is not None:
+            yield self.first
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+        await self.stream.aclose()
+
+
+def _is_stream(request: httpx.Request) -> bool:
+    try:
+        body = json.loads(request.content)
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get("stream") is True
+
+
+async def _aprefetch(
+    response: httpx.Response, timeout: float | None = None
+) -> tuple[bytes | None, AsyncIterator[bytes]]:
+    """Waits for the first chunk of a streamed body, closing the response on failure"""
+    rest = response.stream.__aiter__()  # type: ignore
+    try:
+        return await asyncio.wait_for(rest.__anext__(), timeout=timeout), rest
+    except StopAsyncIteration:
+        return None, rest
+    except BaseException:
+        await response.aclose()
+        raise
+
+
+class RouterTransport(httpx.AsyncBaseTransport):
+    """Spreads requests over endpoints, ejects failing ones and fails over"""
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        strategy: RouterStrategy = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_attempts: int | None = None,
+        first_chunk_timeout: float | None = None,
+        ewma_alpha: float = 0.3,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        if not endpoints:
+            raise ValueError("RouterTransport needs at least one endpoint")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        # seconds an ejected endpoint waits before a probe request
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(endpoints)
+        # a stream with no bytes after this many seconds counts as failed
+        self.first_chunk_timeout = first_chunk_timeout
+        self.ewma_alpha = ewma_alpha
+        self._transport = transport
+        self.failovers = 0
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is None:
+            from llmtext.clients import build_transport
+
+            self._transport = build_transport()
+        return self._transport
+
+    def pick(self, exclude: set[Endpoint] | frozenset = frozenset()) -> Endpoint | None:
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if e.available(self.cooldown)]
+        if not healthy:
+            # every breaker is open, probe the one that opened first
+            chosen = min(candidates, key=lambda e: e.opened_at)
+        elif self.strategy == "round_robin":
+            # smooth weighted round robin, as in nginx
+            total = sum(e.weight for e in healthy)
+            for endpoint in healthy:
+                endpoint._current_weight += endpoint.weight
+            chosen = max(healthy, key=lambda e: e._current_weight)
+            chosen._current_weight -= total
+        else:
+            # endpoints without a latency sample yet count as the sampled average,
+            # so a cold-start burst is still spread by outstanding requests
+            sampled = [e.ewma_latency for e in healthy if e.ewma_latency is not None]
+            prior = sum(sampled) / len(sampled) if sampled else 1.0
+            chosen = min(
+                healthy,
+                key=lambda e: (e.outstanding + 1)
+                * (prior if e.ewma_latency is None else e.ewma_latency)
+                / e.weight,
+            )
+
+        if chosen.state == "open":
+            # this request probes the endpoint, its outcome closes or reopens it
+            chosen.state = "half_open"
+        return chosen
+
+    def _rewrite(self, request: httpx.Request, endpoint: Endpoint) -> httpx.Request:
+        path = request.url.raw_path.decode()
+        headers = [
+            (k, v)
+            for k, v in request.headers.multi_items()
+            if k.lower() not in ("host", "authorization")
+        ]
+        if endpoint.api_key:
+            headers.append(("authorization", f"Bearer {endpoint.api_key}"))
+        return httpx.Request(
+            request.method,
+            endpoint.base_url + path,
+            headers=headers,
+            content=request.content,
+            extensions=request.extensions,
+        )
+
+    async def _asend(
+        self, request: httpx.Request, endpoint: Endpoint, stream: bool
+    ) -> httpx.Response:
+        started = time.perf_counter()
+        endpoint.requests += 1
+        endpoint.outstanding += 1
+        response = None
+        try:
+            response = await self.transport.handle_async_request(
+                self._rewrite(request, endpoint)
+            )
+            if response.status_code in RETRYABLE_STATUS:
+                raise _EndpointFailure(f"status {response.status_code}")
+
+            first = None
+            rest = response.stream.__aiter__()  # type: ignore
+            if stream:
+                # a stream that breaks before its first chunk can still fail over
+                first, rest = await _aprefetch(response, self.first_chunk_timeout)
+        except BaseException as e:
+            endpoint.release()
+            if response is not None:
+                await response.aclose()
+            if isinstance(
+                e, (_EndpointFailure, httpx.TransportError, asyncio.TimeoutError)
+            ):
+                endpoint.record_failure(self.failure_threshold)
+                raise _EndpointFailure(f"{endpoint.name}: {e!r}") from e
+            if endpoint.state == "half_open":
+                # the probe was cancelled, the next request probes instead
+                endpoint.state = "open"
+            raise
+
+        endpoint.record_success(time.perf_counter() - started, self.ewma_alpha)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_PrefetchedStream(
+                first, rest, response.stream, endpoint.release  # type: ignore
+            ),
+            extensions=response.extensions,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        stream = _is_stream(request)
+
+        tried: set[Endpoint] = set()
+        claimed: set[Endpoint] = request.extensions.get(CLAIMED_ENDPOINTS, set())
+        last_error: Exception | None = None
+        for attempt in range(self.max_attempts):
+            endpoint = self.pick(tried | claimed) or self.pick(tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint)
+            claimed.add(endpoint)
+            if attempt:
+                self.failovers += 1
+                logger.info(f"Failing over to endpoint {endpoint.name}")
+            try:
+                return await self._asend(request, endpoint, stream)
+            except _EndpointFailure as e:
+                last_error = e
+                logger.warning(f"Endpoint failed: {e}")
+
+        # let the openai client see a connection error and apply its own retries
+        raise httpx.ConnectError(
+            f"All endpoints failed, last error: {last_error}", request=request
+        )
+
+    def stats(self) -> list[EndpointStats]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+def router_client(
+    endpoints: "list[Endpoint] | RouterTransport",
+    strategy: RouterStrategy = "least_outstanding",
+    **kwargs,
+) -> "AsyncOpenAI":
+    """An AsyncOpenAI that routes every request through a RouterTransport"""
+    from openai import AsyncOpenAI
+
+    from llmtext.clients import _build_http_client
+
+    transport = (
+        endpoints
+        if isinstance(endpoints, RouterTransport)
+        else RouterTransport(endpoints, strategy=strategy, **kwargs)
+    )
+    return AsyncOpenAI(
+        # each endpoint brings its own key, this one is replaced on every request
+        api_key="router",
+        base_url=ROUTER_BASE_URL,
+        http_client=_build_http_client(transport=transport),
+    )
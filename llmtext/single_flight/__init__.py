@@ -0,0 +1,100 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Generic, TypeVar
+
+R = TypeVar("R")
+
+
+class _Broadcast(Generic[R]):
+    def __init__(self, source: AsyncIterator[R]):
+        self.chunks: list[R] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._apump(source))
+
+    async def _apump(self, source: AsyncIterator[R]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def asubscribe(self) -> AsyncGenerator[R, None]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # nobody is listening anymore, release the upstream connection
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one upstream call"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _Broadcast] = {}
+
+    @staticmethod
+    def _forget(calls: dict, key: str, done: asyncio.Future) -> None:
+        entry = calls.get(key)
+        if entry is done or getattr(entry, "task", None) is done:
+            del calls[key]
+        if not done.cancelled():
+            done.exception()
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[R]]) -> R:
+        call = self._calls.get(key)
+        if call is None:
+            self.leaders += 1
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        else:
+            self.followers += 1
+
+        # one caller giving up must not cancel the call for everyone else
+        return await asyncio.shield(call)
+
+    async def astream(
+        self, key: str, fn: Callable[[], AsyncIterator[R]]
+    ) -> AsyncGenerator[R, None]:
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.done:
+            self.leaders += 1
+            broadcast = _Broadcast(fn())
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(
+                lambda done: self._forget(self._streams, key, done)
+            )
+        else:
+            self.followers += 1
+
+        async for chunk in broadcast.asubscribe():
+            yield chunk
@@ -0,0 +1,431 @@
+import bisect
+from collections import deque
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from functools import wraps
+from inspect import isasyncgenfunction
+from typing import Any, AsyncGenerator, Callable, Iterator, TypedDict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed operation with its attributes, e.g. an LLM call or an agent phase"""
+
+    __slots__ = (
+        "telemetry",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        telemetry: "Telemetry",
+        name: str,
+        parent: "Span | None" = None,
+        attributes: dict[str, Any] | None = None,
+    ):
+        self.telemetry = telemetry
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes: dict[str, Any] = attributes or {}
+        self._token: Token | None = None
+
+    @property
+    def duration(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def end(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        try:
+            self.telemetry.on_end(self)
+        except Exception as e:
+            logger.warning(f"Telemetry hook failed for {self.name}: {e}")
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        self.end()
+
+
+class NoopSpan:
+    """Stands in for Span when telemetry is off, every method does nothing"""
+
+    __slots__ = ()
+
+    name = ""
+    attributes: dict[str, Any] = {}
+    duration = 0.0
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+_current_span: ContextVar[Span | None] = ContextVar("llmtext_span", default=None)
+
+
+class Telemetry:
+    """Receives finished spans; this default drops them and creates none"""
+
+    enabled = False
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+class MultiTelemetry(Telemetry):
+    """Sends every span to several telemetry sinks"""
+
+    enabled = True
+
+    def __init__(self, *sinks: Telemetry):
+        self.sinks = list(sinks)
+
+    def on_end(self, span: Span) -> None:
+        for sink in self.sinks:
+            sink.on_end(span)
+
+
+_telemetry: Telemetry = Telemetry()
+
+
+def configure_telemetry(telemetry: Telemetry | None) -> None:
+    global _telemetry
+    _telemetry = telemetry or Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    return _telemetry
+
+
+def start_span(
+    name: str, parent: Span | NoopSpan | None = None, **attributes: Any
+) -> Span | NoopSpan:
+    """Starts a span; use it with `with` to make it the parent of spans started inside"""
+    telemetry = _telemetry
+    if not telemetry.enabled:
+        return NOOP_SPAN
+    if parent is None or isinstance(parent, NoopSpan):
+        parent = _current_span.get()
+    return Span(telemetry, name, parent=parent, attributes=attributes)
+
+
+def current_span() -> Span | NoopSpan:
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def use_span(span: Span | NoopSpan) -> Iterator[Span | NoopSpan]:
+    """Makes span the current span without ending it; do not yield to callers inside"""
+    if isinstance(span, NoopSpan):
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Wraps an LLM call in a span; streams also get ttft, chunks and tokens_per_second"""
+
+    def decorator(fn: F) -> F:
+        if isasyncgenfunction(fn):
+
+            @wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                if not _telemetry.enabled:
+                    return fn(*args, **kwargs)
+                span = start_span(name, model=kwargs.get("model"))
+                return _atraced_stream(span, fn(*args, **kwargs))
+
+            return stream_wrapper  # type: ignore
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _telemetry.enabled:
+                return fn(*args, **kwargs)
+            span = start_span(name, model=kwargs.get("model"))
+            return _atraced_call(span, fn(*args, **kwargs))
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+async def _atraced_call(span: Span | NoopSpan, awaitable: Any) -> Any:
+    with span:
+        return await awaitable
+
+
+async def _atraced_stream(
+    span: Span | NoopSpan, stream: AsyncGenerator[Any, None]
+) -> AsyncGenerator[Any, None]:
+    first = None
+    chunks = 0
+    try:
+        while True:
+            # the span is current only while the stream runs, never across a yield
+            with use_span(span):
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+            if first is None:
+                first = time.perf_counter()
+                span.set("ttft", span.duration)
+            chunks += 1
+            yield chunk
+    except Exception as e:
+        span.set("error", type(e).__name__)
+        raise
+    finally:
+        await stream.aclose()
+        span.set("chunks", chunks)
+        completion_tokens = span.attributes.get("completion_tokens")
+        if first is not None and completion_tokens:
+            elapsed = time.perf_counter() - first
+            if elapsed > 0:
+                span.set("tokens_per_second", completion_tokens / elapsed)
+        span.end()
+
+
+class HistogramSummary(TypedDict):
+    count: int
+    sum: float
+    min: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+
+
+class Histogram:
+    """Fixed log-scale buckets, constant memory however many values are recorded"""
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def record(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                # the bucket's upper bound, clamped to what was actually seen
+                upper = self.bounds[bucket] if bucket < len(self.bounds) else self.max
+                return max(self.min, min(upper, self.max))
+        return self.max
+
+    def summary(self) -> HistogramSummary:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+        }
+
+
+def log_buckets(
+    start: float = 1e-4, end: float = 1e6, per_decade: int = 10
+) -> list[float]:
+    bounds = []
+    value = start
+    while value <= end:
+        bounds.append(value)
+        value *= 10 ** (1 / per_decade)
+    return bounds
+
+
+class HistogramTelemetry(Telemetry):
+    """Aggregates span durations and numeric attributes into per-name histograms"""
+
+    enabled = True
+
+    def __init__(self, bounds: list[float] | None = None):
+        self.bounds = bounds or log_buckets()
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, metric: str, value: float) -> None:
+        histogram = self.histograms.get((name, metric))
+        if histogram is None:
+            histogram = self.histograms[(name, metric)] = Histogram(self.bounds)
+        histogram.record(value)
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            self._record(span.name, "duration", span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._record(span.name, key, value)
+
+    def summary(self) -> dict[str, dict[str, HistogramSummary]]:
+        summary: dict[str, dict[str, HistogramSummary]] = {}
+        with self._lock:
+            for (name, metric), histogram in sorted(self.histograms.items()):
+                summary.setdefault(name, {})[metric] = histogram.summary()
+        return summary
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPJsonExporter(Telemetry):
+    """Buffers spans and writes them as OTLP/JSON trace requests, one per line"""
+
+    enabled = True
+
+    def __init__(
+        self,
+        path: str | None = None,
+        service_name: str = "llmtext",
+        max_batch: int = 512,
+        max_buffered: int = 10_000,
+    ):
+        self.path = path
+        self.service_name = service_name
+        self.max_batch = max_batch
+        # without a path spans wait for flush(), the oldest are dropped past this
+        self.spans: deque[Span] = deque(maxlen=max_buffered)
+        self.exported = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            if len(self.spans) == self.spans.maxlen:
+                self.dropped += 1
+            self.spans.append(span)
+            full = len(self.spans) >= self.max_batch
+        if full and self.path is not None:
+            self.flush()
+
+    def to_otlp(self, spans: list[Span]) -> dict[str, Any]:
+        """The ExportTraceServiceRequest body accepted by OTLP/HTTP collectors at /v1/traces"""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "llmtext"},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_id or "",
+                                    "name": span.name,
+                                    # SPAN_KIND_INTERNAL
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span.start_ns),
+                                    "endTimeUnixNano": str(span.end_ns),
+                                    "attributes": [
+                                        {"key": key, "value": _otlp_value(value)}
+                                        for key, value in span.attributes.items()
+                                    ],
+                                    "status": {
+                                        "code": 2 if "error" in span.attributes else 0
+                                    },
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def flush(self) -> dict[str, Any] | None:
+        with self._lock:
+            spans = list(self.spans)
+            self.spans.clear()
+        if not spans:
+            return None
+
+        request = self.to_otlp(spans)
+        if self.path is not None:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request) + "\n")
+        self.exported += len(spans)
+        return request
@@ -1,66 +1,92 @@
-import os
-from openai import AsyncOpenAI
+from __future__ import annotations
+
 from pydantic import BaseModel
-from typing import AsyncGenerator, AsyncIterable, Type
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterable, Type
 from typing import TypeVar
-import instructor
+from llmtext import completion_fns
+from llmtext.clients import get_client, get_model
+from llmtext.rate_limit import Priority, RateLimiter
+from llmtext.single_flight import SingleFlight
+from llmtext.cache import ResponseCache
+
+if TYPE_CHECKING:
+    import instructor
+    from openai import AsyncOpenAI
 
 T = TypeVar("T", bound=BaseModel)
 
 
 async def agenerate(
     text: str,
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_API_BASE_URL")
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> str:
-    response = await client.chat.completions.create(
-        model=model,
+    return await completion_fns.agenerate(
         messages=[{"role": "user", "content": text}],
+        client=client or get_client(),
+        model=model or get_model(),
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
         **kwargs,
     )
-    return response.choices[0].message.content or ""
 
 
 async def astream_generate(
     text: str,
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_API_BASE_URL")
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> AsyncGenerator[str, None]:
-    stream = await client.chat.completions.create(
-        model=model,
+    stream = completion_fns.astream_generate(
         messages=[{"role": "user", "content": text}],
-        stream=True,
+        client=client or get_client(),
+        model=model or get_model(),
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
         **kwargs,
     )
 
     async for chunk in stream:
-        yield chunk.choices[0].delta.content or ""
+        yield chunk
 
 
 async def astructured_extraction(
     text: str,
     output_class: Type[T],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_API_BASE_URL")
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
     max_retries: int = 3,
     temperature: float = 0.0,
-    instructor_mode: instructor.Mode = instructor.Mode.MD_JSON,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> T:
-    structured_client = instructor.from_openai(client, mode=instructor_mode)
-
-    response = await structured_client.chat.completions.create(
-        model=model,
+    response = await completion_fns.astructured_extraction(
         messages=[{"role": "user", "content": text}],
-        response_model=output_class,
+        output_class=output_class,
+        client=client or get_client(),
+        model=model or get_model(),
+        instructor_mode=instructor_mode,
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
         max_retries=max_retries,
         temperature=temperature,
         **kwargs,
@@ -72,27 +98,30 @@ async def astructured_extraction(
 async def astream_structured_extraction(
     text: str,
     output_class: type[T],
-    client=AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_API_BASE_URL")
-    ),
-    model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    client: AsyncOpenAI | None = None,
+    model: str | None = None,
     max_retries: int = 3,
     temperature: float = 0.0,
-    instructor_mode: instructor.Mode = instructor.Mode.MD_JSON,
+    instructor_mode: instructor.Mode | None = None,
+    cache: ResponseCache | None = None,
+    rate_limiter: RateLimiter | None = None,
+    priority: int = Priority.DEFAULT,
+    single_flight: SingleFlight | None = None,
     **kwargs,
 ) -> AsyncGenerator[T, None]:
-    structured_client = instructor.from_openai(client, mode=instructor_mode)
-
-    stream: AsyncIterable[output_class] = (
-        structured_client.chat.completions.create_partial(
-            model=model,
-            response_model=output_class,
-            temperature=temperature,
-            max_retries=max_retries,
-            messages=[{"role": "user", "content": text}],
-            stream=True,
-            **kwargs,
-        )
+    stream: AsyncIterable[output_class] = completion_fns.astream_structured_extraction(
+        messages=[{"role": "user", "content": text}],
+        output_class=output_class,
+        client=client or get_client(),
+        model=model or get_model(),
+        instructor_mode=instructor_mode,
+        cache=cache,
+        rate_limiter=rate_limiter,
+        priority=priority,
+        single_flight=single_flight,
+        temperature=temperature,
+        max_retries=max_retries,
+        **kwargs,
     )
 
     return stream
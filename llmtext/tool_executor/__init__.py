@@ -0,0 +1,145 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+
+from llmtext.telemetry import start_span
+from llmtext.types import RunnableTool, ToolOutput
+
+logger = logging.getLogger(__name__)
+
+
+def _run_tool(tool: RunnableTool) -> str:
+    return tool._run()
+
+
+class ToolExecutor:
+    """Runs tools with concurrency limits, timeouts and thread/process offload"""
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        timeout_seconds: float | None = None,
+        max_threads: int | None = None,
+        max_processes: int | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        # used for tools that do not set their own timeout_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+
+        self.timeouts = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._global: asyncio.Semaphore | None = None
+        self._per_tool: dict[type, asyncio.Semaphore] = {}
+        self._threads: ThreadPoolExecutor | None = None
+        self._processes: ProcessPoolExecutor | None = None
+
+    def _semaphores(self, tool: RunnableTool) -> list[asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # semaphores belong to the loop they were first used on
+            self._loop = loop
+            self._global = None
+            self._per_tool = {}
+
+        semaphores = []
+        if self.max_concurrency:
+            if self._global is None:
+                self._global = asyncio.Semaphore(self.max_concurrency)
+            semaphores.append(self._global)
+
+        tool_class = type(tool)
+        if tool_class.max_concurrency:
+            if tool_class not in self._per_tool:
+                self._per_tool[tool_class] = asyncio.Semaphore(
+                    tool_class.max_concurrency
+                )
+            semaphores.append(self._per_tool[tool_class])
+        return semaphores
+
+    def _pool(self, run_in: str) -> Executor:
+        if run_in == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_processes)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=self.max_threads, thread_name_prefix="llmtext-tool"
+            )
+        return self._threads
+
+    async def _aexecute(self, tool: RunnableTool) -> str:
+        if tool.run_in == "event_loop":
+            return await tool._arun()
+        # a timed out thread or process keeps running, only the wait is cancelled
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool(tool.run_in), _run_tool, tool
+        )
+
+    async def arun(self, tool: RunnableTool) -> ToolOutput:
+        with start_span("tool", tool=type(tool).__name__) as span:
+            tool_output = await self._arun_cached(tool)
+            span.set("queue_time", tool_output["queue_time"])
+            span.set("execution_time", tool_output["execution_time"])
+            if "cached" in tool_output:
+                span.set("cached", tool_output["cached"])
+            return tool_output
+
+    async def _arun_cached(self, tool: RunnableTool) -> ToolOutput:
+        if tool.result_cache is None:
+            return await self._arun_limited(tool)
+
+        # cache hits and shared calls do not wait for a concurrency slot
+        started = time.perf_counter()
+        executed: list[ToolOutput] = []
+
+        async def aexecute() -> str:
+            tool_output = await self._arun_limited(tool)
+            executed.append(tool_output)
+            return tool_output["output"]
+
+        output, cached = await tool.result_cache.acall(tool, aexecute)
+        if executed:
+            tool_output = executed[0]
+        else:
+            tool_output = tool.to_tool_output(output)
+            tool_output["queue_time"] = 0.0
+            tool_output["execution_time"] = time.perf_counter() - started
+        tool_output["cached"] = cached
+        return tool_output
+
+    async def _arun_limited(self, tool: RunnableTool) -> ToolOutput:
+        timeout = (
+            tool.timeout_seconds
+            if tool.timeout_seconds is not None
+            else self.timeout_seconds
+        )
+
+        queued = time.perf_counter()
+        async with AsyncExitStack() as slots:
+            for semaphore in self._semaphores(tool):
+                await slots.enter_async_context(semaphore)
+
+            started = time.perf_counter()
+            try:
+                output = await asyncio.wait_for(self._aexecute(tool), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Tool {type(tool).__name__} timed out after {timeout}s")
+                raise
+
+        tool_output = tool.to_tool_output(output)
+        tool_output["queue_time"] = started - queued
+        tool_output["execution_time"] = time.perf_counter() - started
+        return tool_output
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=wait)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+            self._processes = None
@@ -1,8 +1,22 @@
 from abc import abstractmethod
-from typing import Annotated, Any
-from typing import Literal, TypedDict
+import asyncio
+import sys
+from typing import TYPE_CHECKING, Annotated, Any, ClassVar
+from typing import Literal
 from pydantic import BaseModel, Field
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+if sys.version_info >= (3, 11):
+    from typing import NotRequired, TypedDict
+else:
+    # installed with pydantic
+    from typing_extensions import NotRequired, TypedDict
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+    from llmtext.cache import ToolResultCache
 
 
 class ToolOutput(TypedDict):
@@ -11,6 +25,11 @@ class ToolOutput(TypedDict):
     description: str
     params: dict[str, Any]
     output: str
+    # seconds spent waiting for a concurrency slot, and running
+    queue_time: NotRequired[float]
+    execution_time: NotRequired[float]
+    # set for tools with a result_cache, True when the output was reused
+    cached: NotRequired[bool]
 
 
 class ToolCall(TypedDict):
@@ -32,7 +51,42 @@ class Message(TypedDict):
 
 class Checkpoint(TypedDict):
     type: Literal["checkpoint"]
-    messages: list[ChatCompletionMessageParam]
+    id: str
+    parent_id: str | None
+    # messages holds the history from offset on; a snapshot starts at 0
+    offset: int
+    messages: list["ChatCompletionMessageParam"]
+    tool_output_indices: list[int]
+    snapshot: bool
+
+
+class StepTiming(TypedDict):
+    type: Literal["step_timing"]
+    evaluator: float
+    tool_selector: float | None
+    tools: float
+    chat: float
+    total: float
+    critical_path: list[str]
+
+
+class EvaluationRecord(TypedDict):
+    run_id: str
+    candidate_id: str
+    prompt: str
+    score: float
+    # model output for each example input, in order; with successive halving short
+    # of all examples, for the minibatch the prompt reached, in the race's order
+    outputs: list[str]
+    # how many examples the score and outputs cover
+    examples: int
+    # seconds spent writing the prompt, running it on the examples, and scoring
+    generation_time: float
+    run_time: float
+    scoring_time: float
+    created_at: float
+    # candidate_id of the prompt this one was collapsed into, reusing its evaluation
+    duplicate_of: str | None
 
 
 class Event(TypedDict):
@@ -44,16 +98,48 @@ class Event(TypedDict):
         "message",
         "evaluation",
         "checkpoint",
+        "step_timing",
     ]
     id: str
-    content: ToolCall | ToolOutput | Message | Evaluation | Checkpoint
+    content: ToolCall | ToolOutput | Message | Evaluation | Checkpoint | StepTiming
+
+
+class MessageDelta:
+    """Compact message_stream event, yielded instead of Event when compact_events is on"""
+
+    __slots__ = ("id", "step", "content")
+    type: ClassVar[Literal["message_stream"]] = "message_stream"
+
+    def __init__(self, id: str, step: int, content: str):
+        self.id = id
+        self.step = step
+        self.content = content
+
+    def to_event(self) -> Event:
+        return Event(
+            id=self.id,
+            step=self.step,
+            type="message_stream",
+            content=Message(role="assistant", content=self.content),
+        )
 
 
 class RunnableTool(BaseModel):
+    # how ToolExecutor runs the tool: "thread" and "process" call _run in a pool
+    run_in: ClassVar[Literal["event_loop", "thread", "process"]] = "event_loop"
+    timeout_seconds: ClassVar[float | None] = None
+    max_concurrency: ClassVar[int | None] = None
+    # opt-in memoization of outputs by tool class and params
+    result_cache: ClassVar["ToolResultCache | None"] = None
+
     @abstractmethod
     async def _arun(self) -> str:
         pass
 
+    def _run(self) -> str:
+        # override with blocking code for tools that run in a thread or process
+        return asyncio.run(self._arun())
+
     def to_tool_call(self) -> ToolCall:
         tool_name = self.__class__.__name__
         return {
@@ -63,16 +149,25 @@ class RunnableTool(BaseModel):
             "params": self.model_dump(),
         }
 
-    async def acall_and_return_tool_output(self) -> ToolOutput:
+    def to_tool_output(self, output: str) -> ToolOutput:
         tool_name = self.__class__.__name__
         return {
             "type": "tool_output",
             "name": tool_name,
             "description": self.__doc__ or "",
             "params": self.model_dump(),
-            "output": await self._arun(),
+            "output": output,
         }
 
+    async def acall_and_return_tool_output(self) -> ToolOutput:
+        if self.result_cache is None:
+            return self.to_tool_output(await self._arun())
+
+        output, cached = await self.result_cache.acall(self, self._arun)
+        tool_output = self.to_tool_output(output)
+        tool_output["cached"] = cached
+        return tool_output
+
 
 class ToolSelector(BaseModel):
     """Selected tools"""
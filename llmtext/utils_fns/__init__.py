@@ -1,12 +1,21 @@
-from typing import Type, Union, Annotated
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from pydantic import BaseModel, Field
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Type, TypeVar, Union, Annotated
+from pydantic import BaseModel, Field, RootModel
+from llmtext.telemetry import current_span
 from llmtext.types import Message, RunnableTool
 
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
+T = TypeVar("T", bound=BaseModel)
+
 
 def messages_to_openai_messages(
     messages: list[Message],
-) -> list[ChatCompletionMessageParam]:
+) -> list["ChatCompletionMessageParam"]:
     parsed_messages = []
     for message in messages:
         parsed_messages.append({"role": message["role"], "content": message["content"]})
@@ -17,7 +26,11 @@ def tools_to_tool_selector(
     tools: list[Type[RunnableTool]],
     prompt: str = "Selected tools to call in order to give the best response to user's query",
 ):
-    tuple_tools = tuple(tools)
+    return _tools_to_tool_selector(tuple(tools), prompt)
+
+
+@lru_cache(maxsize=256)
+def _tools_to_tool_selector(tuple_tools: tuple[Type[RunnableTool], ...], prompt: str):
     tools = list[Union[*tuple_tools]]  # type: ignore
 
     class ToolSelector(BaseModel):
@@ -26,3 +39,98 @@ def tools_to_tool_selector(
         tool_calls: Annotated[tools, Field(description="Tools to call")] = []  # type: ignore
 
     return ToolSelector
+
+
+def tools_to_tool_call_model(
+    tools: list[Type[RunnableTool]],
+    prompt: str = "Selected tool to call in order to give the best response to user's query",
+) -> Type[RootModel]:
+    """A single-tool model, for streaming tool calls one by one; the tool is in .root"""
+    return _tools_to_tool_call_model(tuple(tools), prompt)
+
+
+@lru_cache(maxsize=256)
+def _tools_to_tool_call_model(
+    tuple_tools: tuple[Type[RunnableTool], ...], prompt: str
+) -> Type[RootModel]:
+    # a bare Union has no model_validate_json, which instructor's iterable parsing needs
+    class SelectedTool(RootModel[Union[*tuple_tools]]):  # type: ignore
+        pass
+
+    SelectedTool.__doc__ = prompt
+    return SelectedTool
+
+
+@lru_cache(maxsize=1024)
+def output_class_schema(output_class: Type[BaseModel]) -> dict[str, Any]:
+    """JSON schema of output_class, generated once; treat the result as read-only"""
+    return output_class.model_json_schema()
+
+
+def _freeze_schema(model: Type[BaseModel]) -> None:
+    # pydantic regenerates the schema on every call, instructor asks for it per request
+    schema = model.model_json_schema()
+
+    def model_json_schema(cls, *args, **kwargs) -> dict[str, Any]:
+        if cls is not model or args or kwargs:
+            return super(model, cls).model_json_schema(*args, **kwargs)
+        # instructor edits the schema it is given, so hand out a copy
+        return _copy_schema(schema)
+
+    model.model_json_schema = classmethod(model_json_schema)  # type: ignore
+
+
+def _time_validation(model: Type[BaseModel]) -> None:
+    # instructor parses and validates the completion in from_response
+    from_response = model.from_response.__func__  # type: ignore
+
+    def timed_from_response(cls, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return from_response(cls, *args, **kwargs)
+        finally:
+            current_span().add("validation_time", time.perf_counter() - started)
+
+    model.from_response = classmethod(timed_from_response)  # type: ignore
+
+
+def _copy_schema(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _copy_schema(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_schema(v) for v in value]
+    return value
+
+
+@lru_cache(maxsize=1024)
+def to_response_model(output_class: Type[T]) -> Type[T]:
+    """The instructor response model for output_class, built once per class"""
+    from instructor.function_calls import OpenAISchema, openai_schema
+
+    if issubclass(output_class, OpenAISchema):
+        return output_class
+
+    response_model = openai_schema(output_class)
+    _freeze_schema(response_model)
+    _time_validation(response_model)
+    return response_model  # type: ignore
+
+
+@lru_cache(maxsize=1024)
+def to_partial_response_model(output_class: Type[T]) -> Type[T]:
+    """The streaming (Partial) response model for output_class, built once per class"""
+    from instructor import Partial
+
+    response_model = Partial[to_response_model(output_class)]  # type: ignore
+    _freeze_schema(response_model)
+    return response_model
+
+
+@lru_cache(maxsize=1024)
+def to_iterable_response_model(output_class: Type[T]) -> Type[BaseModel]:
+    """The streaming list-of-output_class response model, built once per class"""
+    from instructor.dsl.iterable import IterableModel
+
+    response_model = IterableModel(output_class)
+    _freeze_schema(response_model)
+    return response_model
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import sys
+import time
+
+from llmtext.agent import Agent
+from llmtext.types import IsFinalResponse, MessageDelta
+
+TOKENS = 20_000
+
+MODES = {
+    "per token": {},
+    "compact": {"compact_events": True},
+    "coalesce 64B": {"coalesce_bytes": 64},
+    "coalesce 64B compact": {"coalesce_bytes": 64, "compact_events": True},
+}
+
+
+class TokenStreamLLM:
+    """Stands in for LLM: streams tokens from memory so only event overhead is measured"""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+    async def astream_response_from_messages(self, messages):
+        for _ in range(self.tokens):
+            yield "tok "
+
+    async def astructured_extraction_from_messages(self, messages, output_class):
+        return IsFinalResponse(is_final_response=False)
+
+
+def serialize(event) -> bytes:
+    if isinstance(event, MessageDelta):
+        return json.dumps([event.id, event.step, event.content]).encode()
+    return json.dumps(event).encode()
+
+
+async def ameasure(tokens: int, **kwargs) -> tuple[int, float, int]:
+    llm = TokenStreamLLM(tokens)
+    agent = Agent(
+        chat_llm=llm,  # type: ignore
+        tool_selector_llm=llm,  # type: ignore
+        evaluator_llm=llm,  # type: ignore
+        messages=[{"role": "user", "content": "hi"}],
+        max_steps=2,
+        **kwargs,
+    )
+
+    events = 0
+    wire_bytes = 0
+    started = time.perf_counter()
+    async for event in agent.astream_events():
+        if isinstance(event, MessageDelta) or event["type"] == "message_stream":
+            events += 1
+            wire_bytes += len(serialize(event))
+    return events, time.perf_counter() - started, wire_bytes
+
+
+def run():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else TOKENS
+    print(f"{tokens} streamed tokens")
+    for name, kwargs in MODES.items():
+        events, elapsed, wire_bytes = asyncio.run(ameasure(tokens, **kwargs))
+        print(
+            f"{name:<22} {events:>7} events  {events / elapsed:>10,.0f} events/s  "
+            f"{elapsed / events * 1e6:6.2f} us/event  "
+            f"{elapsed / tokens * 1e6:6.2f} us/token  {wire_bytes / tokens:5.1f} B/token"
+        )
+
+
+if __name__ == "__main__":
+    run()
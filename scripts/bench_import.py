@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+MODULES = [
+    "llmtext",
+    "llmtext.llm",
+    "llmtext.agent",
+    "llmtext.messages_fns",
+    "llmtext.texts_fns",
+    "llmtext.prompt_optimizer",
+]
+
+HEAVY_MODULES = ["openai", "instructor", "dotenv"]
+
+
+def measure(module: str, repeat: int = 5) -> tuple[float, list[str]]:
+    code = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy))\n"
+    )
+    timings = []
+    heavy: list[str] = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        heavy = output[1].split(",") if len(output) > 1 else []
+    return min(timings), heavy
+
+
+def run():
+    for module in MODULES:
+        elapsed, heavy = measure(module)
+        print(
+            f"{module:<28} {elapsed * 1000:8.1f} ms  eager: {', '.join(heavy) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    run()
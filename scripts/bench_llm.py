@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from typing import Any, Awaitable, Callable, TypedDict
+
+from pydantic import BaseModel
+
+from llmtext import clients, messages_fns
+from llmtext.agent import Agent
+from llmtext.llm import LLM
+from llmtext.types import Message
+from scripts.mock_server import MockServer
+
+MODEL = "mock-model"
+
+
+class Person(BaseModel):
+    name: str
+    age: int
+
+
+class LevelResult(TypedDict):
+    scenario: str
+    concurrency: int
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    cpu_ms_per_request: float
+
+
+async def _aconsume(stream) -> None:
+    async for _ in stream:
+        pass
+
+
+def scenarios(llm: LLM) -> dict[str, Callable[[], Awaitable[Any]]]:
+    messages = [{"role": "user", "content": "Ann is 30"}]
+    return {
+        "llm.generate": lambda: llm.agenerate_response_from_text("hi"),
+        "llm.stream": lambda: _aconsume(llm.astream_response_from_messages(messages)),
+        "messages_fns": lambda: messages_fns.agenerate(
+            messages=[Message(role="user", content="hi")],
+            client=llm.client,
+            model=MODEL,
+        ),
+        "structured": lambda: llm.astructured_extraction_from_messages(
+            messages=messages, output_class=Person
+        ),
+        # one step: evaluation, then a streamed answer
+        "agent": lambda: _aconsume(
+            Agent(
+                chat_llm=llm,
+                tool_selector_llm=llm,
+                evaluator_llm=llm,
+                messages=list(messages),
+                max_steps=2,
+            ).astream_events()
+        ),
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[round(q * (len(ordered) - 1))]
+
+
+async def ameasure(
+    name: str, call: Callable[[], Awaitable[Any]], concurrency: int, requests: int
+) -> LevelResult:
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def aone() -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call()
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    await asyncio.gather(*[aone() for _ in range(requests)])
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "cpu_ms_per_request": cpu / requests * 1000,
+    }
+
+
+def _serve(ready, options: dict[str, Any]) -> None:
+    async def aserve() -> None:
+        server = MockServer(**options)
+        await server.astart()
+        ready.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(aserve())
+
+
+def start_server(**options: Any) -> tuple[multiprocessing.Process, str]:
+    """Runs the mock server in its own process so its CPU is not counted"""
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=_serve, args=(ready, options), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ready.get(timeout=30)}/v1"
+
+
+async def abench(
+    base_url: str,
+    concurrency: list[int],
+    requests: int | None,
+    names: list[str] | None,
+) -> list[LevelResult]:
+    clients.configure_pool(
+        max_connections=max(concurrency), max_keepalive_connections=max(concurrency)
+    )
+    llm = LLM(base_url=base_url, api_key="bench", model=MODEL)
+
+    results = []
+    for name, call in scenarios(llm).items():
+        if names and name not in names:
+            continue
+        for _ in range(3):
+            await call()
+        for level in concurrency:
+            total = requests or max(100, 2 * level)
+            result = await ameasure(name, call, level, total)
+            print(format_result(result), flush=True)
+            results.append(result)
+
+    await clients.aclose_clients()
+    return results
+
+
+def format_result(result: LevelResult) -> str:
+    return (
+        f"{result['scenario']:<14} c={result['concurrency']:<5} "
+        f"n={result['requests']:<6} err={result['errors']:<4} "
+        f"{result['throughput']:>9,.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+        f"cpu {result['cpu_ms_per_request']:>6.2f} ms/req"
+    )
+
+
+def compare(
+    results: list[LevelResult], baseline: list[LevelResult], tolerance: float
+) -> list[str]:
+    """Levels whose CPU per request grew by more than tolerance over the baseline"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        limit = before["cpu_ms_per_request"] * (1 + tolerance)
+        if result["cpu_ms_per_request"] > limit:
+            regressions.append(
+                f"{result['scenario']} c={result['concurrency']}: "
+                f"{result['cpu_ms_per_request']:.2f} > {limit:.2f} ms/req"
+            )
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline llmtext benchmarks")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--scenario", action="append", dest="scenarios")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="fail if CPU/request regresses against it")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def run(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    process, base_url = start_server(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+    )
+    try:
+        results = asyncio.run(
+            abench(base_url, args.concurrency, args.requests, args.scenarios)
+        )
+    finally:
+        process.terminate()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
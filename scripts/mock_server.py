@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Callable
+
+REPLY = "The quick brown fox jumps over the lazy dog and keeps on running"
+
+SCHEMA_MARKER = "json_schema:"
+
+
+def sample_from_schema(schema: dict[str, Any]) -> Any:
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {
+            name: sample_from_schema(prop)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return []
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        # False keeps an agent going past its IsFinalResponse check
+        return False
+    if kind == "string":
+        return "mock"
+    return None
+
+
+def default_reply(body: dict[str, Any]) -> str:
+    """Plain text, or an instance of the json_schema instructor put in the prompt"""
+    messages = body.get("messages") or [{}]
+    system = str(messages[0].get("content") or "")
+    if SCHEMA_MARKER in system:
+        start = system.index("{", system.index(SCHEMA_MARKER))
+        schema, _ = json.JSONDecoder().raw_decode(system, start)
+        return json.dumps(sample_from_schema(schema))
+    return REPLY
+
+
+class MockServer:
+    """OpenAI-compatible chat completions server on asyncio streams, for benchmarks"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        tokens_per_second: float | None = None,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        reply: Callable[[dict[str, Any]], str] = default_reply,
+        seed: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        # seconds before the response starts, then one token per 1 / tokens_per_second
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = reply
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def astart(self) -> None:
+        self._server = await asyncio.start_server(
+            self._ahandle, self.host, self.port, backlog=4096
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _ahandle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                raw = await reader.readexactly(length) if length else b""
+                method, path = head.split(b" ", 2)[:2]
+                await self._arespond(writer, method, path.decode(), raw)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _arespond(
+        self, writer: asyncio.StreamWriter, method: bytes, path: str, raw: bytes
+    ) -> None:
+        if method != b"POST" or not path.endswith("/chat/completions"):
+            self._write(writer, 200 if method == b"HEAD" else 404, b"{}", method)
+            await writer.drain()
+            return
+
+        self.requests += 1
+        body = json.loads(raw)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            error = {"error": {"message": "injected", "type": "mock"}}
+            self._write(writer, self.error_status, json.dumps(error).encode(), method)
+            await writer.drain()
+            return
+
+        content = self.reply(body)
+        model = body.get("model", "mock")
+        if not body.get("stream"):
+            await self._await_tokens(len(content.split()))
+            self._write(writer, 200, json.dumps(completion(content, model)).encode())
+            await writer.drain()
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+            b"transfer-encoding: chunked\r\n\r\n"
+        )
+        for token in tokenize(content):
+            await self._await_tokens(1)
+            self._write_chunk(writer, f"data: {json.dumps(chunk(token, model))}\n\n")
+            await writer.drain()
+        self._write_chunk(writer, "data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _await_tokens(self, tokens: int) -> None:
+        if self.tokens_per_second:
+            await asyncio.sleep(tokens / self.tokens_per_second)
+
+    @staticmethod
+    def _write(
+        writer: asyncio.StreamWriter, status: int, body: bytes, method: bytes = b"POST"
+    ) -> None:
+        headers = {429: "retry-after-ms: 10\r\n"}.get(status, "")
+        writer.write(
+            f"HTTP/1.1 {status} MOCK\r\ncontent-type: application/json\r\n{headers}"
+            f"content-length: {len(body)}\r\n\r\n".encode()
+            + (b"" if method == b"HEAD" else body)
+        )
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: str) -> None:
+        encoded = data.encode()
+        writer.write(f"{len(encoded):x}\r\n".encode() + encoded + b"\r\n")
+
+
+def tokenize(content: str) -> list[str]:
+    # one word per token, keeping the spaces so the chunks join back up
+    words = content.split(" ")
+    return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+
+def completion(content: str, model: str) -> dict[str, Any]:
+    completion_tokens = len(tokenize(content))
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 10,
+            "completion_tokens": completion_tokens,
+            "total_tokens": 10 + completion_tokens,
+        },
+    }
+
+
+def chunk(content: str, model: str) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    return parser.parse_args(argv)
+
+
+async def aserve(args: argparse.Namespace) -> None:
+    server = MockServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    await server.astart()
+    print(f"Serving on {server.base_url}")
+    await asyncio.Event().wait()
+
+
+def run():
+    asyncio.run(aserve(parse_args()))
+
+
+if __name__ == "__main__":
+    run()
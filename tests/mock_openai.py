@@ -0,0 +1,198 @@
+import asyncio
+import json
+import time
+from typing import Any, Callable
+
+import httpx
+from openai import AsyncOpenAI
+
+
+def mock_client(
+    transport: httpx.AsyncBaseTransport | Callable[[httpx.Request], Any],
+    base_url: str = "http://mock.local/v1",
+) -> AsyncOpenAI:
+    """AsyncOpenAI over a transport, or over a request handler, without retries"""
+    if not isinstance(transport, httpx.AsyncBaseTransport):
+        transport = httpx.MockTransport(transport)
+    return AsyncOpenAI(
+        api_key="test",
+        base_url=base_url,
+        http_client=httpx.AsyncClient(transport=transport),
+        max_retries=0,
+    )
+
+
+def _completion(content: str, model: str) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+
+def _chunk(content: str, model: str) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+class MockOpenAI:
+    """In-process stand-in for the chat completions endpoint"""
+
+    def __init__(
+        self,
+        reply: str | Callable[[dict[str, Any]], str] = "hello world",
+        chunk_size: int = 4,
+        errors: list[int] | None = None,
+        latency: float = 0.0,
+        chunk_delay: float = 0.0,
+    ):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        # status codes returned, in order, before any successful completion
+        self.errors = list(errors or [])
+        self.latency = latency
+        # pause between streamed chunks, to observe work done mid-stream
+        self.chunk_delay = chunk_delay
+        self.requests: list[dict[str, Any]] = []
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self.batch_polls = 0
+
+    @property
+    def calls(self) -> int:
+        return len(self.requests)
+
+    def content_for(self, body: dict[str, Any]) -> str:
+        if callable(self.reply):
+            return self.reply(body)
+        return self.reply
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/files"):
+            return self._create_file(request)
+        if path.endswith("/content"):
+            return httpx.Response(200, content=self.files[path.split("/")[-2]])
+        if path.endswith("/batches"):
+            return self._create_batch(json.loads(request.content))
+        if "/batches/" in path:
+            return self._retrieve_batch(path.split("/")[-1])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._chat_completion(json.loads(request.content))
+
+    def _create_file(self, request: httpx.Request) -> httpx.Response:
+        # pull the jsonl lines out of the multipart upload
+        lines = [
+            line
+            for line in request.content.split(b"\r\n")
+            if line.startswith(b'{"custom_id"')
+        ]
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = b"\n".join(lines)
+        return httpx.Response(
+            200,
+            json={
+                "id": file_id,
+                "object": "file",
+                "bytes": len(self.files[file_id]),
+                "created_at": int(time.time()),
+                "filename": "batch.jsonl",
+                "purpose": "batch",
+                "status": "processed",
+            },
+        )
+
+    def _create_batch(self, body: dict[str, Any]) -> httpx.Response:
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "created_at": int(time.time()),
+            "status": "validating",
+        }
+        return httpx.Response(200, json=self.batches[batch_id])
+
+    def _retrieve_batch(self, batch_id: str) -> httpx.Response:
+        self.batch_polls += 1
+        batch = self.batches[batch_id]
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            output = []
+            for line in self.files[batch["input_file_id"]].splitlines():
+                record = json.loads(line)
+                output.append(
+                    json.dumps(
+                        {
+                            "id": f"response-{record['custom_id']}",
+                            "custom_id": record["custom_id"],
+                            "response": {
+                                "status_code": 200,
+                                "body": self._chat_completion(record["body"]).json(),
+                            },
+                            "error": None,
+                        }
+                    )
+                )
+            # results come back out of order, like the real service
+            output_id = f"file-{len(self.files)}"
+            self.files[output_id] = "\n".join(reversed(output)).encode()
+            batch["status"] = "completed"
+            batch["output_file_id"] = output_id
+        return httpx.Response(200, json=batch)
+
+    def _chat_completion(self, body: dict[str, Any]) -> httpx.Response:
+        self.requests.append(body)
+        if self.errors:
+            return httpx.Response(
+                self.errors.pop(0),
+                json={"error": {"message": "injected", "type": "mock"}},
+                headers={"retry-after-ms": "10"},
+            )
+        content = self.content_for(body)
+        model = body.get("model", "mock")
+
+        if not body.get("stream"):
+            return httpx.Response(200, json=_completion(content, model))
+
+        events = []
+        for i in range(0, len(content), self.chunk_size):
+            piece = content[i : i + self.chunk_size]
+            events.append(f"data: {json.dumps(_chunk(piece, model))}\n\n")
+        events.append("data: [DONE]\n\n")
+        if not self.chunk_delay:
+            return httpx.Response(
+                200,
+                content="".join(events).encode(),
+                headers={"content-type": "text/event-stream"},
+            )
+
+        async def adelayed():
+            for event in events:
+                await asyncio.sleep(self.chunk_delay)
+                yield event.encode()
+
+        return httpx.Response(
+            200, content=adelayed(), headers={"content-type": "text/event-stream"}
+        )
+
+    def client(self) -> AsyncOpenAI:
+        return mock_client(self.handler)
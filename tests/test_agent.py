@@ -0,0 +1,262 @@
+import asyncio
+import json
+
+import httpx
+
+from llmtext.agent import Agent
+from llmtext.llm import LLM
+from llmtext.types import MessageDelta, RunnableTool
+from tests.mock_openai import MockOpenAI, mock_client
+
+
+class Weather(RunnableTool):
+    """Looks up the weather for a city"""
+
+    city: str
+
+    async def _arun(self) -> str:
+        return f"sunny in {self.city}"
+
+
+def reply_for(is_final: bool):
+    def reply(body: dict) -> str:
+        system = body["messages"][0]["content"]
+        if "IsFinalResponse" in system:
+            return json.dumps({"is_final_response": is_final})
+        if "tool_calls" in system:
+            return json.dumps({"tool_calls": [{"city": "Paris"}]})
+        return "It is sunny in Paris."
+
+    return reply
+
+
+def make_agent(mock: MockOpenAI, max_steps: int = 2, handler=None) -> Agent:
+    # handler wraps mock.handler to hold or observe requests
+    llm = LLM(client=mock_client(handler or mock.handler), model="test-model")
+    return Agent(
+        chat_llm=llm,
+        tool_selector_llm=llm,
+        evaluator_llm=llm,
+        messages=[{"role": "user", "content": "Weather in Paris?"}],
+        tools=[Weather],
+        max_steps=max_steps,
+    )
+
+
+async def test_evaluation_and_tool_selection_overlap():
+    mock = MockOpenAI(reply=reply_for(is_final=False), latency=0.2)
+    in_flight = {"evaluator": asyncio.Event(), "selector": asyncio.Event()}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        system = json.loads(request.content)["messages"][0]["content"]
+        if "IsFinalResponse" in system:
+            mine, other = in_flight["evaluator"], in_flight["selector"]
+        elif "tool_calls" in system:
+            mine, other = in_flight["selector"], in_flight["evaluator"]
+        else:
+            return await mock.handler(request)
+        # neither request is answered before the other one was sent
+        mine.set()
+        await asyncio.wait_for(other.wait(), timeout=1.0)
+        return await mock.handler(request)
+
+    agent = make_agent(mock, handler=handler)
+
+    events = [event async for event in agent.astream_events()]
+
+    types = [event["type"] for event in events]
+    assert types[:4] == ["checkpoint", "evaluation", "tool_call", "tool_output"]
+    assert types[-2:] == ["step_timing", "checkpoint"]
+    assert events[3]["content"]["output"] == "sunny in Paris"
+    assert agent.messages[-1] == {
+        "role": "assistant",
+        "content": "It is sunny in Paris.",
+    }
+
+    # three llm round trips, but evaluation and selection share one
+    assert mock.calls == 3
+
+    timing = events[-2]["content"]
+    assert timing["tool_selector"] is not None
+    assert timing["critical_path"][-1] == "chat"
+    assert (
+        timing["total"] < timing["evaluator"] + timing["tool_selector"] + timing["chat"]
+    )
+
+
+async def test_final_evaluation_cancels_tool_selection():
+    mock = MockOpenAI(reply=reply_for(is_final=True), latency=0.05)
+    agent = make_agent(mock)
+
+    events = [event async for event in agent.astream_events()]
+
+    types = [event["type"] for event in events]
+    assert types == ["checkpoint", "evaluation", "step_timing"]
+    assert events[1]["content"]["is_final"] is True
+    assert events[2]["content"]["critical_path"] == ["evaluator"]
+    assert events[2]["content"]["tool_selector"] is None
+    assert len(agent.messages) == 1
+
+
+async def test_tools_start_while_the_evaluator_is_still_running():
+    tool_started = asyncio.Event()
+    evaluated_after_tool = False
+
+    class Probe(RunnableTool):
+        """Looks up the weather for a city"""
+
+        city: str
+
+        async def _arun(self) -> str:
+            tool_started.set()
+            return "probed"
+
+    mock = MockOpenAI(reply=reply_for(is_final=False))
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal evaluated_after_tool
+        if "IsFinalResponse" in request.content.decode():
+            # the evaluator only answers once the selected tool is running
+            await asyncio.wait_for(tool_started.wait(), timeout=1.0)
+            evaluated_after_tool = True
+        return await mock.handler(request)
+
+    agent = make_agent(mock, handler=handler)
+    agent.tools = [Probe]
+
+    events = [event async for event in agent.astream_events()]
+    assert evaluated_after_tool
+    outputs = [e["content"]["output"] for e in events if e["type"] == "tool_output"]
+    assert outputs == ["probed"]
+
+
+async def test_tools_started_for_a_final_response_are_cancelled():
+    cancelled = asyncio.Event()
+
+    class Hang(RunnableTool):
+        """Looks up the weather for a city"""
+
+        city: str
+
+        async def _arun(self) -> str:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "never"
+
+    mock = MockOpenAI(reply=reply_for(is_final=True))
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if "IsFinalResponse" in request.content.decode():
+            await asyncio.sleep(0.1)
+        return await mock.handler(request)
+
+    agent = make_agent(mock, handler=handler)
+    agent.tools = [Hang]
+
+    types = [event["type"] async for event in agent.astream_events()]
+    assert types == ["checkpoint", "evaluation", "step_timing"]
+    await asyncio.wait_for(cancelled.wait(), timeout=1.0)
+
+
+def test_messages_default_is_not_shared():
+    first, second = Agent(), Agent()
+    first.messages.append({"role": "user", "content": "hi"})
+    assert second.messages == []
+
+
+class Sleep(RunnableTool):
+    """Sleeps, then reports its label"""
+
+    label: str
+    seconds: float
+
+    async def _arun(self) -> str:
+        await asyncio.sleep(self.seconds)
+        return self.label
+
+
+async def test_streamed_tool_calls_start_before_selection_finishes():
+    tasks = [
+        {"label": "first", "seconds": 0.3},
+        {"label": "second", "seconds": 0.0},
+        {"label": "third", "seconds": 0.05},
+    ]
+
+    def reply(body: dict) -> str:
+        system = body["messages"][0]["content"]
+        if "IsFinalResponse" in system:
+            return json.dumps({"is_final_response": False})
+        if "IterableSelectedTool" in system:
+            return json.dumps({"tasks": tasks})
+        return "done"
+
+    mock = MockOpenAI(reply=reply, chunk_size=8, chunk_delay=0.02)
+    agent = make_agent(mock)
+    agent.tools = [Sleep]
+    agent.stream_tool_calls = True
+
+    events = [event async for event in agent.astream_events()]
+
+    outputs = [e["content"]["output"] for e in events if e["type"] == "tool_output"]
+    assert outputs == ["first", "second", "third"]
+    calls = [e["content"]["params"] for e in events if e["type"] == "tool_call"]
+    assert calls == tasks
+    assert agent.messages[1]["content"] == "first\nsecond\nthird"
+
+    # the slow first tool ran while the rest of the selection was streaming
+    timing = next(e["content"] for e in events if e["type"] == "step_timing")
+    assert timing["tool_selector"] > 0.3
+    assert timing["tools"] < 0.2
+
+
+async def test_message_deltas_are_coalesced_and_final_message_is_filled():
+    mock = MockOpenAI(reply=reply_for(is_final=False), chunk_size=2)
+    agent = make_agent(mock)
+    agent.coalesce_bytes = 8
+
+    events = [event async for event in agent.astream_events()]
+
+    deltas = [e["content"]["content"] for e in events if e["type"] == "message_stream"]
+    assert "".join(deltas) == "It is sunny in Paris."
+    assert all(len(delta) >= 8 for delta in deltas[:-1])
+    assert len(deltas) == 3
+    message = next(e for e in events if e["type"] == "message")
+    assert message["content"]["content"] == "It is sunny in Paris."
+
+
+async def test_coalesced_deltas_are_flushed_when_the_stream_stalls():
+    agent = Agent(coalesce_seconds=0.05)
+    resume = asyncio.Event()
+    received: list[str] = []
+
+    async def stream():
+        yield "It is "
+        # nothing more arrives until the pending delta went out on its own
+        await asyncio.wait_for(resume.wait(), timeout=1.0)
+        yield "sunny."
+
+    async for delta in agent._acoalesce(stream()):
+        received.append(delta)
+        resume.set()
+
+    assert received == ["It is ", "sunny."]
+
+
+async def test_compact_events():
+    mock = MockOpenAI(reply=reply_for(is_final=False))
+    agent = make_agent(mock)
+    agent.compact_events = True
+
+    events = [event async for event in agent.astream_events()]
+
+    deltas = [e for e in events if isinstance(e, MessageDelta)]
+    assert deltas and all(e.type == "message_stream" for e in deltas)
+    assert not hasattr(deltas[0], "__dict__")
+    assert "".join(e.content for e in deltas) == "It is sunny in Paris."
+    assert deltas[0].to_event()["content"] == {
+        "role": "assistant",
+        "content": deltas[0].content,
+    }
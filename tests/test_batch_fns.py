@@ -0,0 +1,60 @@
+from pydantic import BaseModel
+
+from llmtext.batch_fns import abatch_generate
+from llmtext.llm import LLM
+from tests.mock_openai import MockOpenAI
+
+
+class Translation(BaseModel):
+    """
+    Translation
+    """
+
+    text: str
+
+
+def echo(body: dict) -> str:
+    return body["messages"][-1]["content"].upper()
+
+
+async def test_abatch_generate_keeps_input_order():
+    mock = MockOpenAI(reply=echo)
+
+    results = await abatch_generate(
+        messages_list=[
+            [{"role": "user", "content": "first"}],
+            [{"role": "user", "content": "second"}],
+            [{"role": "user", "content": "third"}],
+        ],
+        client=mock.client(),
+        model="mock",
+        poll_interval=0,
+    )
+
+    assert results == ["FIRST", "SECOND", "THIRD"]
+    assert mock.batch_polls == 2
+
+
+async def test_llm_abatch_structured_extraction_validates_results():
+    def reply(body: dict) -> str:
+        text = body["messages"][1]["content"]
+        if "broken" in text:
+            return "not json"
+        return f'```json\n{{"text": "{text[:5]}"}}\n```'
+
+    mock = MockOpenAI(reply=reply)
+    llm = LLM(client=mock.client(), model="mock")
+
+    results = await llm.abatch_structured_extraction_from_messages(
+        messages_list=[
+            [{"role": "user", "content": "hello there"}],
+            [{"role": "user", "content": "broken input"}],
+        ],
+        output_class=Translation,
+        poll_interval=0,
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], Translation)
+    assert results[0].text == "hello"
+    assert isinstance(results[1], Exception)
@@ -0,0 +1,55 @@
+from openai import AsyncOpenAI
+
+from llmtext.llm import LLM
+from scripts.bench_llm import Person, ameasure, compare, scenarios
+from scripts.mock_server import MockServer
+
+
+async def test_mock_server_speaks_chat_completions():
+    server = MockServer(tokens_per_second=1000)
+    await server.astart()
+    client = AsyncOpenAI(base_url=server.base_url, api_key="bench", max_retries=0)
+    llm = LLM(client=client, model="m")
+    try:
+        text = await llm.agenerate_response_from_text("hi")
+        chunks = [
+            chunk
+            async for chunk in llm.astream_response_from_messages(
+                [{"role": "user", "content": "hi"}]
+            )
+        ]
+        person = await llm.astructured_extraction_from_messages(
+            messages=[{"role": "user", "content": "Ann is 30"}], output_class=Person
+        )
+    finally:
+        await client.close()
+        await server.aclose()
+
+    assert text == "".join(chunks)
+    assert len(chunks) == len(text.split())
+    assert person.model_dump() == {"name": "mock", "age": 1}
+    assert server.requests == 3
+
+
+async def test_error_injection_and_measurement():
+    server = MockServer(error_rate=0.5, error_status=503)
+    await server.astart()
+    client = AsyncOpenAI(base_url=server.base_url, api_key="bench", max_retries=0)
+    try:
+        call = scenarios(LLM(client=client, model="m"))["llm.generate"]
+        result = await ameasure("llm.generate", call, concurrency=4, requests=40)
+    finally:
+        await client.close()
+        await server.aclose()
+
+    assert result["errors"] == server.errors
+    assert 0 < result["errors"] < 40
+    assert result["p50_ms"] <= result["p99_ms"]
+    assert result["throughput"] > 0 and result["cpu_ms_per_request"] > 0
+
+
+def test_compare_flags_cpu_regressions():
+    baseline = [{"scenario": "agent", "concurrency": 1, "cpu_ms_per_request": 1.0}]
+    results = [{"scenario": "agent", "concurrency": 1, "cpu_ms_per_request": 1.5}]
+    assert compare(results, baseline, tolerance=0.2)  # type: ignore
+    assert not compare(results, baseline, tolerance=0.6)  # type: ignore
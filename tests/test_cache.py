@@ -0,0 +1,145 @@
+import time
+
+from pydantic import BaseModel
+
+from llmtext.cache import (
+    LRUCache,
+    ResponseCache,
+    SimilarityCache,
+    make_cache_key,
+    normalize_text,
+)
+from llmtext.llm import LLM
+from tests.mock_openai import MockOpenAI
+
+
+class ImaginaryCountry(BaseModel):
+    """
+    ImaginaryCountry
+    """
+
+    city: str
+    country: str
+
+
+def test_make_cache_key_is_stable():
+    a = make_cache_key("m", [{"role": "user", "content": "hi"}], {"temperature": 0})
+    b = make_cache_key("m", [{"role": "user", "content": "hi"}], {"temperature": 0})
+    c = make_cache_key("m", [{"role": "user", "content": "hi"}], {"temperature": 1})
+    d = make_cache_key(
+        "m", [{"role": "user", "content": "hi"}], {"temperature": 0}, ImaginaryCountry
+    )
+    assert a == b
+    assert len({a, c, d}) == 3
+
+
+def test_lru_cache_evicts_by_size_and_ttl():
+    cache: LRUCache[str] = LRUCache(max_entries=2, ttl=0.05)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.evictions == 1
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+async def test_llm_cache_hits_and_stream_replay():
+    mock = MockOpenAI(reply="cached answer")
+    cache = ResponseCache()
+    llm = LLM(client=mock.client(), model="mock", cache=cache)
+
+    first = await llm.agenerate_response_from_messages(
+        [{"role": "user", "content": "hi"}]
+    )
+    second = await llm.agenerate_response_from_messages(
+        [{"role": "user", "content": "hi"}]
+    )
+    chunks = [
+        chunk
+        async for chunk in llm.astream_response_from_messages(
+            [{"role": "user", "content": "hi"}]
+        )
+    ]
+
+    assert first == second == "".join(chunks) == "cached answer"
+    assert mock.calls == 1
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+async def test_structured_cache_persists_to_disk(tmp_path):
+    mock = MockOpenAI(reply='```json\n{"city": "Aria", "country": "Nolandia"}\n```')
+    path = str(tmp_path / "cache.sqlite")
+
+    llm = LLM(client=mock.client(), model="mock", cache=ResponseCache(path=path))
+    first = await llm.astructured_extraction_from_text(
+        text="create an imaginary country", output_class=ImaginaryCountry
+    )
+
+    restarted = LLM(client=mock.client(), model="mock", cache=ResponseCache(path=path))
+    second = await restarted.astructured_extraction_from_text(
+        text="create an imaginary country", output_class=ImaginaryCountry
+    )
+
+    assert first.model_dump() == second.model_dump()
+    assert mock.calls == 1
+    assert restarted.cache.disk_hits == 1
+
+
+def test_normalize_text_ignores_whitespace_and_punctuation():
+    assert normalize_text("  口座を作ってください。 ") == normalize_text(
+        "口座を作ってください"
+    )
+    assert normalize_text("Hello,   World!") == "hello world"
+
+
+def test_similarity_cache_matches_near_duplicates_only():
+    cache = SimilarityCache(threshold=0.85)
+    system = {"role": "system", "content": "translate to korean"}
+    cache.set(
+        model="m",
+        messages=[system, {"role": "user", "content": "Please open a bank account."}],
+        value="계좌를 만들어 주세요",
+    )
+
+    near = cache.get(
+        model="m",
+        messages=[system, {"role": "user", "content": "please open a bank account"}],
+    )
+    other_system = cache.get(
+        model="m",
+        messages=[
+            {"role": "system", "content": "translate to english"},
+            {"role": "user", "content": "Please open a bank account."},
+        ],
+    )
+    unrelated = cache.get(
+        model="m",
+        messages=[system, {"role": "user", "content": "I lost my credit card"}],
+    )
+
+    assert near == "계좌를 만들어 주세요"
+    assert other_system is None
+    assert unrelated is None
+
+
+async def test_llm_near_duplicate_is_per_call_opt_in():
+    mock = MockOpenAI(reply="answer")
+    llm = LLM(client=mock.client(), model="mock", similarity_cache=SimilarityCache())
+
+    await llm.agenerate_response_from_text("Open an account, please!")
+    await llm.agenerate_response_from_text(
+        "open an account please", allow_near_duplicate=True
+    )
+    assert mock.calls == 2
+
+    await llm.agenerate_response_from_text(
+        "Open an account, please", allow_near_duplicate=True
+    )
+    assert mock.calls == 2
+    assert llm.similarity_cache.hits == 1
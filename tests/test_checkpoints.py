@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from llmtext.agent import Agent
+from llmtext.checkpoints import (
+    CheckpointStore,
+    FileCheckpointStore,
+    MemoryCheckpointStore,
+    SQLiteCheckpointStore,
+)
+from llmtext.llm import LLM
+from llmtext.types import Checkpoint
+from tests.mock_openai import MockOpenAI
+
+
+def reply(body: dict) -> str:
+    if "IsFinalResponse" in body["messages"][0]["content"]:
+        return json.dumps({"is_final_response": False})
+    return f"reply {len(body['messages'])}"
+
+
+def make_agent(store, max_steps: int = 5, snapshot_every: int = 3) -> Agent:
+    llm = LLM(client=MockOpenAI(reply=reply).client(), model="m")
+    return Agent(
+        chat_llm=llm,
+        tool_selector_llm=llm,
+        evaluator_llm=llm,
+        messages=[{"role": "user", "content": "hi"}],
+        max_steps=max_steps,
+        checkpoint_store=store,
+        snapshot_every=snapshot_every,
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite", "file"])
+def make_store(request, tmp_path):
+    def make():
+        if request.param == "memory":
+            return store
+        if request.param == "sqlite":
+            return SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+        return FileCheckpointStore(str(tmp_path / "checkpoints.jsonl"))
+
+    store = MemoryCheckpointStore()
+    return make
+
+
+async def test_checkpoints_are_deltas_with_periodic_snapshots(make_store):
+    agent = make_agent(make_store())
+    events = [event async for event in agent.astream_events()]
+    checkpoints = [e["content"] for e in events if e["type"] == "checkpoint"]
+
+    assert [c["snapshot"] for c in checkpoints] == [True, False, False, True, False]
+    assert [len(c["messages"]) for c in checkpoints] == [1, 1, 1, 4, 1]
+    assert checkpoints[1]["parent_id"] == checkpoints[0]["id"]
+
+    # emitted checkpoints do not change as the agent keeps going
+    assert checkpoints[0]["messages"] == [{"role": "user", "content": "hi"}]
+    assert len(agent.messages) == 5
+
+
+async def test_resume_rebuilds_state_from_any_checkpoint(make_store):
+    agent = make_agent(make_store())
+    events = [event async for event in agent.astream_events()]
+    checkpoints = [e["content"] for e in events if e["type"] == "checkpoint"]
+
+    # a fresh process reopening the same store
+    resumed = make_agent(make_store(), max_steps=2)
+    resumed.resume(checkpoints[2]["id"])
+    assert resumed.messages == agent.messages[:3]
+
+    resumed.resume(checkpoints[-1]["id"])
+    assert resumed.messages == agent.messages
+
+    more = [event async for event in resumed.astream_events()]
+    latest = [e["content"] for e in more if e["type"] == "checkpoint"][-1]
+    assert latest["parent_id"] is not None
+    assert make_store().restore(latest["id"])[0] == resumed.messages
+
+
+async def test_without_a_store_checkpoints_are_only_yielded():
+    agent = make_agent(None)
+    events = [event async for event in agent.astream_events()]
+    assert agent.checkpoint_store is None
+    assert sum(e["type"] == "checkpoint" for e in events) == 5
+    with pytest.raises(ValueError):
+        agent.resume(events[0]["id"])
+
+
+async def test_any_checkpoint_store_is_saved_through_the_interface():
+    class ListStore(CheckpointStore):
+        def __init__(self):
+            self.saved: list[Checkpoint] = []
+
+        def save(self, checkpoint: Checkpoint) -> None:
+            self.saved.append(checkpoint)
+
+        def load(self, checkpoint_id: str) -> Checkpoint:
+            return next(c for c in self.saved if c["id"] == checkpoint_id)
+
+    store = ListStore()
+    agent = make_agent(store)
+    events = [event async for event in agent.astream_events()]
+    checkpoints = [e["content"] for e in events if e["type"] == "checkpoint"]
+    assert store.saved == checkpoints
+    assert store.restore(checkpoints[-1]["id"])[0] == agent.messages
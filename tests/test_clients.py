@@ -0,0 +1,95 @@
+import asyncio
+
+from llmtext import clients
+from llmtext.llm import LLM
+
+
+class CountingServer:
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+
+    async def ahandle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+
+                body = b"{}"
+                if head.startswith(b"POST"):
+                    body = (
+                        b'{"id":"c","object":"chat.completion","created":0,'
+                        b'"model":"m","choices":[{"index":0,"finish_reason":"stop",'
+                        b'"message":{"role":"assistant","content":"warm"}}]}'
+                    )
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                    + f"content-length: {len(body)}\r\n\r\n".encode()
+                    + (b"" if head.startswith(b"HEAD") else body)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+def test_registry_shares_clients_per_endpoint(monkeypatch):
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(clients, "_env_loaded", True)
+    monkeypatch.setenv("OPENAI_API_KEY", "key-a")
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    monkeypatch.delenv("OPENAI_API_BASE_URL", raising=False)
+
+    default = clients.get_client()
+    assert clients.get_client() is default
+    assert LLM().client is default
+    assert clients.get_client(api_key="key-b") is not default
+    assert LLM(base_url="http://other.local/v1").client is not default
+    assert len(clients._clients) == 3
+
+
+def test_configure_pool_applies_to_new_clients(monkeypatch):
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(clients, "_pool_config", dict(clients._pool_config))
+    monkeypatch.setattr(clients, "_env_loaded", True)
+
+    config = clients.configure_pool(max_connections=7, keepalive_expiry=1.5)
+    assert config["max_connections"] == 7
+
+    client = clients.get_client(base_url="http://pool.local/v1", api_key="test")
+    pool = client._client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._keepalive_expiry == 1.5
+
+
+async def test_warmup_opens_reusable_connections(monkeypatch):
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(clients, "_env_loaded", True)
+
+    counter = CountingServer()
+    server = await asyncio.start_server(counter.ahandle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        client = clients.get_client(base_url=f"http://127.0.0.1:{port}/v1", api_key="t")
+        assert await clients.warmup(client, connections=3) == 3
+        assert counter.connections == 3
+
+        llm = LLM(base_url=f"http://127.0.0.1:{port}/v1", api_key="t", model="m")
+        results = await asyncio.gather(
+            *[llm.agenerate_response_from_text("hi") for _ in range(3)]
+        )
+        assert results == ["warm"] * 3
+        assert counter.connections == 3
+        assert counter.requests == 6
+    finally:
+        await clients.aclose_clients()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,119 @@
+import json
+
+from llmtext import context
+from llmtext.agent import Agent
+from llmtext.context import (
+    ContextManager,
+    RollingSummary,
+    SlidingWindow,
+    TruncateToolOutputs,
+)
+from llmtext.llm import LLM
+from tests.mock_openai import MockOpenAI
+
+
+def history(turns: int, size: int = 200) -> list[dict]:
+    messages = [{"role": "system", "content": "You are helpful."}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " + "x" * size})
+        messages.append(
+            {"role": "assistant", "content": f"answer {turn} " + "y" * size}
+        )
+    return messages
+
+
+def test_token_counts_are_incremental(monkeypatch):
+    counted = []
+    original = context.estimate_message_tokens
+    monkeypatch.setattr(
+        context,
+        "estimate_message_tokens",
+        lambda message: counted.append(message) or original(message),
+    )
+
+    manager = ContextManager(max_tokens=100_000)
+    messages = history(turns=3)
+    manager.view(messages)
+    assert len(counted) == 7
+
+    messages.append({"role": "user", "content": "one more"})
+    manager.view(messages)
+    assert len(counted) == 8
+
+
+def test_sliding_window_keeps_first_and_last_without_mutating():
+    messages = history(turns=10)
+    snapshot = [dict(message) for message in messages]
+    manager = ContextManager(max_tokens=300, strategies=[SlidingWindow()])
+
+    view = manager.view(messages)
+
+    assert messages == snapshot
+    assert view[0] == messages[0]
+    assert view[-1] is messages[-1]
+    assert len(view) < len(messages)
+    assert 3 + sum(manager.count_tokens(view)) <= 300
+    assert manager.compactions == 1
+
+
+def test_older_tool_outputs_are_truncated_first():
+    messages = history(turns=1)
+    messages.append({"role": "assistant", "content": "tool " + "z" * 4000})
+    messages.append({"role": "user", "content": "and now?"})
+    messages.append({"role": "assistant", "content": "tool " + "w" * 400})
+    manager = ContextManager(
+        max_tokens=600, strategies=[TruncateToolOutputs(max_tokens_per_output=50)]
+    )
+
+    view = manager.view(messages, tool_outputs={3, 5})
+
+    assert view[3]["content"].endswith("...[truncated]")
+    assert len(view[3]["content"]) < 250
+    assert view[5] is messages[5]
+    assert len(messages[3]["content"]) > 4000
+
+
+async def test_rolling_summary_is_built_off_the_critical_path():
+    mock = MockOpenAI(reply="they asked ten questions")
+    summary = RollingSummary(LLM(client=mock.client(), model="m"), keep_last=2)
+    manager = ContextManager(max_tokens=400, strategies=[summary, SlidingWindow()])
+    messages = history(turns=10)
+
+    # the first over-budget view falls back to the window and starts a summary
+    first = manager.view(messages)
+    assert all("Summary" not in m["content"] for m in first)
+    await summary.await_summary()
+    assert summary.summaries == 1
+    assert "question 0" in mock.requests[0]["messages"][1]["content"]
+
+    second = manager.view(messages)
+    assert second[0] == messages[0]
+    assert second[1]["content"].endswith("they asked ten questions")
+    assert second[-2:] == messages[-2:]
+    assert len(second) == 4
+
+
+async def test_agent_applies_separate_budgets():
+    def reply(body: dict) -> str:
+        if "IsFinalResponse" in body["messages"][0]["content"]:
+            return json.dumps({"is_final_response": False})
+        return "ok"
+
+    mock = MockOpenAI(reply=reply)
+    llm = LLM(client=mock.client(), model="m")
+    agent = Agent(
+        chat_llm=llm,
+        tool_selector_llm=llm,
+        evaluator_llm=llm,
+        messages=history(turns=10),
+        max_steps=2,
+        context_manager=ContextManager(max_tokens=2_000),
+        evaluator_context_manager=ContextManager(max_tokens=300),
+    )
+
+    [event async for event in agent.astream_events()]
+
+    evaluator, chat = mock.requests
+    assert len(evaluator["messages"]) < len(chat["messages"])
+    assert len(chat["messages"]) == 21
+    assert len(agent.messages) == 22
@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+import httpx
+
+from llmtext.hedging import HedgingTransport
+from llmtext.llm import LLM
+from llmtext.router import ROUTER_BASE_URL, Endpoint, RouterTransport
+from tests.mock_openai import MockOpenAI, mock_client
+
+
+class SlowFirst:
+    """Answers the first request after a long pause and the rest at once"""
+
+    def __init__(self, mock: MockOpenAI, pause: float = 1.0):
+        self.mock = mock
+        self.pause = pause
+        self.seen = 0
+        self.cancelled = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.seen += 1
+        if self.seen == 1:
+            try:
+                await asyncio.sleep(self.pause)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return await self.mock.handler(request)
+
+
+async def test_slow_request_is_hedged_and_the_loser_cancelled():
+    slow = SlowFirst(MockOpenAI(reply="fast answer"))
+    transport = HedgingTransport(
+        httpx.MockTransport(slow.handler), initial_delay=0.05, max_hedge_ratio=1.0
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    started = time.perf_counter()
+    assert await llm.agenerate_response_from_text("hi") == "fast answer"
+    assert time.perf_counter() - started < 0.5
+    assert slow.cancelled == 1
+    # the latency recorded covers the wait for the primary, not just the hedge
+    assert transport.latencies.count == 1 and transport.latencies.min >= 0.05
+
+    assert await llm.agenerate_response_from_text("hi") == "fast answer"
+    stats = transport.stats()
+    assert stats["requests"] == 2 and stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1 and stats["primary_wins"] == 0
+    assert stats["hedge_rate"] == 0.5
+
+
+async def test_stream_is_hedged_when_the_first_chunk_is_late():
+    mock = MockOpenAI(reply="hedged stream", chunk_size=4)
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        response = await mock.handler(request)
+        if calls > 1:
+            return response
+
+        async def late_body():
+            await asyncio.sleep(1.0)
+            yield await response.aread()
+
+        # headers arrive at once, the first token does not
+        return httpx.Response(200, headers=response.headers, content=late_body())
+
+    transport = HedgingTransport(
+        httpx.MockTransport(handler), initial_delay=0.05, max_hedge_ratio=1.0
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+    started = time.perf_counter()
+    chunks = [
+        chunk
+        async for chunk in llm.astream_response_from_messages(
+            [{"role": "user", "content": "hi"}]
+        )
+    ]
+    assert "".join(chunks) == "hedged stream"
+    assert time.perf_counter() - started < 0.5
+    assert transport.hedge_wins == 1
+
+
+async def test_hedges_are_capped_and_the_delay_follows_observed_latency():
+    mock = MockOpenAI(reply="ok", latency=0.03)
+    transport = HedgingTransport(
+        httpx.MockTransport(mock.handler),
+        initial_delay=0.01,
+        min_samples=5,
+        max_hedge_ratio=0.5,
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    for _ in range(4):
+        await llm.agenerate_response_from_text("hi")
+    assert transport.hedged == 2 and transport.capped == 2
+
+    # with enough samples the delay follows the observed p95
+    for _ in range(6):
+        await llm.agenerate_response_from_text("hi")
+    assert 0.03 <= transport.delay < 0.1
+    assert transport.hedge_rate <= 0.5
+
+
+async def test_hedge_goes_to_another_endpoint_behind_a_router():
+    mocks = {
+        "slow": MockOpenAI(reply="slow", latency=1.0),
+        "fast": MockOpenAI(reply="fast"),
+    }
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return await mocks[request.url.host].handler(request)
+
+    router = RouterTransport(
+        [Endpoint("http://slow/v1"), Endpoint("http://fast/v1")],
+        strategy="round_robin",
+        transport=httpx.MockTransport(handler),
+    )
+    transport = HedgingTransport(router, initial_delay=0.05, max_hedge_ratio=1.0)
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    assert await llm.agenerate_response_from_text("hi") == "fast"
+    assert transport.hedge_wins == 1
+    await asyncio.sleep(0)
+    assert all(e.outstanding == 0 for e in router.endpoints)
+
+
+async def test_hedge_avoids_the_primary_endpoint_under_least_outstanding():
+    mocks = {
+        "slow": MockOpenAI(reply="slow", latency=1.0),
+        "fast": MockOpenAI(reply="fast"),
+    }
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return await mocks[request.url.host].handler(request)
+
+    # the heavy endpoint still scores best with the primary in flight on it
+    router = RouterTransport(
+        [Endpoint("http://slow/v1", weight=10), Endpoint("http://fast/v1")],
+        transport=httpx.MockTransport(handler),
+    )
+    transport = HedgingTransport(router, initial_delay=0.05, max_hedge_ratio=1.0)
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    assert await llm.agenerate_response_from_text("hi") == "fast"
+    assert transport.hedge_wins == 1
+    assert [e.requests for e in router.endpoints] == [1, 1]
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from scripts.bench_import import MODULES, measure
+
+
+def test_import_does_not_load_heavy_dependencies():
+    for module in MODULES:
+        _, heavy = measure(module, repeat=1)
+        assert heavy == [], f"{module} eagerly imports {heavy}"
+
+
+def test_import_does_not_need_api_key():
+    env = {k: v for k, v in os.environ.items() if not k.startswith("OPENAI_")}
+    code = (
+        "from llmtext.agent import Agent; from llmtext.llm import LLM; Agent(); LLM()"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_default_client_is_shared_and_built_on_first_use(monkeypatch):
+    from llmtext import clients
+    from llmtext.llm import LLM
+
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_API_BASE_URL", "http://legacy.local/v1")
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    monkeypatch.setattr(clients, "_env_loaded", True)
+
+    first, second = LLM(), LLM()
+    assert clients._clients == {}
+    assert first.client is second.client
+    assert str(first.client.base_url) == "http://legacy.local/v1/"
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import re
+
+import pytest
+
+from llmtext.packing import RequestPacker
+from llmtext.prompt_optimizer import (
+    agenerate_prompt_and_optimize,
+    aoptimize_prompt,
+    arace_prompts,
+    arun_prompt,
+)
+from tests.mock_openai import MockOpenAI
+
+ITEM = re.compile(r"### Item (\d+)\n(.*?)(?=\n\n### Item |\Z)", re.DOTALL)
+
+
+def packed_reply(drop: set[str] = frozenset(), broken: bool = False):
+    """Answers "out:<input>" per item, leaving out items whose input is in drop"""
+
+    def reply(body):
+        # instructor's JSON mode appends its own instruction to the last message
+        user = body["messages"][-1]["content"].split("\n\nReturn the correct JSON")[0]
+        items = ITEM.findall(user)
+        if not items:
+            return f"out:{user}"
+        if broken:
+            return "not json at all"
+        outputs = [
+            {"index": int(index), "output": f"out:{text}"}
+            for index, text in items
+            if text not in drop
+        ]
+        return json.dumps({"outputs": outputs}, ensure_ascii=False)
+
+    return reply
+
+
+INPUTS = [
+    "残高証明書を発行してください",
+    "プリペイドカードを作成してください",
+    "口座を作ってください",
+    "送金してください",
+    "外貨両替をしたい",
+    "デビットカードを申し込みたい",
+]
+
+
+async def test_inputs_are_packed_by_token_budget_and_kept_in_order():
+    mock = MockOpenAI(reply=packed_reply())
+    packer = RequestPacker(token_budget=200, output_ratio=1.0)
+    plan = packer.plan("Translate to Korean.", INPUTS)
+    assert len(plan) > 1 and all(len(pack) > 1 for pack in plan)
+    assert [p for pack in plan for p in pack] == list(range(len(INPUTS)))
+
+    results = await packer.agenerate(
+        "Translate to Korean.", INPUTS, client=mock.client(), model="m"
+    )
+    assert results == [f"out:{text}" for text in INPUTS]
+    assert mock.calls == len(plan)
+    assert packer.stats()["packed_items"] == len(INPUTS)
+    assert packer.stats()["fallback_items"] == 0
+
+
+async def test_missing_items_fall_back_to_single_requests():
+    mock = MockOpenAI(reply=packed_reply(drop={INPUTS[2]}))
+    packer = RequestPacker(token_budget=10_000)
+
+    results = await packer.agenerate("Translate.", INPUTS, client=mock.client())
+    assert results == [f"out:{text}" for text in INPUTS]
+    # one pack, then one single request for the dropped item
+    assert mock.calls == 2
+    assert mock.requests[-1]["messages"][-1]["content"] == INPUTS[2]
+    assert packer.fallback_items == 1
+    # the single request samples like the pack it stands in for
+    assert [request["temperature"] for request in mock.requests] == [0.0, 0.0]
+
+
+async def test_a_failed_pack_falls_back_entirely():
+    mock = MockOpenAI(reply=packed_reply(broken=True))
+    packer = RequestPacker(token_budget=10_000)
+
+    results = await packer.agenerate("Translate.", INPUTS[:3], client=mock.client())
+    assert results == [f"out:{text}" for text in INPUTS[:3]]
+    assert packer.packs == 0 and packer.fallback_items == 3
+
+
+async def test_pack_size_adapts_to_observed_output_length():
+    mock = MockOpenAI(reply=packed_reply())
+    packer = RequestPacker(token_budget=300, output_ratio=8.0)
+    before = len(packer.plan("Translate.", INPUTS * 4))
+
+    await arun_prompt("Translate.", INPUTS, client=mock.client(), packer=packer)
+    # outputs were about as long as inputs, so more items fit in a pack now
+    assert packer.output_ratio < 8.0
+    assert len(packer.plan("Translate.", INPUTS * 4)) < before
+
+
+@pytest.mark.parametrize("evaluation", ["full", "successive_halving"])
+async def test_prompt_search_evaluates_through_the_packer(evaluation):
+    mock = MockOpenAI(reply=packed_reply())
+    packer = RequestPacker(token_budget=10_000)
+
+    async def ascore(inputs, expected, outputs) -> float:
+        return 1.0
+
+    await agenerate_prompt_and_optimize(
+        INPUTS,
+        INPUTS,
+        ascore,
+        parallel_count=2,
+        client=mock.client(),
+        packer=packer,
+        evaluation=evaluation,
+        initial_batch=2,
+    )
+    assert packer.packs > 0 and packer.fallback_items == 0
+
+
+def writing_reply():
+    """Writes a distinct prompt for every request to write one, packs the rest"""
+    written = 0
+    evaluate = packed_reply()
+
+    def reply(body):
+        nonlocal written
+        system = body["messages"][0]["content"]
+        if system.startswith(("Let's work this out", "Improve", "Combine")):
+            written += 1
+            return f"Translate. {hashlib.md5(str(written).encode()).hexdigest()}"
+        return evaluate(body)
+
+    return reply
+
+
+async def ascore_half(inputs, expected, outputs) -> float:
+    return 0.5
+
+
+async def test_prompt_search_budget_counts_packed_requests():
+    mock = MockOpenAI(reply=writing_reply())
+    packer = RequestPacker(token_budget=10_000)
+
+    result = await aoptimize_prompt(
+        INPUTS,
+        INPUTS,
+        ascore_half,
+        population_size=2,
+        max_calls=20,
+        max_rounds=3,
+        patience=5,
+        client=mock.client(),
+        packer=packer,
+    )
+    assert result["calls"] == mock.calls
+    # two calls per candidate, so the budget covers far more than per example
+    assert len(result["candidates"]) == 6 and packer.packs == 6
+
+
+async def test_race_budget_counts_packed_requests():
+    mock = MockOpenAI(reply=packed_reply())
+    packer = RequestPacker(token_budget=10_000)
+    inputs = INPUTS * 4
+
+    race = await arace_prompts(
+        ["Translate.", "Translate to Korean.", "Translate to English."],
+        inputs,
+        inputs,
+        ascore_half,
+        initial_batch=4,
+        max_calls=6,
+        confidence=None,
+        client=mock.client(),
+        packer=packer,
+    )
+    assert race["calls"] == mock.calls <= 6
+    # every prompt ran on more examples than a per-example budget would allow
+    assert all(entry["examples"] > 2 for entry in race["candidates"].values())
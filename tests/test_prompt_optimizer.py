@@ -1,6 +1,13 @@
 import asyncio
 import csv
+import hashlib
+import re
+
+import pytest
+from openai import AsyncOpenAI
+
 from llmtext.messages_fns import agenerate
+from tests.mock_openai import MockOpenAI
 
 
 async def test_prompt_generator():
@@ -141,3 +148,388 @@ async def test_prompt_optimizer_run():
     )
 
     print("res", res)
+
+
+def versioned_prompts_client(
+    unique: bool = True,
+) -> tuple[AsyncOpenAI, MockOpenAI]:
+    """Prompts are "prompt vN ...", mutations bump N and evaluation echoes the prompt
+
+    Unless unique is False, every written prompt gets a different random-looking tail,
+    so none of them are collapsed as duplicates.
+    """
+    written = 0
+
+    def reply(body):
+        nonlocal written
+        system = body["messages"][0]["content"]
+        user = body["messages"][-1]["content"]
+        versions = [int(v) for v in re.findall(r"prompt v(\d+)", user)]
+        if system.startswith("Let's work this out"):
+            version = 1
+        elif system.startswith("Improve"):
+            version = versions[0] + 1
+        elif system.startswith("Combine"):
+            version = max(versions)
+        else:
+            return system
+        written += 1
+        tail = hashlib.md5(str(written).encode()).hexdigest() if unique else ""
+        return f"prompt v{version} {tail}".strip()
+
+    mock = MockOpenAI(reply=reply)
+    return mock.client(), mock
+
+
+async def ascore_version(inputs, outputs, results) -> float:
+    # better with every version up to v4, then a plateau
+    version = int(re.match(r"prompt v(\d+)", results[0]).group(1))
+    return min(version, 4) / 4
+
+
+async def test_optimize_prompt_improves_over_rounds_and_stops_on_plateau():
+    from llmtext.prompt_optimizer import aoptimize_prompt
+
+    client, mock = versioned_prompts_client()
+    result = await aoptimize_prompt(
+        example_inputs=["a", "b"],
+        example_outputs=["A", "B"],
+        scoring_fn=ascore_version,
+        population_size=3,
+        beam_width=2,
+        max_calls=1000,
+        patience=2,
+        seed=0,
+        client=client,
+    )
+
+    assert result["best_score"] == 1.0
+    assert result["best_prompt"].startswith("prompt v")
+    assert result["trajectory"] == sorted(result["trajectory"])
+    assert result["trajectory"][0] == 0.25 and result["trajectory"][-1] == 1.0
+    # two rounds without improvement after reaching the plateau
+    assert result["trajectory"][-3:] == [1.0, 1.0, 1.0]
+    assert result["calls"] == mock.calls == result["rounds"] * 3 * 3
+
+
+async def test_optimize_prompt_respects_the_call_budget():
+    from llmtext.prompt_optimizer import aoptimize_prompt
+
+    client, mock = versioned_prompts_client()
+    result = await aoptimize_prompt(
+        example_inputs=["a", "b"],
+        example_outputs=["A", "B"],
+        scoring_fn=ascore_version,
+        population_size=4,
+        max_calls=20,
+        client=client,
+    )
+
+    # 4 candidates of 3 calls, then only 2 more fit
+    assert result["calls"] == mock.calls == 18
+    assert result["rounds"] == 2
+    assert [c["round"] for c in result["candidates"]] == [0, 0, 0, 0, 1, 1]
+
+
+async def test_scoring_runs_concurrently_within_the_limit():
+    from llmtext.prompt_optimizer import agenerate_prompt_and_optimize
+
+    client, _ = versioned_prompts_client()
+    running = 0
+    peak = 0
+
+    async def ascore(inputs, outputs, results) -> float:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return 0.5
+
+    best = await agenerate_prompt_and_optimize(
+        example_inputs=["a"],
+        example_outputs=["A"],
+        scoring_fn=ascore,
+        parallel_count=6,
+        concurrency=3,
+        client=client,
+    )
+    assert best.startswith("prompt v1")
+    assert peak == 3
+
+
+@pytest.mark.parametrize("kind", ["csv", "jsonl", "sqlite"])
+async def test_interrupted_run_resumes_from_the_store(tmp_path, kind):
+    from llmtext.prompt_optimizer import agenerate_prompt_and_optimize
+    from llmtext.results import CSVResultStore, JSONLResultStore, SQLiteResultStore
+
+    path = str(tmp_path / f"results.{kind}")
+    make_store = {
+        "csv": CSVResultStore,
+        "jsonl": JSONLResultStore,
+        "sqlite": SQLiteResultStore,
+    }[kind]
+    client, mock = versioned_prompts_client()
+    options = dict(
+        example_inputs=["a", "b"],
+        example_outputs=["A", "B"],
+        scoring_fn=ascore_version,
+        client=client,
+        run_id="run-1",
+    )
+
+    # the first run stopped after two of four candidates
+    store = make_store(path)
+    await agenerate_prompt_and_optimize(parallel_count=2, store=store, **options)
+    store.close()
+    assert mock.calls == 6
+
+    store = make_store(path)
+    await agenerate_prompt_and_optimize(parallel_count=4, store=store, **options)
+    assert mock.calls == 12
+
+    records = store.load("run-1")
+    assert len(records) == 4 and store.load("other-run") == []
+    assert records[0]["outputs"] == [records[0]["prompt"]] * 2
+    assert records[0]["score"] == 0.25 and records[0]["run_time"] >= 0
+    store.close()
+
+    if kind == "csv":
+        with open(path) as f:
+            assert f.readline().startswith("run_id,candidate_id,prompt,score")
+
+
+def test_prompt_deduplicator_collapses_near_duplicates():
+    from llmtext.prompt_optimizer import PromptDeduplicator
+
+    prompt = (
+        "Translate the Japanese banking request into polite Korean, "
+        "keeping the account and card terms exact."
+    )
+    deduplicator = PromptDeduplicator()
+    deduplicator.add(prompt)
+    assert deduplicator.find(prompt.upper() + "!!") == prompt
+    assert deduplicator.find(prompt.replace("polite", "polite,")) == prompt
+    assert deduplicator.find("Summarize the customer complaint in one line.") is None
+
+
+async def test_duplicate_candidates_are_evaluated_once_and_cached_across_sessions(
+    tmp_path,
+):
+    from llmtext.cache import ResponseCache
+    from llmtext.prompt_optimizer import agenerate_prompt_and_optimize
+    from llmtext.results import MemoryResultStore
+
+    client, mock = versioned_prompts_client(unique=False)
+    store = MemoryResultStore()
+    options = dict(
+        example_inputs=["a", "b"],
+        example_outputs=["A", "B"],
+        scoring_fn=ascore_version,
+        parallel_count=4,
+        client=client,
+        model="m",
+    )
+
+    cache = ResponseCache(path=str(tmp_path / "evaluations.db"))
+    best = await agenerate_prompt_and_optimize(
+        store=store, run_id="first", cache=cache, **options
+    )
+    assert best == "prompt v1"
+    # four prompts written, identical ones evaluated once on two inputs
+    assert mock.calls == 4 + 2
+    records = store.load("first")
+    assert [r["duplicate_of"] is None for r in records] == [True, False, False, False]
+    assert {r["duplicate_of"] for r in records[1:]} == {records[0]["candidate_id"]}
+
+    # a later session only pays for writing prompts, the outputs are on disk
+    cache = ResponseCache(path=str(tmp_path / "evaluations.db"))
+    await agenerate_prompt_and_optimize(
+        store=store, run_id="second", cache=cache, **options
+    )
+    assert mock.calls == 6 + 4
+    assert cache.stats()["disk_hits"] == 2
+
+
+async def test_optimize_prompt_refunds_calls_for_duplicates():
+    from llmtext.prompt_optimizer import aoptimize_prompt
+
+    client, mock = versioned_prompts_client(unique=False)
+    result = await aoptimize_prompt(
+        example_inputs=["a", "b"],
+        example_outputs=["A", "B"],
+        scoring_fn=ascore_version,
+        population_size=3,
+        max_rounds=1,
+        client=client,
+    )
+    assert result["duplicates"] == 2 and len(result["candidates"]) == 1
+    assert result["calls"] == mock.calls == 3 + 2
+
+
+def quality_answer(system: str, user: str) -> str:
+    """A prompt "quality Q ..." answers a fixed, pseudo-random share Q of inputs right"""
+    quality = float(system.split()[1])
+    roll = int(hashlib.md5(f"{system}|{user}".encode()).hexdigest(), 16) % 1000
+    return f"answer {user}" if roll < quality * 1000 else "wrong"
+
+
+def quality_client() -> tuple[AsyncOpenAI, MockOpenAI]:
+    mock = MockOpenAI(
+        reply=lambda body: quality_answer(
+            body["messages"][0]["content"], body["messages"][-1]["content"]
+        )
+    )
+    return mock.client(), mock
+
+
+async def ascore_accuracy(inputs, expected, outputs) -> float:
+    return sum(e == o for e, o in zip(expected, outputs)) / len(inputs)
+
+
+async def test_race_picks_the_full_evaluation_winner_with_far_fewer_calls():
+    from llmtext.prompt_optimizer import arace_prompts
+
+    client, mock = quality_client()
+    prompts = [f"quality {q / 10} candidate" for q in range(1, 9)]
+    inputs = [f"example {i}" for i in range(200)]
+    expected = [f"answer {i}" for i in inputs]
+
+    # what evaluating every prompt on every input would pick, and cost
+    full = {
+        prompt: await ascore_accuracy(
+            inputs, expected, [quality_answer(prompt, i) for i in inputs]
+        )
+        for prompt in prompts
+    }
+    full_calls = len(prompts) * len(inputs)
+
+    race = await arace_prompts(
+        prompts,
+        example_inputs=inputs,
+        example_outputs=expected,
+        scoring_fn=ascore_accuracy,
+        initial_batch=10,
+        seed=1,
+        client=client,
+    )
+    assert race["best_prompt"] == max(full, key=full.get)
+    assert race["calls"] == mock.calls
+    assert race["calls"] * 10 <= full_calls
+    # the weakest prompts were pruned after the first minibatch
+    assert race["candidates"]["quality 0.1 candidate"]["examples"] == 10
+
+    budgeted = await arace_prompts(
+        prompts,
+        example_inputs=inputs,
+        example_outputs=expected,
+        scoring_fn=ascore_accuracy,
+        initial_batch=10,
+        max_calls=100,
+        client=client,
+    )
+    assert budgeted["calls"] <= 100
+
+
+async def test_optimize_with_successive_halving_stores_minibatch_scores():
+    from llmtext.prompt_optimizer import agenerate_prompt_and_optimize
+    from llmtext.results import MemoryResultStore
+
+    client, mock = quality_client()
+    written = iter([f"quality {q} written" for q in (0.2, 0.9, 0.5, 0.1)])
+
+    def reply(body):
+        if body["messages"][0]["content"].startswith("Let's work this out"):
+            return next(written)
+        return quality_reply(body)
+
+    quality_reply, mock.reply = mock.reply, reply
+    inputs = [f"example {i}" for i in range(64)]
+    store = MemoryResultStore()
+    best = await agenerate_prompt_and_optimize(
+        example_inputs=inputs,
+        example_outputs=[f"answer {i}" for i in inputs],
+        scoring_fn=ascore_accuracy,
+        parallel_count=4,
+        client=client,
+        store=store,
+        run_id="race",
+        evaluation="successive_halving",
+        initial_batch=8,
+        seed=0,
+    )
+    assert best == "quality 0.9 written"
+    records = store.load("race")
+    assert len(records) == 4
+    assert min(len(r["outputs"]) for r in records) == 8
+    assert mock.calls < 4 + 4 * 64 // 2
+    assert all(r["examples"] == len(r["outputs"]) for r in records)
+
+
+class Interrupted(Exception):
+    pass
+
+
+async def test_interrupted_race_resumes_from_its_stored_entries():
+    from llmtext.prompt_optimizer import agenerate_prompt_and_optimize
+    from llmtext.results import MemoryResultStore
+
+    client, mock = quality_client()
+    written = iter(
+        [f"quality {q} written" for q in (0.2, 0.9, 0.5, 0.1)]
+        + [f"quality {q} written" for q in (0.9, 0.5)]
+    )
+
+    def reply(body):
+        if body["messages"][0]["content"].startswith("Let's work this out"):
+            return next(written)
+        return quality_reply(body)
+
+    quality_reply, mock.reply = mock.reply, reply
+    inputs = [f"example {i}" for i in range(64)]
+    store = MemoryResultStore()
+    scored = 0
+
+    async def ascore_until_interrupted(inputs, expected, outputs) -> float:
+        nonlocal scored
+        scored += 1
+        if scored > 4:
+            raise Interrupted
+        return await ascore_accuracy(inputs, expected, outputs)
+
+    options = dict(
+        example_inputs=inputs,
+        example_outputs=[f"answer {i}" for i in inputs],
+        parallel_count=4,
+        client=client,
+        store=store,
+        run_id="race",
+        evaluation="successive_halving",
+        initial_batch=8,
+        confidence=None,
+    )
+    # the first round pruned half the prompts, then the run stopped
+    with pytest.raises(Interrupted):
+        await agenerate_prompt_and_optimize(
+            scoring_fn=ascore_until_interrupted, **options
+        )
+    pruned = {r["prompt"]: r for r in store.load("race")}
+    assert set(pruned) == {"quality 0.2 written", "quality 0.1 written"}
+    assert all(r["examples"] == 8 and len(r["outputs"]) == 8 for r in pruned.values())
+
+    # the pruned prompts rejoin where they stopped, only the lost ones run again
+    resumed_from = mock.calls
+    best = await agenerate_prompt_and_optimize(scoring_fn=ascore_accuracy, **options)
+    assert best == "quality 0.9 written"
+    systems = [r["messages"][0]["content"] for r in mock.requests[resumed_from:]]
+    assert not set(systems) & set(pruned)
+
+    # a full evaluation of the same run does not compare minibatch scores
+    best = await agenerate_prompt_and_optimize(
+        scoring_fn=ascore_accuracy, **{**options, "evaluation": "full"}
+    )
+    assert best == "quality 0.9 written"
+    latest = {r["prompt"]: r for r in store.load("race")}
+    assert len(latest) == 4
+    assert all(r["examples"] == 64 for r in latest.values())
+    assert all(len(r["outputs"]) == 64 for r in latest.values())
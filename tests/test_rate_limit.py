@@ -0,0 +1,78 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from llmtext.llm import LLM
+from llmtext.rate_limit import Priority, RateLimiter, estimate_tokens
+from tests.mock_openai import MockOpenAI
+
+
+class ImaginaryCountry(BaseModel):
+    """
+    ImaginaryCountry
+    """
+
+    city: str
+    country: str
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    english = estimate_tokens([{"role": "user", "content": "a" * 40}], max_tokens=0)
+    japanese = estimate_tokens([{"role": "user", "content": "口" * 40}], max_tokens=0)
+    assert english == 3 + 4 + 10
+    assert japanese == 3 + 4 + 40
+    assert estimate_tokens([], max_tokens=100) == 103
+
+
+async def test_interactive_priority_jumps_ahead_of_bulk():
+    limiter = RateLimiter()
+    limiter.record_rate_limited(retry_after=0.05)
+    order = []
+
+    async def acquire(name: str, priority: int):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    bulk = [asyncio.create_task(acquire(f"bulk-{i}", Priority.BULK)) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(acquire("interactive", Priority.INTERACTIVE))
+    await asyncio.gather(*bulk, interactive)
+
+    assert order[0] == "interactive"
+
+
+async def test_requests_per_minute_bucket_spaces_calls():
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter._requests = 0
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(3):
+        await limiter.acquire()
+    assert loop.time() - started >= 0.25
+
+
+async def test_rate_limited_calls_back_off_and_retry():
+    mock = MockOpenAI(reply="ok", errors=[429, 429])
+    limiter = RateLimiter(requests_per_minute=6000)
+    llm = LLM(client=mock.client(), model="mock", rate_limiter=limiter)
+
+    assert await llm.agenerate_response_from_text("hi") == "ok"
+    assert limiter.rate_limited == 2
+    assert limiter.scale == 0.25 + limiter.recovery
+
+
+async def test_structured_rate_limit_is_not_retried_by_instructor():
+    mock = MockOpenAI(
+        reply='```json\n{"city": "Aria", "country": "Nolandia"}\n```', errors=[429]
+    )
+    limiter = RateLimiter()
+    llm = LLM(client=mock.client(), model="mock", rate_limiter=limiter)
+
+    country = await llm.astructured_extraction_from_text(
+        text="create an imaginary country", output_class=ImaginaryCountry
+    )
+
+    assert country.city == "Aria"
+    assert limiter.rate_limited == 1
+    assert mock.calls == 2
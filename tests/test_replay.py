@@ -0,0 +1,138 @@
+import time
+
+import httpx
+import pytest
+
+from llmtext import clients
+from llmtext.llm import LLM
+from llmtext.replay import Cassette, CassetteMiss, ReplayTransport, request_key
+from tests.mock_openai import MockOpenAI, mock_client
+
+
+async def astream(llm: LLM, text: str) -> list[str]:
+    messages = [{"role": "user", "content": text}]
+    return [chunk async for chunk in llm.astream_response_from_messages(messages)]
+
+
+async def test_record_then_replay_without_network(tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    mock = MockOpenAI(reply="recorded answer", chunk_size=3)
+
+    recorder = ReplayTransport(
+        path, mode="record", transport=httpx.MockTransport(mock.handler)
+    )
+    llm = LLM(client=mock_client(recorder), model="m")
+    text = await llm.agenerate_response_from_text("hi")
+    chunks = await astream(llm, "stream please")
+    assert recorder.recorded == 2
+
+    # a fresh transport on the same file, with no way to reach the network
+    replayer = ReplayTransport(path, mode="replay")
+    llm = LLM(client=mock_client(replayer), model="m")
+    assert await llm.agenerate_response_from_text("hi") == text
+    assert await astream(llm, "stream please") == chunks
+    assert replayer.hits == 2 and mock.calls == 2
+    assert replayer.cassette.records == 2
+
+    with pytest.raises(Exception) as error:
+        await llm.agenerate_response_from_text("never recorded")
+    assert isinstance(error.value.__cause__, CassetteMiss)
+
+
+async def test_replay_or_record_records_each_occurrence(tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    replies = iter(["first", "second"])
+    mock = MockOpenAI(reply=lambda body: next(replies))
+
+    transport = ReplayTransport(path, transport=httpx.MockTransport(mock.handler))
+    llm = LLM(client=mock_client(transport), model="m")
+    assert await llm.agenerate_response_from_text("hi") == "first"
+    assert await llm.agenerate_response_from_text("hi") == "second"
+
+    llm = LLM(
+        client=mock_client(
+            ReplayTransport(path, transport=httpx.MockTransport(mock.handler))
+        ),
+        model="m",
+    )
+    assert await llm.agenerate_response_from_text("hi") == "first"
+    assert await llm.agenerate_response_from_text("hi") == "second"
+    assert mock.calls == 2
+
+
+async def test_streams_replay_with_recorded_or_accelerated_timing(tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    mock = MockOpenAI(reply="a slow streamed reply", chunk_size=4, chunk_delay=0.03)
+    llm = LLM(
+        client=mock_client(
+            ReplayTransport(
+                path, mode="record", transport=httpx.MockTransport(mock.handler)
+            )
+        ),
+        model="m",
+    )
+    await astream(llm, "hi")
+
+    timings = {}
+    for speed in (None, 1.0, 4.0):
+        llm = LLM(
+            client=mock_client(ReplayTransport(path, mode="replay", speed=speed)),
+            model="m",
+        )
+        started = time.perf_counter()
+        await astream(llm, "hi")
+        timings[speed] = time.perf_counter() - started
+
+    assert timings[1.0] > 0.15
+    assert timings[4.0] < timings[1.0] / 2
+    assert timings[None] < 0.05
+
+
+def test_request_key_normalization():
+    def request(body: bytes, url: str = "http://a/v1/chat/completions?b=2&a=1"):
+        return httpx.Request(
+            "POST", url, content=body, headers={"authorization": "Bearer x"}
+        )
+
+    key = request_key(request(b'{"model": "m", "temperature": 0}'))
+    assert key == request_key(
+        request(
+            b'{"temperature":0,"model":"m"}',
+            url="http://b/v1/chat/completions?a=1&b=2",
+        )
+    )
+    assert key != request_key(request(b'{"model": "m", "temperature": 1}'))
+    assert request_key(
+        request(b'{"model": "m", "user": "u1"}'), ignore_keys={"user"}
+    ) == request_key(request(b'{"model": "m", "user": "u2"}'), ignore_keys={"user"})
+
+
+def test_cassette_ignores_a_truncated_tail(tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    cassette = Cassette(path)
+    cassette.append(b"k" * 32, {"status": 200}, b"body")
+    cassette.close()
+    with open(path, "ab") as f:
+        f.write(b"partial record")
+
+    reopened = Cassette(path)
+    assert reopened.records == 1
+    assert reopened.get(b"k" * 32) == ({"status": 200}, b"body")
+
+    reopened.append(b"j" * 32, {"status": 201}, b"more")
+    assert Cassette(path).get(b"j" * 32) == ({"status": 201}, b"more")
+
+
+async def test_configured_transport_is_used_by_default_clients(tmp_path):
+    mock = MockOpenAI(reply="via replay")
+    transport = ReplayTransport(
+        str(tmp_path / "llm.cassette"), transport=httpx.MockTransport(mock.handler)
+    )
+    clients.configure_transport(transport)
+    try:
+        llm = LLM(base_url="http://replay.local/v1", api_key="test", model="m")
+        assert await llm.agenerate_response_from_text("hi") == "via replay"
+        assert transport.recorded == 1
+    finally:
+        clients.configure_transport(None)
+        await clients.aclose_clients()
@@ -0,0 +1,184 @@
+import asyncio
+
+import httpx
+import pytest
+
+from llmtext import messages_fns
+from llmtext.llm import LLM
+from llmtext.router import (
+    ROUTER_BASE_URL,
+    Endpoint,
+    RouterTransport,
+    _is_stream,
+    router_client,
+)
+from llmtext.types import Message
+from tests.mock_openai import MockOpenAI, mock_client
+
+
+def make_transport(
+    mocks: dict[str, MockOpenAI], endpoints: list[Endpoint], **kwargs
+) -> RouterTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        # each endpoint only accepts its own key
+        host = request.url.host
+        assert request.headers["authorization"] == f"Bearer key-{host}"
+        return await mocks[host].handler(request)
+
+    return RouterTransport(endpoints, transport=httpx.MockTransport(handler), **kwargs)
+
+
+def endpoint(host: str, weight: float = 1.0) -> Endpoint:
+    return Endpoint(f"http://{host}/v1", api_key=f"key-{host}", weight=weight)
+
+
+async def test_weighted_round_robin_spreads_by_weight():
+    mocks = {"a": MockOpenAI(reply="a"), "b": MockOpenAI(reply="b")}
+    transport = make_transport(
+        mocks, [endpoint("a", weight=2), endpoint("b")], strategy="round_robin"
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    replies = [await llm.agenerate_response_from_text("hi") for _ in range(9)]
+    assert replies.count("a") == 6 and replies.count("b") == 3
+    # smooth weighting interleaves instead of sending bursts
+    assert replies[:3] in (["a", "b", "a"], ["a", "a", "b"])
+
+
+async def test_least_outstanding_prefers_the_faster_endpoint():
+    mocks = {
+        "slow": MockOpenAI(reply="slow", latency=0.05),
+        "fast": MockOpenAI(reply="fast", latency=0.005),
+    }
+    transport = make_transport(mocks, [endpoint("slow"), endpoint("fast")])
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    for _ in range(3):
+        await asyncio.gather(
+            *[llm.agenerate_response_from_text("hi") for _ in range(4)]
+        )
+    assert mocks["fast"].calls > mocks["slow"].calls
+    stats = {s["name"]: s for s in transport.stats()}
+    assert (
+        stats["http://fast/v1"]["ewma_latency"]
+        < stats["http://slow/v1"]["ewma_latency"]
+    )
+    assert all(s["outstanding"] == 0 for s in stats.values())
+
+
+async def test_a_cold_start_burst_is_spread_by_outstanding_and_weight():
+    mocks = {host: MockOpenAI(reply=host, latency=0.05) for host in "abc"}
+    transport = make_transport(
+        mocks, [endpoint("a", weight=2), endpoint("b"), endpoint("c")]
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    # no endpoint has a latency sample while all of these are in flight
+    replies = await asyncio.gather(
+        *[llm.agenerate_response_from_text("hi") for _ in range(8)]
+    )
+    assert replies.count("a") == 4
+    assert replies.count("b") == 2 and replies.count("c") == 2
+
+
+async def test_failover_and_circuit_breaker():
+    mocks = {
+        "down": MockOpenAI(errors=[503] * 10),
+        "up": MockOpenAI(reply="ok"),
+    }
+    transport = make_transport(
+        mocks,
+        [endpoint("down"), endpoint("up")],
+        strategy="round_robin",
+        failure_threshold=2,
+        cooldown=0.05,
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+
+    replies = [await llm.agenerate_response_from_text("hi") for _ in range(6)]
+    assert replies == ["ok"] * 6
+    # ejected after two failures, the down endpoint gets no more traffic
+    assert mocks["down"].calls == 2
+    assert transport.endpoints[0].state == "open"
+    assert transport.failovers == 2
+
+    await asyncio.sleep(0.06)
+    mocks["down"].errors.clear()
+    await llm.agenerate_response_from_text("hi")
+    await llm.agenerate_response_from_text("hi")
+    # one half-open probe succeeded and closed the breaker again
+    assert mocks["down"].calls == 3
+    assert transport.endpoints[0].state == "closed"
+
+
+async def test_all_endpoints_failing_raises_a_connection_error():
+    mocks = {"a": MockOpenAI(errors=[500]), "b": MockOpenAI(errors=[502])}
+    llm = LLM(
+        client=mock_client(
+            make_transport(mocks, [endpoint("a"), endpoint("b")]), ROUTER_BASE_URL
+        ),
+        model="m",
+    )
+    with pytest.raises(Exception) as error:
+        await llm.agenerate_response_from_text("hi")
+    assert isinstance(error.value.__cause__, httpx.ConnectError)
+
+
+async def test_stream_fails_over_before_the_first_chunk():
+    good = MockOpenAI(reply="streamed from b", chunk_size=3)
+
+    async def broken_body():
+        raise httpx.ReadError("connection reset")
+        yield b""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "a":
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=broken_body(),
+            )
+        return await good.handler(request)
+
+    transport = RouterTransport(
+        [endpoint("a"), endpoint("b")],
+        strategy="round_robin",
+        transport=httpx.MockTransport(handler),
+    )
+    llm = LLM(client=mock_client(transport, ROUTER_BASE_URL), model="m")
+    chunks = [
+        chunk
+        async for chunk in llm.astream_response_from_messages(
+            [{"role": "user", "content": "hi"}]
+        )
+    ]
+    assert "".join(chunks) == "streamed from b"
+    assert transport.failovers == 1
+    assert transport.endpoints[0].failures == 1
+    assert all(e.outstanding == 0 for e in transport.endpoints)
+
+
+async def test_router_client_works_with_the_functional_api():
+    mocks = {"a": MockOpenAI(reply="routed")}
+    transport = make_transport(mocks, [endpoint("a")])
+    client = router_client(transport)
+
+    reply = await messages_fns.agenerate(
+        messages=[Message(role="user", content="hi")], client=client, model="m"
+    )
+    assert reply == "routed"
+    assert mocks["a"].requests[0]["model"] == "m"
+    assert transport.stats()[0]["requests"] == 1
+
+
+def test_stream_requests_are_detected_from_the_json_body():
+    def request(content: bytes) -> httpx.Request:
+        return httpx.Request("POST", "http://a/v1/chat/completions", content=content)
+
+    assert _is_stream(request(b'{"model": "m", "stream": true}'))
+    assert _is_stream(request(b'{"stream":true}'))
+    assert not _is_stream(request(b'{"stream": false}'))
+    # the flag inside a message is not the request's
+    assert not _is_stream(request(b'{"messages": [{"content": "\\"stream\\": true"}]}'))
+    assert not _is_stream(request(b""))
+    assert not _is_stream(request(b"not json"))
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from llmtext.llm import LLM
+from llmtext.messages_fns import agenerate
+from llmtext.single_flight import SingleFlight
+from tests.mock_openai import MockOpenAI
+
+
+class ImaginaryCountry(BaseModel):
+    """
+    ImaginaryCountry
+    """
+
+    city: str
+    country: str
+
+
+async def test_concurrent_identical_requests_share_one_call():
+    mock = MockOpenAI(reply="shared", latency=0.05)
+    single_flight = SingleFlight()
+    client = mock.client()
+
+    results = await asyncio.gather(
+        *[
+            agenerate(
+                messages=[{"role": "user", "content": "same"}],
+                client=client,
+                model="mock",
+                single_flight=single_flight,
+            )
+            for _ in range(5)
+        ]
+    )
+
+    assert results == ["shared"] * 5
+    assert mock.calls == 1
+    assert single_flight.followers == 4
+
+    await agenerate(
+        messages=[{"role": "user", "content": "same"}],
+        client=client,
+        model="mock",
+        single_flight=single_flight,
+    )
+    assert mock.calls == 2
+
+
+async def test_streaming_subscribers_fan_out_one_stream():
+    mock = MockOpenAI(reply="one upstream stream", latency=0.05)
+    llm = LLM(client=mock.client(), model="mock", single_flight=SingleFlight())
+
+    async def consume() -> str:
+        stream = llm.astream_response_from_messages([{"role": "user", "content": "x"}])
+        return "".join([chunk async for chunk in stream])
+
+    results = await asyncio.gather(*[consume() for _ in range(3)])
+
+    assert results == ["one upstream stream"] * 3
+    assert mock.calls == 1
+
+
+async def test_structured_followers_get_their_own_instance():
+    mock = MockOpenAI(
+        reply='```json\n{"city": "Aria", "country": "Nolandia"}\n```', latency=0.05
+    )
+    llm = LLM(client=mock.client(), model="mock", single_flight=SingleFlight())
+
+    a, b = await asyncio.gather(
+        llm.astructured_extraction_from_text("country", ImaginaryCountry),
+        llm.astructured_extraction_from_text("country", ImaginaryCountry),
+    )
+
+    assert mock.calls == 1
+    assert a == b
+    assert a is not b
+
+
+async def test_errors_reach_every_caller():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(
+        single_flight.ado("key", fail),
+        single_flight.ado("key", fail),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert single_flight.leaders == 1
+    with pytest.raises(ValueError):
+        await single_flight.ado("key", fail)
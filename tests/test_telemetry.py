@@ -0,0 +1,140 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from llmtext import completion_fns, telemetry
+from llmtext.agent import Agent
+from llmtext.llm import LLM
+from llmtext.rate_limit import RateLimiter
+from llmtext.telemetry import (
+    NOOP_SPAN,
+    HistogramTelemetry,
+    MultiTelemetry,
+    OTLPJsonExporter,
+    configure_telemetry,
+    start_span,
+)
+from tests.mock_openai import MockOpenAI
+
+
+class Person(BaseModel):
+    name: str
+    age: int
+
+
+@pytest.fixture(autouse=True)
+def reset_telemetry():
+    yield
+    configure_telemetry(None)
+
+
+async def test_default_is_a_no_op():
+    assert start_span("anything") is NOOP_SPAN
+
+    mock = MockOpenAI(reply="hi")
+    call = completion_fns.agenerate(
+        messages=[{"role": "user", "content": "hi"}], client=mock.client(), model="m"
+    )
+    # with telemetry off the call is not wrapped at all
+    assert call.cr_code is completion_fns.agenerate.__wrapped__.__code__
+    assert await call == "hi"
+
+
+async def test_histograms_of_llm_calls():
+    histograms = HistogramTelemetry()
+    configure_telemetry(histograms)
+
+    replies = ['{"name": "Ann"}', '{"name": "Ann", "age": 30}', "hello there friend"]
+    mock = MockOpenAI(reply=lambda body: replies.pop(0), chunk_size=3)
+    llm = LLM(
+        client=mock.client(),
+        model="m",
+        rate_limiter=RateLimiter(requests_per_minute=600),
+    )
+
+    person = await llm.astructured_extraction_from_messages(
+        messages=[{"role": "user", "content": "Ann is 30"}], output_class=Person
+    )
+    text = await llm.agenerate_response_from_messages(
+        [{"role": "user", "content": "hi"}]
+    )
+
+    assert person.age == 30 and text == "hello there friend"
+    summary = histograms.summary()
+
+    structured = summary["llm.structured"]
+    # the first reply fails validation and is re-asked
+    assert structured["retries"]["max"] == 1
+    assert structured["validation_time"]["count"] == 1
+    assert structured["prompt_tokens"]["sum"] == 20
+    assert structured["queue_wait"]["count"] == 1
+
+    stream = summary["llm.stream"]
+    assert stream["chunks"]["max"] == 6
+    assert stream["completion_tokens"]["max"] == 6
+    assert stream["ttft"]["max"] <= stream["duration"]["max"]
+    assert stream["tokens_per_second"]["count"] == 1
+
+
+async def test_otlp_export_of_an_agent_run(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = OTLPJsonExporter(path=str(path))
+    histograms = HistogramTelemetry()
+    configure_telemetry(MultiTelemetry(exporter, histograms))
+
+    def reply(body: dict) -> str:
+        if "IsFinalResponse" in body["messages"][0]["content"]:
+            return json.dumps({"is_final_response": False})
+        return "all done"
+
+    mock = MockOpenAI(reply=reply)
+    llm = LLM(client=mock.client(), model="m")
+    agent = Agent(
+        chat_llm=llm,
+        tool_selector_llm=llm,
+        evaluator_llm=llm,
+        messages=[{"role": "user", "content": "hi"}],
+        max_steps=2,
+    )
+    [event async for event in agent.astream_events()]
+
+    request = exporter.flush()
+    assert request is not None
+    assert json.loads(path.read_text()) == request
+
+    resource_spans = request["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"][0]["value"] == {
+        "stringValue": "llmtext"
+    }
+    spans = {span["name"]: span for span in resource_spans["scopeSpans"][0]["spans"]}
+    assert {"agent.step", "agent.evaluator", "agent.chat", "llm.structured"} <= set(
+        spans
+    )
+
+    step = spans["agent.step"]
+    assert len(step["traceId"]) == 32 and len(step["spanId"]) == 16
+    assert spans["agent.evaluator"]["parentSpanId"] == step["spanId"]
+    assert spans["llm.structured"]["parentSpanId"] == spans["agent.evaluator"]["spanId"]
+    assert int(step["endTimeUnixNano"]) >= int(step["startTimeUnixNano"])
+    attributes = {a["key"]: a["value"] for a in spans["llm.structured"]["attributes"]}
+    assert attributes["model"] == {"stringValue": "m"}
+    assert attributes["completion_tokens"] == {"intValue": "5"}
+
+    assert histograms.summary()["agent.chat"]["ttft"]["count"] == 1
+    assert telemetry.current_span() is NOOP_SPAN
+
+
+def test_otlp_exporter_without_a_path_keeps_a_bounded_buffer():
+    exporter = OTLPJsonExporter(max_buffered=3)
+    configure_telemetry(exporter)
+    for i in range(5):
+        with start_span(f"span {i}"):
+            pass
+
+    assert len(exporter.spans) == 3 and exporter.dropped == 2
+    request = exporter.flush()
+    assert request is not None
+    spans = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["span 2", "span 3", "span 4"]
+    assert not exporter.spans and exporter.flush() is None
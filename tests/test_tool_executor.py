@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from typing import ClassVar
+
+import pytest
+
+from llmtext.cache import ToolResultCache, make_tool_cache_key
+from llmtext.tool_executor import ToolExecutor
+from llmtext.types import RunnableTool
+
+
+class Nap(RunnableTool):
+    seconds: float
+
+    async def _arun(self) -> str:
+        await asyncio.sleep(self.seconds)
+        return "rested"
+
+
+class SingleNap(Nap):
+    max_concurrency: ClassVar[int | None] = 1
+
+
+class ShortNap(Nap):
+    timeout_seconds: ClassVar[float | None] = 0.05
+
+
+class Lookup(RunnableTool):
+    result_cache: ClassVar = ToolResultCache(max_entries=2)
+    calls: ClassVar[int] = 0
+    query: str
+
+    async def _arun(self) -> str:
+        type(self).calls += 1
+        await asyncio.sleep(0.05)
+        return f"result for {self.query}"
+
+
+class ExpiringLookup(Lookup):
+    result_cache: ClassVar = ToolResultCache(ttl=0.05)
+
+
+class BlockingSleep(RunnableTool):
+    run_in: ClassVar = "thread"
+    seconds: float
+
+    async def _arun(self) -> str:
+        raise AssertionError("runs in a thread through _run")
+
+    def _run(self) -> str:
+        time.sleep(self.seconds)
+        return "done"
+
+
+class Pid(RunnableTool):
+    run_in: ClassVar = "process"
+
+    async def _arun(self) -> str:
+        return str(os.getpid())
+
+
+async def test_global_concurrency_limit_reports_queue_time():
+    executor = ToolExecutor(max_concurrency=2)
+    started = time.perf_counter()
+    outputs = await asyncio.gather(*[executor.arun(Nap(seconds=0.1)) for _ in range(4)])
+
+    assert time.perf_counter() - started >= 0.2
+    assert [o["output"] for o in outputs] == ["rested"] * 4
+    assert sorted(o["queue_time"] for o in outputs)[-1] >= 0.09
+    assert all(o["execution_time"] >= 0.09 for o in outputs)
+
+
+async def test_per_tool_concurrency_limit():
+    executor = ToolExecutor()
+    started = time.perf_counter()
+    await asyncio.gather(
+        executor.arun(SingleNap(seconds=0.1)),
+        executor.arun(SingleNap(seconds=0.1)),
+        executor.arun(Nap(seconds=0.1)),
+    )
+    assert 0.2 <= time.perf_counter() - started < 0.3
+
+
+async def test_timeout_cancels_the_tool():
+    executor = ToolExecutor(timeout_seconds=5)
+    with pytest.raises(asyncio.TimeoutError):
+        await executor.arun(ShortNap(seconds=1))
+    assert executor.timeouts == 1
+
+
+async def test_blocking_tool_in_thread_keeps_loop_responsive():
+    executor = ToolExecutor()
+    ticks = 0
+
+    async def aticker():
+        nonlocal ticks
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    output, _ = await asyncio.gather(
+        executor.arun(BlockingSleep(seconds=0.2)), aticker()
+    )
+    assert output["output"] == "done"
+    assert ticks == 10
+    executor.shutdown()
+
+
+async def test_process_offload():
+    executor = ToolExecutor(max_processes=1)
+    output = await executor.arun(Pid())
+    assert output["output"] != str(os.getpid())
+    executor.shutdown()
+
+
+async def test_results_are_memoized_by_class_and_params():
+    Lookup.calls = 0
+    Lookup.result_cache.clear()
+    executor = ToolExecutor()
+
+    first = await executor.arun(Lookup(query="a"))
+    second = await executor.arun(Lookup(query="a"))
+    other = await executor.arun(Lookup(query="b"))
+    direct = await Lookup(query="a").acall_and_return_tool_output()
+
+    assert [first["cached"], second["cached"], other["cached"], direct["cached"]] == [
+        False,
+        True,
+        False,
+        True,
+    ]
+    assert second["output"] == "result for a"
+    assert Lookup.calls == 2
+    assert make_tool_cache_key(Lookup(query="a")) != make_tool_cache_key(
+        ExpiringLookup(query="a")
+    )
+
+    # size bound: a third query evicts the least recently used one
+    await executor.arun(Lookup(query="c"))
+    await executor.arun(Lookup(query="b"))
+    assert Lookup.calls == 4
+
+
+async def test_concurrent_identical_calls_run_once():
+    Lookup.calls = 0
+    Lookup.result_cache.clear()
+    executor = ToolExecutor()
+
+    outputs = await asyncio.gather(
+        *[executor.arun(Lookup(query="x")) for _ in range(5)]
+    )
+
+    assert Lookup.calls == 1
+    assert sorted(o["cached"] for o in outputs) == [False] + [True] * 4
+    assert Lookup.result_cache.deduplicated == 4
+
+
+async def test_cached_results_expire():
+    ExpiringLookup.calls = 0
+    executor = ToolExecutor()
+
+    await executor.arun(ExpiringLookup(query="a"))
+    assert (await executor.arun(ExpiringLookup(query="a")))["cached"]
+    await asyncio.sleep(0.06)
+    assert not (await executor.arun(ExpiringLookup(query="a")))["cached"]
+    assert ExpiringLookup.calls == 2
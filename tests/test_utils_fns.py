@@ -0,0 +1,96 @@
+import json
+
+import instructor
+from pydantic import BaseModel
+
+from llmtext.clients import get_structured_client
+from llmtext.llm import LLM
+from llmtext.types import RunnableTool
+from llmtext.utils_fns import (
+    output_class_schema,
+    to_partial_response_model,
+    to_response_model,
+    tools_to_tool_selector,
+)
+from tests.mock_openai import MockOpenAI
+
+
+class Person(BaseModel):
+    """A person"""
+
+    name: str
+    age: int
+
+
+class Search(RunnableTool):
+    query: str
+
+    async def _arun(self) -> str:
+        return self.query
+
+
+class Calculator(RunnableTool):
+    expression: str
+
+    async def _arun(self) -> str:
+        return self.expression
+
+
+def test_response_models_are_built_once():
+    response_model = to_response_model(Person)
+    assert to_response_model(Person) is response_model
+    assert issubclass(response_model, Person)
+    assert to_partial_response_model(Person) is to_partial_response_model(Person)
+    assert output_class_schema(Person) is output_class_schema(Person)
+
+
+def test_frozen_schema_matches_and_is_copied():
+    response_model = to_response_model(Person)
+    schema = response_model.model_json_schema()
+    assert schema == Person.model_json_schema()
+
+    schema["properties"]["name"]["description"] = "edited"
+    assert "description" not in response_model.model_json_schema()["properties"]["name"]
+    assert response_model.openai_schema["name"] == "Person"
+
+    partial = to_partial_response_model(Person)
+    assert partial.model_json_schema()["title"] == "PartialPerson"
+
+
+def test_tool_selector_is_cached_per_tool_set():
+    selector = tools_to_tool_selector(tools=[Search, Calculator])
+    assert tools_to_tool_selector(tools=[Search, Calculator]) is selector
+    assert tools_to_tool_selector(tools=[Search]) is not selector
+
+    parsed = selector.model_validate({"tool_calls": [{"query": "x"}]})
+    assert isinstance(parsed.tool_calls[0], Search)
+
+
+def test_structured_client_is_cached_per_client_and_mode():
+    first, second = MockOpenAI().client(), MockOpenAI().client()
+    structured = get_structured_client(first, mode=instructor.Mode.MD_JSON)
+    assert get_structured_client(first, mode=instructor.Mode.MD_JSON) is structured
+    assert get_structured_client(first, mode=instructor.Mode.JSON) is not structured
+    assert get_structured_client(second, mode=instructor.Mode.MD_JSON) is not structured
+
+
+async def test_structured_extraction_uses_precomputed_schema():
+    reply = '```json\n{"name": "Ada", "age": 36}\n```'
+    mock = MockOpenAI(reply=reply, chunk_size=3)
+    llm = LLM(client=mock.client(), model="test-model")
+
+    person = await llm.astructured_extraction_from_text("Ada, 36", output_class=Person)
+    assert (person.name, person.age) == ("Ada", 36)
+
+    stream = await llm.astream_structured_extraction_from_text(
+        "Ada, 36", output_class=Person
+    )
+    partials = [partial async for partial in stream]
+    assert (partials[-1].name, partials[-1].age) == ("Ada", 36)
+
+    # the prompts are the same as instructor builds from scratch
+    expected = [Person, instructor.Partial[Person]]
+    for request, output_class in zip(mock.requests, expected):
+        system = request["messages"][0]["content"]
+        assert json.dumps(output_class.model_json_schema(), indent=2) in system
+    assert mock.requests[1]["stream"] is True